@@ -1,6 +1,5 @@
 # this model requires tensorflow - you're on your own for that one
 import os
-import numpy as np
 import random
 import tensorflow as tf
 
@@ -24,40 +23,38 @@ import tensorflow as tf
 from pathlib import Path
 
 from model import create_model
+from pipeline import (
+    BATCH_SIZE,
+    ThroughputCallback,
+    pair_dataset,
+    shard_dataset,
+    split_shards,
+)
+from utils import MAX_STRING_LENGTH, encode_strings
 
-from datasets import load_from_disk
-
-
-def preprocess_string(s):
-    # Return the indices as-is without one-hot encoding
-    indices = np.array([ord(c) - ord("a") for c in s])
-    padded = np.zeros(
-        100
-    )  # MAX_STRING_LENGTH - tbh need to make dist_model a proper package or something idk
-    padded[: len(indices)] = indices
-    return padded.reshape(-1, 1)
+# Pairs scored on the fly are drawn from the word list when no shards were generated.
+STEPS_PER_EPOCH = 1000
 
 
 def main():
     root = Path(__file__).parent
     MODEL_FILE = root / "data/levendist.keras"
+    SHARDS = root / "data/ldist_wordlist_shards"
+    WORDS = root / "data/wordlist.10000"
 
     if input("Want to train? (y/n) ").lower() == "y":
-        # setup dataset
-        dataset = load_from_disk(root / "data/ldist_wordlist")
-        dataset = dataset.shuffle()
-        dataset = dataset.train_test_split(test_size=0.1)
-        dataset = dataset.with_format("tf")
-        # only use the first 1000 examples for now
-        dataset["train"] = dataset["train"].select(range(1000))
-        dataset["test"] = dataset["test"].select(range(1000))
-
-        x_train = dataset["train"]["string1"]
-        x2_train = dataset["train"]["string2"]
-        y_train = dataset["train"]["distance"]
-
-        x_test = dataset["test"]["string1"]
-        x2_test = dataset["test"]["string2"]
+        # setup dataset, streamed from the shards of levendist_dataset_gen.py so it never has to fit
+        # in memory, or scored on the fly from the word list if there are none
+        steps_per_epoch = None
+        if (SHARDS / "manifest.json").exists():
+            train_shards, test_shards = split_shards(SHARDS, test_size=0.1)
+            train = shard_dataset(SHARDS, train_shards, batch_size=BATCH_SIZE)
+            test = shard_dataset(SHARDS, test_shards, batch_size=BATCH_SIZE)
+        else:
+            words = WORDS.read_text().splitlines()
+            train = pair_dataset(words, batch_size=BATCH_SIZE)
+            test = pair_dataset(words, batch_size=BATCH_SIZE, seed=0).take(STEPS_PER_EPOCH // 10)
+            steps_per_epoch = STEPS_PER_EPOCH
 
         # Fit the model on the training dataset
         while True:
@@ -72,10 +69,10 @@ def main():
 
             try:
                 model.fit(
-                    [x_train, x2_train],
-                    y_train,
+                    train,
                     epochs=256,
-                    batch_size=32,
+                    steps_per_epoch=steps_per_epoch,
+                    callbacks=[ThroughputCallback(BATCH_SIZE)],
                 )
             except KeyboardInterrupt:
                 break
@@ -83,9 +80,7 @@ def main():
                 model.save(MODEL_FILE)
 
         # Evaluate the model on the testing dataset
-        loss = model.evaluate(
-            [x_test, x2_test],
-        )
+        loss = model.evaluate(test)
         print("Test loss:", loss)
     else:
         if not os.path.exists(MODEL_FILE):
@@ -100,16 +95,14 @@ def main():
             break
 
         w1, w2 = user_input.split(" ")
-        # w1, w2 = preprocess_string(w1), preprocess_string(w2)
-        w1_processed = preprocess_string(w1).reshape(
-            1, 100, 1
-        )  # Adding batch dimension
-        w2_processed = preprocess_string(w2).reshape(
-            1, 100, 1
-        )  # Adding batch dimension
-
-        ev = model.evaluate([w1_processed, w2_processed])
-        print("Predicted Levenshtein distance:", ev)
+        # one (2, MAX_STRING_LENGTH, 1) batch, the first row for each input
+        encoded = encode_strings([w1, w2])
+        if encoded.overflow:
+            print(f"Only the first {MAX_STRING_LENGTH} characters of each word are used.")
+        codes = encoded.codes[..., None]
+
+        prediction = model.predict([codes[:1], codes[1:]], verbose=0)
+        print("Predicted Levenshtein distance:", float(prediction[0, 0]))
 
 
 if __name__ == "__main__":
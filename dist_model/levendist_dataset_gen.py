@@ -1,53 +1,196 @@
-from editslist import Edit, EditsList
-import numpy as np
-import itertools
+"""Generate a dataset of word pairs and their Levenshtein distances.
+
+The pairs of `itertools.combinations(words, 2)` are numbered in order and cut into fixed size shards.
+Each shard is computed by a worker process and written to its own `shard-<n>.npz`, and the main
+process records every finished shard in `manifest.json`, so an interrupted run picks up where it left
+off and memory stays at a few shards no matter how many pairs are generated.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
+import os
 from pathlib import Path
-from datasets import Dataset
+from typing import Iterator, Optional
+
+import click
+import numpy as np
+
+from pyt.distance import batch_distance
+from utils import DTYPE, MAX_STRING_LENGTH, encode_strings
+
+
+SHARD_SIZE = 20_000
+
 
+def nth_pair(n_words: int, k: int) -> tuple[int, int]:
+    """The (i, j) word indexes of the k-th pair of itertools.combinations(range(n_words), 2)"""
+    i = 0
+    while k >= n_words - 1 - i:
+        k -= n_words - 1 - i
+        i += 1
+    return i, i + 1 + k
 
-MAX_STRING_LENGTH = 100
 
+def iter_pairs(words: list[str], start: int, stop: int) -> Iterator[tuple[str, str]]:
+    """Yield the pairs numbered start to stop, without walking the ones before start"""
+    if start >= stop:
+        return
+    i, j = nth_pair(len(words), start)
+    for _ in range(stop - start):
+        yield words[i], words[j]
+        j += 1
+        if j == len(words):
+            i += 1
+            j = i + 1
 
-def preprocess_string(s):
-    # Return the indices as-is without one-hot encoding
-    indices = np.array([ord(c) - ord("a") for c in s])
-    padded = np.zeros(MAX_STRING_LENGTH)
-    padded[: len(indices)] = indices
-    return padded.reshape(-1, 1)
+
+_words: list[str] = []
+
+
+def _init_worker(words: list[str]):
+    global _words
+    _words = words
+
+
+def write_shard(out: Path, index: int, start: int, stop: int) -> dict:
+    """Compute and save the shard of pairs start to stop, returning its manifest entry"""
+    pairs = list(iter_pairs(_words, start, stop))
+    distances = batch_distance(pairs)
+    first = encode_strings([s1 for s1, _ in pairs])
+    second = encode_strings([s2 for _, s2 in pairs])
+
+    file = out / f"shard-{index:05}.npz"
+    tmp = file.with_name(file.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez(
+            f,
+            string1=first.codes[..., None],
+            string2=second.codes[..., None],
+            distance=np.array(distances, dtype=np.int32),
+        )
+    os.replace(tmp, file)
+    return {
+        "index": index,
+        "file": file.name,
+        "start": start,
+        "stop": stop,
+        "truncated": first.overflow + second.overflow,
+    }
 
 
-# we can use s1, s2, EditsList.compute(s1, s2) to create a dataset to fit
+def load_manifest(out: Path) -> Optional[dict]:
+    manifest_path = out / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, "r") as file:
+        return json.load(file)
 
-# List of words to use for generating the dataset
-with Path("../data/wordlist.10000").open("r") as file:
-    words = file.read().splitlines()
 
+def save_manifest(out: Path, manifest: dict):
+    manifest_path = out / "manifest.json"
+    tmp = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp, manifest_path)
 
-# Generate a dataset of pairs of words and their corresponding Levenshtein distances
-dataset = []
-for s1, s2 in itertools.combinations(words, 2):
-    dataset.append(
-        {
-            "string1": preprocess_string(s1),
-            "string2": preprocess_string(s2),
-            "distance": EditsList.compute(s1, s2).distance,
-        }
-    )
-    if len(dataset) % 100000 == 0:
-        print(len(dataset))
 
-    if len(dataset) >= 1000000:
-        break
+def generate(
+    words: list[str],
+    out: Path,
+    total: int = 1_000_000,
+    shard_size: int = SHARD_SIZE,
+    jobs: Optional[int] = None,
+) -> dict:
+    """Generate the first total pairs of words into shards under out, skipping the ones already there.
 
-# Convert it to a Hugging Face Dataset
-hf_dataset = Dataset.from_dict(
-    {
-        "string1": [x["string1"] for x in dataset],
-        "string2": [x["string2"] for x in dataset],
-        "distance": [x["distance"] for x in dataset],
+    Returns:
+        dict: The manifest, listing the parameters of the run and every finished shard.
+    """
+    out.mkdir(parents=True, exist_ok=True)
+    total = min(total, len(words) * (len(words) - 1) // 2)
+    params = {
+        "words_sha": hashlib.sha256("\n".join(words).encode()).hexdigest(),
+        "total": total,
+        "shard_size": shard_size,
+        "max_string_length": MAX_STRING_LENGTH,
+        "dtype": np.dtype(DTYPE).name,
     }
+
+    manifest = load_manifest(out)
+    if manifest is None:
+        manifest = {**params, "shards": {}}
+    elif {k: manifest.get(k) for k in params} != params:
+        raise click.ClickException(
+            f"{out} holds shards generated with other parameters, remove it to start over"
+        )
+
+    todo = [
+        (index, start, min(start + shard_size, total))
+        for index, start in enumerate(range(0, total, shard_size))
+        if str(index) not in manifest["shards"]
+    ]
+    print(f"{len(manifest['shards'])} shards done, {len(todo)} to go")
+
+    with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(words,)) as pool:
+        futures = [pool.submit(write_shard, out, *shard) for shard in todo]
+        for future in as_completed(futures):
+            entry = future.result()
+            manifest["shards"][str(entry["index"])] = entry
+            save_manifest(out, manifest)
+            print(f"shard {entry['index']}: pairs {entry['start']} to {entry['stop']}")
+
+    truncated = sum(entry["truncated"] for entry in manifest["shards"].values())
+    if truncated:
+        print(f"{truncated} strings were truncated to {MAX_STRING_LENGTH} characters")
+    return manifest
+
+
+def iter_examples(out: Path) -> Iterator[dict]:
+    """Yield the examples of every shard in order, loading one shard at a time"""
+    manifest = load_manifest(out)
+    for index in sorted(manifest["shards"], key=int):
+        with np.load(out / manifest["shards"][index]["file"]) as shard:
+            for string1, string2, distance in zip(
+                shard["string1"], shard["string2"], shard["distance"]
+            ):
+                yield {"string1": string1, "string2": string2, "distance": int(distance)}
+
+
+@click.command()
+@click.option(
+    "--words",
+    "words_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=Path("../data/wordlist.10000"),
+    help="List of words to use for generating the dataset, one per line",
+)
+@click.option(
+    "--out",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=Path("../data/ldist_wordlist_shards"),
+    help="Folder of the shards and their manifest",
 )
+@click.option("--total", default=1_000_000, help="Number of pairs to generate")
+@click.option("--shard-size", default=SHARD_SIZE, help="Number of pairs per shard")
+@click.option("--jobs", "-j", type=int, default=None, help="Worker processes, defaults to the cpu count")
+@click.option(
+    "--hf-dataset",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=Path("../data/ldist_wordlist"),
+    help="Where to save the shards as a Hugging Face Dataset, for use with load_from_disk()",
+)
+def main(words_file, out, total, shard_size, jobs, hf_dataset):
+    with words_file.open("r") as file:
+        words = file.read().splitlines()
+
+    generate(words, out, total=total, shard_size=shard_size, jobs=jobs)
+
+    # from_generator writes the arrow file as it goes, so the shards are never all in memory
+    # cannot use Dataset.save_to_disk on a DatasetDict, it has to be a plain Dataset
+    from datasets import Dataset
+
+    Dataset.from_generator(iter_examples, gen_kwargs={"out": out}).save_to_disk(hf_dataset)
+
 
-# Save the dataset to disk for usave with load_dataset()
-# cannot use Dataset.save_to_disk as it laods a DatasetDict
-hf_dataset.save_to_disk("../data/ldist_wordlist")
+if __name__ == "__main__":
+    main()
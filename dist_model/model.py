@@ -18,7 +18,7 @@ from tensorflow.keras.layers import (
 )
 from tensorflow.keras.models import Model
 
-MAX_STRING_LENGTH = 100  # Just a placeholder; set it to your value
+from utils import MAX_STRING_LENGTH
 
 
 def create_model():
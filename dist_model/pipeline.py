@@ -0,0 +1,156 @@
+"""Streaming `tf.data` input pipelines for training the distance model.
+
+`shard_dataset` reads the shards written by `levendist_dataset_gen.py` a few at a time, interleaving
+them and shuffling rows through a bounded buffer, so memory stays flat whatever the size of the
+dataset. `pair_dataset` skips the dataset altogether and scores random word pairs on the fly, an
+endless stream of fresh examples.
+
+Both yield `((string1, string2), distance)` batches ready for `model.fit`, prefetched so the next
+batch is prepared while the model trains on the current one. `ThroughputCallback` reports how fast
+that is per epoch and how long the model sat waiting for input.
+"""
+from pathlib import Path
+import time
+from typing import Optional, Union
+
+import numpy as np
+import tensorflow as tf
+
+from levendist_dataset_gen import load_manifest
+from pyt.distance import batch_distance
+from utils import DTYPE, MAX_STRING_LENGTH, encode_strings
+
+BATCH_SIZE = 32
+SHUFFLE_BUFFER = 65_536
+# Shards read at once, rows from them are interleaved before the shuffle buffer.
+CYCLE_LENGTH = 4
+
+_STRINGS = tf.TensorSpec((None, MAX_STRING_LENGTH, 1), tf.as_dtype(DTYPE))
+_DISTANCES = tf.TensorSpec((None,), tf.int32)
+
+
+def split_shards(out: Path, test_size: float = 0.1) -> tuple[list[str], list[str]]:
+    """Split the shards of out into train and test ones, the last test_size of them for testing.
+
+    Whole shards are held out, so no pair is ever in both.
+    """
+    shards = sorted(load_manifest(out)["shards"], key=int)
+    n_test = max(1, round(len(shards) * test_size)) if len(shards) > 1 else 0
+    return shards[: len(shards) - n_test], shards[len(shards) - n_test :]
+
+
+def _read_shard(file: bytes):
+    with np.load(file.decode()) as shard:
+        yield shard["string1"], shard["string2"], shard["distance"]
+
+
+def _to_example(string1, string2, distance):
+    return (string1, string2), distance
+
+
+def shard_dataset(
+    out: Path,
+    shards: list[str],
+    batch_size: int = BATCH_SIZE,
+    shuffle_buffer: int = SHUFFLE_BUFFER,
+    cache: Optional[Union[str, Path]] = None,
+    seed: Optional[int] = None,
+) -> tf.data.Dataset:
+    """Stream the given shards of out as shuffled batches.
+
+    Shards are visited in a new order every epoch and CYCLE_LENGTH of them are read in parallel, so
+    at most that many are in memory besides the shuffle buffer.
+
+    Args:
+        cache (str | Path, optional): Cache the decoded rows in this file on the first epoch and
+            read them from it afterwards. The order shards are visited in is then fixed, though
+            rows are still shuffled through the buffer.
+    """
+    manifest = load_manifest(out)
+    files = [str(out / manifest["shards"][index]["file"]) for index in shards]
+
+    dataset = tf.data.Dataset.from_tensor_slices(files)
+    if cache is None:
+        dataset = dataset.shuffle(len(files), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.interleave(
+        lambda file: tf.data.Dataset.from_generator(
+            _read_shard,
+            args=(file,),
+            output_signature=(_STRINGS, _STRINGS, _DISTANCES),
+        ).unbatch(),
+        cycle_length=CYCLE_LENGTH,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=False,
+    )
+    if cache is not None:
+        dataset = dataset.cache(str(cache))
+    return (
+        dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+        .batch(batch_size)
+        .map(_to_example, num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+def pair_dataset(
+    words: list[str], batch_size: int = BATCH_SIZE, seed: Optional[int] = None
+) -> tf.data.Dataset:
+    """An endless stream of batches of random word pairs, scored as they are drawn.
+
+    Give `model.fit` a steps_per_epoch, there is no end to the epoch otherwise.
+    """
+
+    def batches():
+        rng = np.random.default_rng(seed)
+        while True:
+            first, second = rng.integers(len(words), size=(2, batch_size))
+            strings1 = [words[i] for i in first]
+            strings2 = [words[j] for j in second]
+            distances = batch_distance(list(zip(strings1, strings2)))
+            yield (
+                encode_strings(strings1).codes[..., None],
+                encode_strings(strings2).codes[..., None],
+                np.array(distances, dtype=np.int32),
+            )
+
+    return (
+        tf.data.Dataset.from_generator(batches, output_signature=(_STRINGS, _STRINGS, _DISTANCES))
+        .map(_to_example, num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """Report samples per second and input pipeline stall time every epoch.
+
+    The stall is the time between the end of one training step and the start of the next, which is
+    spent waiting for the next batch. It is added to the epoch's logs as `input_stall` (seconds)
+    along with `samples_per_sec`, so it also ends up in History and TensorBoard.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        super().__init__()
+        self.batch_size = batch_size
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.samples = 0
+        self.stall = 0.0
+        self.started = self._step_ended = time.perf_counter()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.stall += time.perf_counter() - self._step_ended
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.samples += self.batch_size
+        self._step_ended = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self.started
+        samples_per_sec = self.samples / elapsed if elapsed else 0.0
+        if logs is not None:
+            logs["samples_per_sec"] = samples_per_sec
+            logs["input_stall"] = self.stall
+        print(
+            f"epoch {epoch + 1}: {samples_per_sec:.0f} samples/s, "
+            f"waited {self.stall:.2f}s ({self.stall / elapsed if elapsed else 0.0:.1%}) for input"
+        )
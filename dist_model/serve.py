@@ -0,0 +1,273 @@
+"""Serve the Levenshtein distance model as a JSON lines service, over stdin/stdout or a Unix socket.
+
+Every line is a request, `{"id": 1, "a": "kitten", "b": "sitting"}`, answered by a line with the same
+id and the predicted `distance`, in the order the requests came in. `{"stats": true}` is answered with
+the batching counters instead.
+
+The model is loaded and warmed up once, then requests from every client are coalesced into micro
+batches: a batch is sent to `predict` as soon as it is full or its oldest request has waited
+max_latency. Batches are padded to a power of two rows, so there are only a handful of input shapes
+and the model is never traced again after warming up.
+"""
+from collections import deque
+from concurrent.futures import Future
+import io
+import json
+import os
+from pathlib import Path
+import queue
+import socketserver
+import sys
+import threading
+import time
+from typing import Callable, Optional, TextIO
+
+import click
+import numpy as np
+
+from utils import MAX_STRING_LENGTH, encode_strings
+
+MODEL_FILE = Path(__file__).parent / "data/levendist.keras"
+MAX_BATCH = 256
+MAX_LATENCY = 0.005
+
+
+class MicroBatcher:
+    """Coalesces distance requests from any number of threads into batches for one predict function.
+
+    predict is called on a single worker thread with `[string1, string2]`, two (rows,
+    MAX_STRING_LENGTH, 1) matrices, and returns one prediction per row.
+    """
+
+    def __init__(
+        self,
+        predict: Callable[[list[np.ndarray]], np.ndarray],
+        max_batch: int = MAX_BATCH,
+        max_latency: float = MAX_LATENCY,
+        log: Optional[TextIO] = sys.stderr,
+    ):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.log = log
+        self.requests = queue.Queue()
+        # the encoded pairs are copied into these, every batch reuses the same two matrices
+        self._buffers = [np.zeros((max_batch, MAX_STRING_LENGTH), dtype=np.int16) for _ in range(2)]
+
+        self.batches = 0
+        self.pairs = 0
+        self.truncated = 0
+        self.busy = 0.0
+        self._stats_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, a: str, b: str) -> Future:
+        """Queue a pair, the future resolves to its predicted distance.
+
+        The pair is encoded right away, so a string that can't be fails its own future rather than
+        the batch it would have joined.
+        """
+        future = Future()
+        try:
+            encoded = encode_strings([a, b])
+        except ValueError as e:
+            future.set_exception(e)
+            return future
+        self.requests.put((encoded.codes, encoded.overflow, future))
+        return future
+
+    def bucket(self, n: int) -> int:
+        """The padded size of a batch of n pairs"""
+        return min(1 << max(n - 1, 0).bit_length(), self.max_batch)
+
+    def warm_up(self):
+        """Run predict once per batch size, so no request pays for tracing the model"""
+        size = 1
+        while True:
+            self.predict([np.zeros((size, MAX_STRING_LENGTH, 1), dtype=np.int16)] * 2)
+            if size >= self.max_batch:
+                break
+            size = self.bucket(size + 1)
+
+    def _collect(self) -> list:
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                size = self.bucket(len(batch))
+                for row, (codes, _, _) in enumerate(batch):
+                    self._buffers[0][row] = codes[0]
+                    self._buffers[1][row] = codes[1]
+                # rows past the batch are zeros, padding it up to its bucket
+                self._buffers[0][len(batch) : size] = 0
+                self._buffers[1][len(batch) : size] = 0
+                inputs = [buffer[:size, :, None] for buffer in self._buffers]
+                predictions = np.asarray(self.predict(inputs)).reshape(size, -1)[:, 0]
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, _, future), prediction in zip(batch, predictions.tolist()):
+                future.set_result(prediction)
+
+            elapsed = time.perf_counter() - started
+            with self._stats_lock:
+                self.batches += 1
+                self.pairs += len(batch)
+                self.truncated += sum(overflow for _, overflow, _ in batch)
+                self.busy += elapsed
+            if self.log is not None:
+                print(
+                    f"batch of {len(batch)} (padded to {size}) in {elapsed * 1000:.2f}ms, "
+                    f"{len(batch) / elapsed:.0f} pairs/s",
+                    file=self.log,
+                )
+
+    @property
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "pairs": self.pairs,
+                "truncated": self.truncated,
+                "mean_batch": self.pairs / self.batches if self.batches else 0.0,
+                "mean_latency_ms": self.busy / self.batches * 1000 if self.batches else 0.0,
+                "pairs_per_second": self.pairs / self.busy if self.busy else 0.0,
+            }
+
+
+def serve_lines(batcher: MicroBatcher, infile: TextIO, outfile: TextIO):
+    """Answer the JSON line requests of infile on outfile, in order, until infile ends.
+
+    Requests are submitted as soon as they are read, so a client that writes many lines before
+    reading any gets them batched together.
+    """
+    pending = deque()
+    available = threading.Semaphore(0)
+    done = object()
+
+    def write():
+        while True:
+            available.acquire()
+            request_id, answer = pending.popleft()
+            if answer is done:
+                return
+            if isinstance(answer, Future):
+                try:
+                    response = {"id": request_id, "distance": answer.result()}
+                except Exception as e:
+                    response = {"id": request_id, "error": str(e)}
+            elif answer is None:
+                response = {"id": request_id, **batcher.stats}
+            else:
+                response = {"id": request_id, **answer}
+            outfile.write(json.dumps(response) + "\n")
+            outfile.flush()
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+
+    for line in infile:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if request.get("stats"):
+                # taken once the requests before it are answered, so they are counted
+                answer = None
+            else:
+                answer = batcher.submit(str(request["a"]), str(request["b"]))
+        except (ValueError, KeyError, AttributeError) as e:
+            request, answer = {}, {"error": f"Bad request: {e}"}
+        pending.append((request.get("id"), answer))
+        available.release()
+
+    pending.append((None, done))
+    available.release()
+    writer.join()
+
+
+def load_predict(model_file: Path) -> Callable[[list[np.ndarray]], np.ndarray]:
+    """Load the model once, returning its predict function"""
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_file)
+    # predict_on_batch is predict without the per call dataset and callback setup
+    return model.predict_on_batch
+
+
+@click.command()
+@click.option(
+    "--model",
+    "model_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=MODEL_FILE,
+    help="The trained .keras model",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Listen on this Unix socket instead of stdin",
+)
+@click.option("--max-batch", default=MAX_BATCH, help="Most pairs per predict call")
+@click.option(
+    "--max-latency-ms",
+    default=MAX_LATENCY * 1000,
+    help="Longest a request waits for its batch to fill",
+)
+@click.option("--quiet", is_flag=True, help="Don't log every batch to stderr")
+def main(model_file, socket_path, max_batch, max_latency_ms, quiet):
+    batcher = MicroBatcher(
+        load_predict(model_file),
+        max_batch=max_batch,
+        max_latency=max_latency_ms / 1000,
+        log=None if quiet else sys.stderr,
+    )
+    batcher.warm_up()
+    print(f"Model loaded from {model_file}", file=sys.stderr)
+
+    if socket_path is None:
+        serve_lines(batcher, sys.stdin, sys.stdout)
+        print(json.dumps(batcher.stats), file=sys.stderr)
+        return
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            infile = io.TextIOWrapper(self.rfile, encoding="utf-8")
+            outfile = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+            serve_lines(batcher, infile, outfile)
+
+    if socket_path.exists():
+        os.unlink(socket_path)
+    with socketserver.ThreadingUnixStreamServer(str(socket_path), Handler) as server:
+        # don't wait for connected clients to hang up when shutting down
+        server.daemon_threads = True
+        print(f"Listening on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+            print(json.dumps(batcher.stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
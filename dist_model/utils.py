@@ -0,0 +1,75 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+MAX_STRING_LENGTH = 100
+# Characters are stored as their offset from "a", so "a" is 0 like the padding and "A" is -32.
+OFFSET = ord("a")
+DTYPE = np.int16
+
+
+class EncodedStrings(NamedTuple):
+    """A batch of encoded strings, along with which of them had to be cut to fit"""
+
+    codes: np.ndarray
+    lengths: np.ndarray
+    truncated: np.ndarray
+
+    @property
+    def overflow(self) -> int:
+        """How many strings were longer than a row and were truncated"""
+        return len(self.truncated)
+
+
+def encode_strings(
+    strings: list[str],
+    max_length: int = MAX_STRING_LENGTH,
+    out: Optional[np.ndarray] = None,
+    truncate: bool = True,
+) -> EncodedStrings:
+    """Encode strings into one zero padded (len(strings), max_length) matrix of character offsets.
+
+    All the strings are encoded as a single utf-32 buffer and scattered into their rows at once, so
+    there is no per string allocation. Pass out, a preallocated matrix with at least len(strings)
+    rows, to reuse it across batches.
+
+    Args:
+        truncate (bool): Cut strings longer than max_length, listing them in `truncated`, rather
+            than raising a ValueError.
+
+    Raises:
+        ValueError: If a string is too long and truncate isn't set, or a character's offset doesn't
+            fit in DTYPE.
+    """
+    n = len(strings)
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=n)
+    truncated = np.flatnonzero(lengths > max_length)
+    if len(truncated) and not truncate:
+        raise ValueError(
+            f"{len(truncated)} strings are longer than {max_length} characters, "
+            f"the first is {strings[truncated[0]]!r}"
+        )
+
+    if out is None:
+        out = np.zeros((n, max_length), dtype=DTYPE)
+    else:
+        out = out[:n]
+        out.fill(0)
+
+    flat = np.frombuffer("".join(strings).encode("utf-32-le"), dtype=np.uint32)
+
+    # character k of the concatenation belongs to row rows[k], at column k - starts[rows[k]]
+    rows = np.repeat(np.arange(n), lengths)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    keep = cols < max_length
+    # only the characters kept have to fit, not the ones truncation drops
+    kept = flat[keep]
+    codes = kept.astype(np.int64) - OFFSET
+    info = np.iinfo(out.dtype)
+    if len(codes) and (codes.min() < info.min or codes.max() > info.max):
+        bad = kept[(codes < info.min) | (codes > info.max)][0]
+        raise ValueError(f"{chr(bad)!r} can't be encoded as {out.dtype}")
+
+    out[rows[keep], cols[keep]] = codes
+
+    return EncodedStrings(out, np.minimum(lengths, max_length), truncated)
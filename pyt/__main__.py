@@ -1,9 +1,17 @@
 import click
+import cProfile
+from dataclasses import replace
 import json
-import hashlib
 from pathlib import Path
 
-from .editslist import EditsList
+from . import bench as _bench
+from . import compression, instrument
+from .objectstore import ObjectStore
+from .revfile import KeyframePolicy, Revision, cache_stats, repack_keyframes
+from .scan import scan_project
+from .tree import tree_store
+from .utilities import AmbiguousPrefixError
+from .watch import DEBOUNCE, MAX_DELAY, Watcher
 
 
 # hierarcharcl click usage:
@@ -11,8 +19,45 @@ from .editslist import EditsList
 # 2. add commands to the group
 # 3. add the group to the main function
 @click.group()
-def project():
-    pass
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Time hashing, deltas and object reads and writes, printing a summary to stderr. Same as PYT_PROFILE=1.",
+)
+@click.option(
+    "--trace",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Also write every timed span to this file as Chrome trace event JSON.",
+)
+@click.option(
+    "--cprofile",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Run the command under cProfile and save its stats to this file.",
+)
+@click.pass_context
+def project(ctx, profile=False, trace=None, cprofile=None):
+    if profile or trace is not None:
+        instrument.enable(trace=trace is not None)
+    if cprofile is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def dump_cprofile():
+            profiler.disable()
+            profiler.dump_stats(cprofile)
+
+        ctx.call_on_close(dump_cprofile)
+
+    if instrument.enabled:
+
+        def report():
+            instrument.report()
+            if trace is not None:
+                instrument.dump_trace(trace)
+
+        ctx.call_on_close(report)
 
 
 def is_project_dir(path: Path) -> bool:
@@ -40,75 +85,223 @@ def new(name):
 
 @project.command()
 @click.argument("name", required=False)
-def scan(name=None):
-    """If the current directory is a project directory, scan it for files and folders and create a .pyt/manifest.json file"""
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=None,
+    help="Threads hashing files and processes computing deltas, defaults to the cpu count.",
+)
+@click.option(
+    "--plan",
+    is_flag=True,
+    help="Pick an exact delta, a coarse one or a snapshot by how similar each file's versions are, logging the choices to .pyt/plans.jsonl.",
+)
+def scan(name=None, jobs=None, plan=False):
+    """If the current directory is a project directory, scan it for files and record a revision of every changed one in .pyt"""
     if name is not None:
         path = Path.cwd() / name
     else:
         path = Path.cwd()
 
     if is_project_dir(path):
-        # create a manifest dict to write to file
-        new_manifest_files = {}
+        print("Scanning project directory...")
+        scan_project(path, jobs=jobs, plan=plan)
+        print("Done.")
 
-        # this list will contain all the delta packs, which are the deltas used to reconstruct the files from the previous version
-        # Each file is indexed by it's sha here, and it contains all the diffs from the previous version
-        delta_packs = {}
 
-        print("Scanning project directory...")
-        files = [str(f.relative_to(path)) for f in path.glob("**/*") if f.is_file()]
-        files.sort()
-
-        new_files = {}
-        for f in files:
-            with open(path / f, "rb") as file:
-                new_files[path] = hashlib.sha256(file.read()).hexdigest()
-
-        # if the manifest file already exists, diff it and update the chaindiff
-        manifest_path = path / ".pyt/manifest.json"
-        changed_files = []
-        if manifest_path.exists():
-            with open(manifest_path, "r") as file:
-                old_manifest_files = json.load(file)
-
-            # diff all sha256s and sum the changed sha256s only to get the new chaindiff
-            for p, sha in new_files.items():
-                if p in old_manifest_files:
-                    if sha != old_manifest_files[p]:
-                        changed_files.append(p)
-                else:
-                    changed_files.append(p)
-
-        # now that we have the changed files, we can diff them and create the delta packs
-        for p in new_files:
-            if p.is_file():
-                with open(p, "rb") as file:
-                    new_file = file.read()
-
-                if p in old_manifest_files:
-                    with open(p, "rb") as file:
-                        old_file = file.read()
-
-                    # calculate the levenshtein distance between the two files and save the transformations needed to get from the old file to the new file, rather than just the distance
-                    # this is done to allow for the reconstruction of the file from the previous version
-                    edits = leven_edits(old_file, new_file)
-                    delta_packs[p] = edits
-                else:
-                    delta_packs[p] = leven_edits(b"", new_file)
-            else:
-                continue
-
-        # now that we have the delta packs, we can write them to the sha256 files in the .pyt folder
-        # These files will be indexable by manifests built at each version, and will allow for the reconstruction of the files from the previous version
-        for p, edits in delta_packs.items():
-            with open(path / ".pyt" / f"{new_files[p]}.json", "w") as file:
-                json.dump(edits, file)
-
-        # now lets write the new manifest file
-        with open(manifest_path, "w") as file:
-            json.dump(new_files, file)
+@project.command()
+@click.argument("sha")
+@click.argument("name", required=False)
+def show(sha, name=None):
+    """Print the content of the project's revision SHA, which can be shortened to any unambiguous prefix"""
+    if name is not None:
+        path = Path.cwd() / name
+    else:
+        path = Path.cwd()
 
-        print("Done.")
+    if is_project_dir(path):
+        try:
+            revision = Revision.resolve(path / ".pyt", sha.lower())
+        except KeyError:
+            raise click.ClickException(f"No revision matches {sha}")
+        except AmbiguousPrefixError as e:
+            raise click.ClickException(str(e))
+        content = revision.revert()
+        if isinstance(content, bytes):
+            click.get_binary_stream("stdout").write(content)
+        else:
+            click.echo(content, nl=False)
+
+
+@project.command()
+@click.argument("name", required=False)
+@click.option(
+    "--all", "all_packs", is_flag=True, help="Also fold the existing packs into the new one."
+)
+def repack(name=None, all_packs=False):
+    """Fold the loose objects in the project's .pyt folder into a pack"""
+    if name is not None:
+        path = Path.cwd() / name
+    else:
+        path = Path.cwd()
+
+    if is_project_dir(path):
+        idx_path = ObjectStore.open(path / ".pyt").repack(all_packs=all_packs)
+        tree_store(path / ".pyt").repack(all_packs=all_packs)
+        if idx_path is None:
+            print("Nothing to repack.")
+        else:
+            print(f"Wrote {idx_path.with_suffix('.pack').name}.")
+
+
+@project.command()
+@click.argument("name", required=False)
+@click.option(
+    "--codec",
+    type=click.Choice(compression.available_codecs()),
+    default=compression.DEFAULT_CODEC,
+    show_default=True,
+    help="Codec every object is compressed with.",
+)
+@click.option("--level", type=int, default=None, help="Compression level, the codec's default if not set.")
+@click.option(
+    "--dictionary/--no-dictionary",
+    default=False,
+    help="Train a dictionary from the project's own objects and compress with it.",
+)
+def compress(name=None, codec=None, level=None, dictionary=False):
+    """Compress the objects in the project's .pyt folder with CODEC, rewriting the ones already stored"""
+    if name is not None:
+        path = Path.cwd() / name
+    else:
+        path = Path.cwd()
+
+    if is_project_dir(path):
+        for store in (ObjectStore.open(path / ".pyt"), tree_store(path / ".pyt")):
+            store.configure_compression(codec, level)
+            if dictionary:
+                store.configure_compression(codec, level, store.train_dictionary())
+            store.repack(all_packs=True, recompress=True)
+        print(json.dumps(ObjectStore.open(path / ".pyt").stats(), indent=2))
+
+
+@project.command()
+@click.argument("name", required=False)
+def stats(name=None):
+    """Print the object counts and sizes by codec of the project's .pyt folder, and the cache counters"""
+    if name is not None:
+        path = Path.cwd() / name
+    else:
+        path = Path.cwd()
+
+    if is_project_dir(path):
+        print(
+            json.dumps(
+                {
+                    "objects": ObjectStore.open(path / ".pyt").stats(),
+                    "trees": tree_store(path / ".pyt").stats(),
+                    "caches": cache_stats(),
+                },
+                indent=2,
+            )
+        )
+
+
+@project.command()
+@click.argument("name", required=False)
+@click.option(
+    "--interval",
+    default=KeyframePolicy.interval,
+    show_default=True,
+    help="Store a full snapshot every INTERVAL revisions.",
+)
+@click.option(
+    "--max-chain-size",
+    default=KeyframePolicy.max_chain_size,
+    show_default=True,
+    help="Store a full snapshot once this many delta bytes pile up since the last one.",
+)
+def keyframes(name=None, interval=None, max_chain_size=None):
+    """Repack the revision chains in the project's .pyt folder so revert never replays more than INTERVAL deltas"""
+    if name is not None:
+        path = Path.cwd() / name
+    else:
+        path = Path.cwd()
+
+    if is_project_dir(path):
+        policy = KeyframePolicy(interval=interval, max_chain_size=max_chain_size)
+        rewritten = repack_keyframes(path / ".pyt", policy)
+        print(f"Rewrote {len(rewritten)} revision(s).")
+
+
+@project.command()
+@click.argument("name", required=False)
+@click.option(
+    "--debounce-ms",
+    type=int,
+    default=int(DEBOUNCE * 1000),
+    show_default=True,
+    help="Record changes once no file changed for this long.",
+)
+@click.option(
+    "--max-delay-ms",
+    type=int,
+    default=int(MAX_DELAY * 1000),
+    show_default=True,
+    help="Record changes this long after the first one at the latest, even if files keep changing.",
+)
+def watch(name=None, debounce_ms=None, max_delay_ms=None):
+    """Record a revision of every file of the project as it changes, until interrupted"""
+    if name is not None:
+        path = Path.cwd() / name
+    else:
+        path = Path.cwd()
+
+    if is_project_dir(path):
+        try:
+            watcher = Watcher(path, debounce=debounce_ms / 1000, max_delay=max_delay_ms / 1000)
+        except OSError as e:
+            raise click.ClickException(f"Can't watch {path}: {e}")
+        try:
+            watcher.start()
+            print(f"Watching {path}, press Ctrl+C to stop.")
+            watcher.run()
+        except KeyboardInterrupt:
+            recorded = watcher.flush()
+            if recorded:
+                print(f"Recorded {len(recorded)} file(s).")
+        finally:
+            watcher.close()
+
+
+@project.command()
+@click.option("--quick", is_flag=True, help="Run over a smaller corpus, in seconds rather than minutes.")
+@click.option("--repeat", type=int, default=None, help="Runs per timing, the best, median and mean are kept.")
+@click.option(
+    "--only",
+    multiple=True,
+    type=click.Choice(list(_bench.BENCHMARKS)),
+    help="Only run this benchmark, can be given more than once.",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Write the JSON results to this file instead of stdout.",
+)
+def bench(quick=False, repeat=None, only=(), output=None):
+    """Time diffing, applying, reverting and scanning on a synthetic corpus, printing the results as JSON"""
+    config = _bench.QUICK if quick else _bench.BenchConfig()
+    if repeat is not None:
+        config = replace(config, repeat=repeat)
+
+    results = json.dumps(_bench.run(config, only=list(only)), indent=2)
+    if output is None:
+        print(results)
+    else:
+        output.write_text(results + "\n")
 
 
 def main():
@@ -0,0 +1,240 @@
+"""Benchmarks of diffing, applying, reverting and scanning, on a synthetic corpus.
+
+`pyt bench` runs them and prints, or writes, one JSON document with the commit, the platform and a
+result per benchmark and parameter set, so runs on different commits can be compared. Every
+timing is the best, median and mean of repeat runs, in seconds.
+"""
+from dataclasses import asdict, dataclass, field
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from . import revfile
+from .editslist import EditsList
+from .objectstore import ObjectStore
+from .revfile import KeyframePolicy, Revision
+from .scan import scan_project
+
+_WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+@dataclass
+class BenchConfig:
+    """The corpus sizes each benchmark is run over"""
+
+    file_sizes: list[int] = field(default_factory=lambda: [1_000, 10_000, 100_000])
+    edit_counts: list[int] = field(default_factory=lambda: [1, 10, 100])
+    chain_depths: list[int] = field(default_factory=lambda: [10, 100, 500])
+    tree_files: list[int] = field(default_factory=lambda: [100, 1_000])
+    tree_file_size: int = 2_000
+    repeat: int = 5
+    seed: int = 0
+
+
+QUICK = BenchConfig(
+    file_sizes=[1_000, 10_000],
+    edit_counts=[1, 10],
+    chain_depths=[10, 50],
+    tree_files=[50],
+    tree_file_size=1_000,
+    repeat=3,
+)
+
+
+def synthetic_text(rng: random.Random, size: int) -> str:
+    """Lines of random words, about size characters long"""
+    lines = []
+    total = 0
+    while total < size:
+        line = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 12))) + "\n"
+        lines.append(line)
+        total += len(line)
+    return "".join(lines)[:size]
+
+
+def mutate(rng: random.Random, text: str, edits: int, span: int = 8) -> str:
+    """Apply edits random inserts, deletes and replacements of up to span characters to text"""
+    chars = list(text)
+    for _ in range(edits):
+        at = rng.randint(0, len(chars))
+        op = rng.choice(("insert", "delete", "replace"))
+        new = list(synthetic_text(rng, rng.randint(1, span)))
+        if op == "insert":
+            chars[at:at] = new
+        elif op == "delete":
+            del chars[at : at + rng.randint(1, span)]
+        else:
+            chars[at : at + len(new)] = new
+    return "".join(chars)
+
+
+def synthetic_tree(root: Path, rng: random.Random, files: int, size: int) -> list[Path]:
+    """Write files text files of about size characters, spread over nested folders"""
+    paths = []
+    for i in range(files):
+        path = root / f"dir{i % 10}" / f"sub{i % 7}" / f"file{i}.txt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(synthetic_text(rng, size))
+        paths.append(path)
+    return paths
+
+
+def timeit(fn: Callable[[], object], repeat: int, setup: Optional[Callable[[], object]] = None) -> dict:
+    """Time fn repeat times, calling setup untimed before every run"""
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return {"min": min(runs), "median": statistics.median(runs), "mean": statistics.fmean(runs)}
+
+
+def _clear_caches():
+    revfile.content_cache.clear()
+    revfile.revision_cache.clear()
+
+
+def bench_compute_apply(config: BenchConfig) -> list[dict]:
+    rng = random.Random(config.seed)
+    results = []
+    for size in config.file_sizes:
+        for edits in config.edit_counts:
+            s1 = synthetic_text(rng, size)
+            s2 = mutate(rng, s1, edits)
+            for granularity in ("char", "line"):
+                delta = EditsList.from_strings(s1, s2, granularity=granularity)
+                params = {"file_size": size, "edits": edits, "granularity": granularity}
+                results.append(
+                    {
+                        "name": "compute",
+                        "params": params,
+                        "seconds": timeit(
+                            lambda: EditsList.from_strings(s1, s2, granularity=granularity),
+                            config.repeat,
+                        ),
+                        "distance": delta.distance,
+                    }
+                )
+                results.append(
+                    {
+                        "name": "apply",
+                        "params": params,
+                        "seconds": timeit(lambda: delta.apply(s1), config.repeat),
+                    }
+                )
+    return results
+
+
+def bench_revert(config: BenchConfig, tmp: Path) -> list[dict]:
+    rng = random.Random(config.seed)
+    results = []
+    size = config.file_sizes[-1]
+    # no keyframes, so every revert replays the whole chain
+    policy = KeyframePolicy(interval=max(config.chain_depths) + 1, max_chain_size=1 << 62)
+    for depth in config.chain_depths:
+        root = tmp / f"revert-{depth}"
+        root.mkdir()
+        file = root / "file.txt"
+        content = synthetic_text(rng, size)
+        file.write_text(content)
+        revision = Revision.from_filename(file, root=root)
+        revision.save(root)
+        for _ in range(depth):
+            content = mutate(rng, content, 5)
+            file.write_text(content)
+            revision = revision.new(policy=policy)
+            revision.save(root)
+
+        last = root / revision.sha
+        results.append(
+            {
+                "name": "revert",
+                "params": {"file_size": size, "chain_depth": depth},
+                "seconds": timeit(lambda: Revision.load(last).revert(), config.repeat, setup=_clear_caches),
+            }
+        )
+        ObjectStore.open(root).close()
+    return results
+
+
+def bench_scan(config: BenchConfig, tmp: Path) -> list[dict]:
+    rng = random.Random(config.seed)
+    results = []
+    for files in config.tree_files:
+        project = tmp / f"scan-{files}"
+        (project / ".pyt").mkdir(parents=True)
+        paths = synthetic_tree(project, rng, files, config.tree_file_size)
+        params = {"files": files, "file_size": config.tree_file_size}
+
+        started = time.perf_counter()
+        scan_project(project)
+        results.append({"name": "scan_initial", "params": params, "seconds": time.perf_counter() - started})
+
+        results.append(
+            {
+                "name": "scan_unchanged",
+                "params": params,
+                "seconds": timeit(lambda: scan_project(project), config.repeat),
+            }
+        )
+
+        def touch_tenth():
+            for path in rng.sample(paths, max(1, files // 10)):
+                path.write_text(mutate(rng, path.read_text(), 3))
+
+        results.append(
+            {
+                "name": "scan_tenth_changed",
+                "params": params,
+                "seconds": timeit(lambda: scan_project(project), config.repeat, setup=touch_tenth),
+            }
+        )
+        ObjectStore.open(project / ".pyt").close()
+    return results
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+BENCHMARKS = {
+    "compute": lambda config, tmp: bench_compute_apply(config),
+    "revert": bench_revert,
+    "scan": bench_scan,
+}
+
+
+def run(config: BenchConfig, only: Optional[list[str]] = None) -> dict:
+    """Run the benchmarks, or only the named ones, returning the JSON document"""
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pyt-bench-") as tmp:
+        for name, bench in BENCHMARKS.items():
+            if only and name not in only:
+                continue
+            _clear_caches()
+            results.extend(bench(config, Path(tmp)))
+    _clear_caches()
+
+    return {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": asdict(config),
+        "results": results,
+    }
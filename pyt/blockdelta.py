@@ -0,0 +1,189 @@
+"""rsync style block deltas, for binary and large files.
+
+The old version is cut into BLOCK_SIZE blocks, and the new one is searched for them at every offset.
+Matches are grown byte by byte in both directions and become COPY(offset, length) instructions,
+everything in between becomes INSERT(data). Unlike an EditsList, which walks the old content in
+order, a delta may copy from anywhere in it, so moved and repeated blocks cost a few bytes each.
+
+The block index is keyed by the block bytes themselves rather than a rolling checksum. Hashing a
+slice happens in C, which is cheaper per byte than rolling a checksum in Python, and a hit needs no
+second, strong comparison.
+
+Block deltas are forward only: a COPY names a range of the old version but doesn't hold its bytes,
+so the old version can't be rebuilt from the new one, and `apply` refuses to invert.
+
+Encoded, a delta is "<IQ": instruction count and insert payload length, followed by parallel "<B"
+ops, "<Q" offsets and "<Q" lengths, and the insert payload, every section 8 byte aligned.
+"""
+from collections import namedtuple
+import struct
+import sys
+from typing import BinaryIO, Iterator, Union
+
+BLOCK_SIZE = 64
+
+COPY = 0
+INSERT = 1
+
+Copy = namedtuple("Copy", ["offset", "length"])
+Insert = namedtuple("Insert", ["data"])
+
+_HEADER = struct.Struct("<IQ")
+_ALIGN = 8
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def _pad(n: int) -> int:
+    return -n % _ALIGN
+
+
+class BlockDelta(list[Union[Copy, Insert]]):
+    """COPY and INSERT instructions rebuilding a new version of some bytes from the old one."""
+
+    @property
+    def distance(self):
+        return len(self)
+
+    @classmethod
+    def snapshot(cls, content: Buffer) -> "BlockDelta":
+        """Create a BlockDelta that rebuilds content from nothing"""
+        if not content:
+            return cls()
+        return cls([Insert(bytes(content))])
+
+    @classmethod
+    def compute(cls, old: Buffer, new: Buffer, block_size: int = BLOCK_SIZE) -> "BlockDelta":
+        """Calculate the instructions rebuilding new from old.
+
+        Examples:
+            ```py
+            >>> BlockDelta.compute(b"0123456789" * 2, b"0123456789 and 0123456789", block_size=4)
+            [Copy(offset=0, length=10), Insert(data=b' and '), Copy(offset=0, length=10)]
+            ```
+        """
+        old, new = bytes(old), bytes(new)
+        delta = cls()
+
+        index = {}
+        for offset in range(0, len(old) - block_size + 1, block_size):
+            index.setdefault(old[offset : offset + block_size], offset)
+
+        n, m = len(new), len(old)
+        pos = literal = 0
+        while pos + block_size <= n:
+            offset = index.get(new[pos : pos + block_size])
+            if offset is None:
+                pos += 1
+                continue
+
+            # grow the match back into the pending literal, then forward a block and a byte at a time
+            start, old_start = pos, offset
+            while start > literal and old_start > 0 and new[start - 1] == old[old_start - 1]:
+                start -= 1
+                old_start -= 1
+            end, old_end = pos + block_size, offset + block_size
+            while (
+                end + block_size <= n
+                and old_end + block_size <= m
+                and new[end : end + block_size] == old[old_end : old_end + block_size]
+            ):
+                end += block_size
+                old_end += block_size
+            while end < n and old_end < m and new[end] == old[old_end]:
+                end += 1
+                old_end += 1
+
+            if start > literal:
+                delta.append(Insert(new[literal:start]))
+            delta._copy(old_start, end - start)
+            pos = literal = end
+
+        if literal < n:
+            delta.append(Insert(new[literal:]))
+
+        return delta
+
+    def _copy(self, offset: int, length: int):
+        """Append a copy, merging it into the previous one when they are contiguous in the old version"""
+        if self and isinstance(self[-1], Copy) and sum(self[-1]) == offset:
+            self[-1] = Copy(self[-1].offset, self[-1].length + length)
+        else:
+            self.append(Copy(offset, length))
+
+    def iter_apply(self, original: Buffer) -> Iterator[Buffer]:
+        """Yield the pieces of the new version one instruction at a time, copies are views of original"""
+        source = memoryview(original) if original else memoryview(b"")
+        for instruction in self:
+            if isinstance(instruction, Copy):
+                yield source[instruction.offset : instruction.offset + instruction.length]
+            else:
+                yield instruction.data
+
+    def write_to(self, original: Buffer, out: BinaryIO) -> int:
+        """Stream the new version into a binary file, returning the number of bytes written"""
+        written = 0
+        for piece in self.iter_apply(original):
+            written += out.write(piece)
+        return written
+
+    def apply(self, original: Buffer, invert: bool = False) -> bytes:
+        """Rebuild the new version from original, a ValueError is raised if invert is set"""
+        if invert:
+            raise ValueError("Block deltas are forward only, they can't be inverted")
+        return b"".join(self.iter_apply(original))
+
+    def encode(self) -> bytes:
+        """Encode the delta, see the module docstring for the layout"""
+        ops = bytearray()
+        offsets, lengths = [], []
+        payload = bytearray()
+        for instruction in self:
+            if isinstance(instruction, Copy):
+                ops.append(COPY)
+                offsets.append(instruction.offset)
+                lengths.append(instruction.length)
+            else:
+                ops.append(INSERT)
+                offsets.append(len(payload))
+                lengths.append(len(instruction.data))
+                payload += instruction.data
+
+        out = bytearray(_HEADER.pack(len(ops), len(payload)))
+        fmt = f"<{len(ops)}Q"
+        for section in (ops, struct.pack(fmt, *offsets), struct.pack(fmt, *lengths), payload):
+            out += bytes(_pad(len(out)))
+            out += section
+        out += bytes(_pad(len(out)))
+        return bytes(out)
+
+    @staticmethod
+    def iter_decode(buf: Buffer) -> Iterator[Union[Copy, Insert]]:
+        """Decode the instructions one at a time, straight out of the buffer"""
+        buf = memoryview(buf)
+        count, payload_size = _HEADER.unpack_from(buf)
+        offset = _HEADER.size + _pad(_HEADER.size)
+
+        ops = buf[offset : offset + count]
+        offset += count + _pad(count)
+        payload = offset + 16 * count
+        if len(buf) < payload + payload_size:
+            raise ValueError("Truncated block delta")
+
+        if sys.byteorder == "little":
+            offsets = buf[offset : offset + 8 * count].cast("Q")
+            lengths = buf[offset + 8 * count : offset + 16 * count].cast("Q")
+        else:
+            offsets = struct.unpack_from(f"<{count}Q", buf, offset)
+            lengths = struct.unpack_from(f"<{count}Q", buf, offset + 8 * count)
+
+        for op, at, length in zip(ops, offsets, lengths):
+            if op == COPY:
+                yield Copy(at, length)
+            else:
+                yield Insert(bytes(buf[payload + at : payload + at + length]))
+
+    @classmethod
+    def decode(cls, buf: Buffer) -> "BlockDelta":
+        """Decode an encoded delta"""
+        return cls(cls.iter_decode(buf))
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+import sys
+import threading
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """A least recently used cache bounded by the total size of its values rather than their count.
+
+    Hits, misses and evictions are counted, so callers can tell whether the cache is pulling its weight.
+    It is safe to share between threads.
+
+    >>> cache = LRUCache(max_size=10, sizeof=len)
+    >>> cache.put("a", "12345"); cache.put("b", "123456")
+    >>> "a" in cache, cache.get("b")
+    (False, '123456')
+    """
+
+    def __init__(self, max_size: int, sizeof: Callable[[Any], int] = sys.getsizeof):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Get a value, marking it as the most recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used ones until everything fits"""
+        size = self.sizeof(value)
+        with self._lock:
+            self.pop(key)
+            if size > self.max_size:
+                return
+
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Remove a value without counting it as an eviction"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+
+            self.size -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        """Drop every value and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.size = self.hits = self.misses = self.evictions = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
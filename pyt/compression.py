@@ -0,0 +1,224 @@
+"""Per object compression for `pyt.objectstore`.
+
+A compressed object is framed as:
+
+    header      "<4sBBQ": magic, codec, flags, uncompressed length
+    dictionary  8 byte id of the dictionary it was compressed with, if `FLAG_DICTIONARY` is set
+
+followed by the compressed bytes. Objects without the magic are stored as they are, which is how
+every object was stored before compression, so old stores keep reading. An object is only stored
+compressed when that makes it smaller.
+
+zlib, as raw deflate, is always available and zstd when the `zstandard` package is installed. Both
+can prime the compressor with a dictionary trained from the store's own objects, see
+`train_dictionary`, so the many small deltas, which share their headers and much of their text,
+compress well even though each one is too short to compress on its own.
+"""
+from collections import Counter
+import hashlib
+import struct
+import threading
+import zlib
+from typing import Callable, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+MAGIC = b"PYTZ"
+
+NONE = "none"
+ZLIB = "zlib"
+ZSTD = "zstd"
+CODECS = (NONE, ZLIB, ZSTD)
+
+FLAG_DICTIONARY = 0x01
+
+# Stores write zlib unless configured otherwise, any machine can read it back.
+DEFAULT_CODEC = ZLIB
+
+DEFAULT_LEVELS = {ZLIB: 6, ZSTD: 3}
+# zlib only looks this far back, a longer dictionary is wasted on it.
+ZLIB_DICTIONARY_SIZE = 32 << 10
+DICTIONARY_SIZE = 64 << 10
+
+_HEADER = struct.Struct("<4sBBQ")
+_DICTIONARY_ID_SIZE = 8
+_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+class CompressionError(ValueError):
+    """Raised when an object can't be decompressed, or a codec isn't available"""
+
+
+def available_codecs() -> list[str]:
+    return [codec for codec in CODECS if codec != ZSTD or zstandard is not None]
+
+
+class Dictionary:
+    """A compression dictionary, identified by the start of its sha256"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.id = hashlib.sha256(data).digest()[:_DICTIONARY_ID_SIZE]
+        self._zstd = None
+
+    @property
+    def zstd(self) -> "zstandard.ZstdCompressionDict":
+        if self._zstd is None:
+            self._zstd = zstandard.ZstdCompressionDict(self.data)
+        return self._zstd
+
+
+# zstd (de)compressors are costly to set up with a dictionary and can't be shared between threads
+_local = threading.local()
+
+
+def _zstd_compressor(level: int, dictionary: Optional[Dictionary]):
+    cache = _local.__dict__.setdefault("compressors", {})
+    key = (level, dictionary.id if dictionary else None)
+    compressor = cache.get(key)
+    if compressor is None:
+        compressor = cache[key] = zstandard.ZstdCompressor(
+            level=level, dict_data=dictionary.zstd if dictionary else None
+        )
+    return compressor
+
+
+def _zstd_decompressor(dictionary: Optional[Dictionary]):
+    cache = _local.__dict__.setdefault("decompressors", {})
+    key = dictionary.id if dictionary else None
+    decompressor = cache.get(key)
+    if decompressor is None:
+        decompressor = cache[key] = zstandard.ZstdDecompressor(
+            dict_data=dictionary.zstd if dictionary else None
+        )
+    return decompressor
+
+
+def compress(
+    data: bytes,
+    codec: str = ZLIB,
+    dictionary: Optional[Dictionary] = None,
+    level: Optional[int] = None,
+) -> bytes:
+    """Compress data with codec into a framed object, or leave it as it is if that isn't smaller"""
+    if codec == ZLIB:
+        level = DEFAULT_LEVELS[ZLIB] if level is None else level
+        if dictionary is not None:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary.data)
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        body = compressor.compress(data) + compressor.flush()
+    elif codec == ZSTD:
+        if zstandard is None:
+            raise CompressionError("zstd needs the zstandard package")
+        level = DEFAULT_LEVELS[ZSTD] if level is None else level
+        body = _zstd_compressor(level, dictionary).compress(data)
+    elif codec == NONE:
+        body = None
+    else:
+        raise CompressionError(f"Unknown codec {codec!r}")
+
+    if body is not None:
+        flags = FLAG_DICTIONARY if dictionary is not None else 0
+        header = _HEADER.pack(MAGIC, CODECS.index(codec), flags, len(data))
+        framed = header + (dictionary.id if dictionary is not None else b"") + body
+        if len(framed) < len(data):
+            return framed
+
+    if data[: len(MAGIC)] == MAGIC:
+        # raw data that looks like a frame has to be framed to be told apart
+        return _HEADER.pack(MAGIC, CODECS.index(NONE), 0, len(data)) + data
+    return data
+
+
+def is_framed(stored: bytes) -> bool:
+    return stored[: len(MAGIC)] == MAGIC
+
+
+def codec_of(stored: bytes) -> str:
+    """The codec an object was stored with"""
+    if not is_framed(stored):
+        return NONE
+    return CODECS[stored[len(MAGIC)]]
+
+
+def header_of(stored: bytes) -> tuple[str, int, Optional[bytes]]:
+    """The codec, uncompressed length and dictionary id of a stored object, from its first bytes"""
+    if not is_framed(stored):
+        return NONE, len(stored), None
+    _, codec, flags, length = _HEADER.unpack_from(stored)
+    dictionary_id = None
+    if flags & FLAG_DICTIONARY:
+        dictionary_id = bytes(stored[_HEADER.size : _HEADER.size + _DICTIONARY_ID_SIZE])
+    return CODECS[codec], length, dictionary_id
+
+
+def decompress(
+    stored: bytes, dictionaries: Optional[Callable[[bytes], Dictionary]] = None
+) -> bytes:
+    """Decompress a stored object, looking up the dictionary it names by id with dictionaries"""
+    if not is_framed(stored):
+        return stored
+
+    codec, length, dictionary_id = header_of(stored)
+    offset = _HEADER.size
+    dictionary = None
+    if dictionary_id is not None:
+        offset += _DICTIONARY_ID_SIZE
+        if dictionaries is None:
+            raise CompressionError(f"Object needs dictionary {dictionary_id.hex()}")
+        dictionary = dictionaries(dictionary_id)
+    # revert reads every object through here, so the body is decompressed without copying it out
+    body = memoryview(stored)[offset:]
+
+    try:
+        if codec == NONE:
+            data = bytes(body)
+        elif codec == ZLIB and dictionary is None:
+            data = zlib.decompress(body, -15, length)
+        elif codec == ZLIB:
+            decompressor = zlib.decompressobj(-15, zdict=dictionary.data)
+            data = decompressor.decompress(body) + decompressor.flush()
+        else:
+            if zstandard is None:
+                raise CompressionError("Object is zstd compressed, install the zstandard package")
+            data = _zstd_decompressor(dictionary).decompress(body, max_output_size=length)
+    except _ERRORS as e:
+        raise CompressionError(f"Corrupt {codec} object: {e}") from e
+
+    if len(data) != length:
+        raise CompressionError(f"Corrupt {codec} object: {len(data)} bytes instead of {length}")
+    return data
+
+
+def train_dictionary(samples: list[bytes], codec: str = ZLIB, size: int = DICTIONARY_SIZE) -> bytes:
+    """Train a dictionary for codec from sample objects.
+
+    zstd trains its own. For zlib, the lines found in the most samples are packed into the
+    dictionary, the most common last, as zlib finds the matches closest to the data cheapest.
+    """
+    if codec == ZSTD:
+        if zstandard is None:
+            raise CompressionError("zstd needs the zstandard package")
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError:
+            # too few samples, fall back on the zlib way
+            pass
+
+    size = min(size, ZLIB_DICTIONARY_SIZE) if codec == ZLIB else size
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(sample.splitlines(keepends=True)))
+
+    picked = []
+    total = 0
+    for line, found in counts.most_common():
+        if found < 2 or total + len(line) > size:
+            continue
+        picked.append(line)
+        total += len(line)
+    return b"".join(reversed(picked))
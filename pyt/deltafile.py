@@ -0,0 +1,369 @@
+"""Compact, versioned binary encoding of revisions and their edits.
+
+A revision file is laid out as:
+
+    header      "<4sBB32s32sIIQ": magic, version, flags, sha, previous sha, path length,
+                revisions and encoded bytes since the last keyframe (version 2 onwards)
+    path        utf-8 bytes
+    edits       "<cBxxIQQ": index typecode, edits flags, record count, old and new payload lengths
+
+followed by parallel arrays of op codes, indexes, old and new payload lengths, and then the old and
+new payloads themselves, utf-8 encoded or raw bytes if `EDITS_BYTES` is set. Every section starts on an 8 byte boundary, so the arrays are decoded
+in place with `memoryview.cast` rather than being copied out of the file.
+
+Runs of single character inserts, deletes and substitutions are coalesced into one record with
+the `RUN` bit set on its op code, and expanded back into the same edits when decoding.
+
+Revisions of binary and large files carry a `pyt.blockdelta.BlockDelta` instead of the edits block,
+flagged with `FLAG_BLOCK_DELTA`.
+"""
+import json
+import struct
+import sys
+from pathlib import Path
+from typing import Optional, Union
+
+import click
+
+from .blockdelta import BlockDelta
+from .editslist import Edit, EditsList
+
+MAGIC = b"PYTD"
+VERSION = 2
+
+FLAG_HAS_PREVIOUS = 0x01
+FLAG_KEYFRAME = 0x02
+FLAG_BLOCK_DELTA = 0x04
+EDITS_BYTES = 0x01
+
+OPS = ("insert", "delete", "substitute", "replace")
+OP_CODES = {op: code for code, op in enumerate(OPS)}
+RUN = 0x80
+
+_HEADER = struct.Struct("<4sBB32s32sIIQ")
+_HEADER_V1 = struct.Struct("<4sBB32s32sI")
+_EDITS_HEADER = struct.Struct("<cBxxIQQ")
+_ALIGN = 8
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class DeltaFormatError(ValueError):
+    """Raised when a buffer is not a delta file this version can read."""
+
+
+def is_delta(buf: Buffer) -> bool:
+    """Check whether the buffer starts with the binary delta magic"""
+    return bytes(buf[: len(MAGIC)]) == MAGIC
+
+
+def _pad(n: int) -> int:
+    return -n % _ALIGN
+
+
+def _encode_text(s: Union[str, bytes, bytearray]) -> bytes:
+    if isinstance(s, str):
+        return s.encode("utf-8", "surrogatepass")
+    return bytes(s)
+
+
+def _coalesce(edits: EditsList):
+    """Yield (op code, index, old, new) records, merging runs of single character edits"""
+    run = None
+    for edit in edits:
+        single = (
+            edit.op in ("insert", "delete", "substitute")
+            and len(edit.old) == (edit.op != "insert")
+            and len(edit.new) == (edit.op != "delete")
+        )
+        if run is not None and single and edit.op == run[0]:
+            op, index, olds, news = run
+            # inserts and substitutions walk forward, deletes keep removing at the same index
+            step = 0 if op == "delete" else len(news)
+            if edit.index == index + step:
+                olds.append(edit.old)
+                news.append(edit.new)
+                continue
+
+        if run is not None:
+            yield _flush(run)
+            run = None
+
+        if single:
+            run = (edit.op, edit.index, [edit.old], [edit.new])
+        else:
+            yield OP_CODES[edit.op], edit.index, edit.old, edit.new
+
+    if run is not None:
+        yield _flush(run)
+
+
+def _flush(run):
+    op, index, olds, news = run
+    code = OP_CODES[op]
+    if len(olds) > 1:
+        code |= RUN
+    empty = olds[0][:0]
+    return code, index, empty.join(olds), empty.join(news)
+
+
+def encode_edits(edits: EditsList) -> bytes:
+    """Encode an EditsList into the packed binary edits block"""
+    binary = any(
+        isinstance(edit.old, (bytes, bytearray)) or isinstance(edit.new, (bytes, bytearray))
+        for edit in edits
+    )
+    ops = bytearray()
+    indexes, old_lens, new_lens = [], [], []
+    old_payload, new_payload = bytearray(), bytearray()
+
+    for code, index, old, new in _coalesce(edits):
+        old, new = _encode_text(old), _encode_text(new)
+        ops.append(code)
+        indexes.append(index)
+        old_lens.append(len(old))
+        new_lens.append(len(new))
+        old_payload += old
+        new_payload += new
+
+    widest = max([0, *indexes, *old_lens, *new_lens])
+    typecode = "I" if widest < 1 << 32 else "Q"
+    fmt = f"<{len(ops)}{typecode}"
+
+    out = bytearray(
+        _EDITS_HEADER.pack(
+            typecode.encode(),
+            EDITS_BYTES if binary else 0,
+            len(ops),
+            len(old_payload),
+            len(new_payload),
+        )
+    )
+    for section in (
+        ops,
+        struct.pack(fmt, *indexes),
+        struct.pack(fmt, *old_lens),
+        struct.pack(fmt, *new_lens),
+        old_payload,
+        new_payload,
+    ):
+        out += section
+        out += bytes(_pad(len(out)))
+
+    return bytes(out)
+
+
+def _cast(buf: memoryview, offset: int, count: int, typecode: str):
+    size = struct.calcsize(typecode) * count
+    view = buf[offset : offset + size]
+    if len(view) != size:
+        raise DeltaFormatError("Truncated delta file")
+    if sys.byteorder == "little":
+        return view.cast(typecode), offset + size + _pad(size)
+    return struct.unpack(f"<{count}{typecode}", view), offset + size + _pad(size)
+
+
+def decode_edits(buf: Buffer, offset: int = 0) -> tuple[EditsList, int]:
+    """Decode an edits block starting at offset, returning the EditsList and the offset after it"""
+    buf = memoryview(buf)
+    if offset % _ALIGN:
+        # the arrays are only aligned relative to the start of the block
+        buf, offset = memoryview(bytes(buf[offset:])), 0
+
+    typecode, flags, count, old_size, new_size = _EDITS_HEADER.unpack_from(buf, offset)
+    typecode = typecode.decode()
+    if typecode not in ("I", "Q"):
+        raise DeltaFormatError(f"Unknown index typecode {typecode!r}")
+
+    offset += _EDITS_HEADER.size
+    offset += _pad(offset)
+    ops, offset = _cast(buf, offset, count, "B")
+    indexes, offset = _cast(buf, offset, count, typecode)
+    old_lens, offset = _cast(buf, offset, count, typecode)
+    new_lens, offset = _cast(buf, offset, count, typecode)
+
+    old_at, new_at = offset, offset + old_size + _pad(old_size)
+    end = new_at + new_size + _pad(new_size)
+    if len(buf) < new_at + new_size:
+        raise DeltaFormatError("Truncated delta file")
+
+    if flags & EDITS_BYTES:
+        decode, empty = bytes, b""
+    else:
+        decode, empty = lambda view: str(view, "utf-8", "surrogatepass"), ""
+
+    edits = EditsList()
+    for code, index, old_len, new_len in zip(ops, indexes, old_lens, new_lens):
+        old = decode(buf[old_at : old_at + old_len])
+        new = decode(buf[new_at : new_at + new_len])
+        old_at += old_len
+        new_at += new_len
+
+        op = OPS[code & ~RUN]
+        if not code & RUN:
+            edits.append(Edit(op=op, index=index, old=old, new=new))
+        elif op == "insert":
+            edits.extend(
+                Edit(op=op, index=index + k, old=empty, new=new[k : k + 1])
+                for k in range(len(new))
+            )
+        elif op == "delete":
+            edits.extend(
+                Edit(op=op, index=index, old=old[k : k + 1], new=empty)
+                for k in range(len(old))
+            )
+        else:
+            edits.extend(
+                Edit(op=op, index=index + k, old=old[k : k + 1], new=new[k : k + 1])
+                for k in range(len(old))
+            )
+
+    return edits, end
+
+
+def encode_revision(
+    sha: str,
+    previous_sha: Optional[str],
+    path: Path,
+    edits: Union[EditsList, BlockDelta],
+    keyframe: bool = False,
+    chain_length: int = 0,
+    chain_size: int = 0,
+) -> bytes:
+    """Encode a revision, see the module docstring for the layout"""
+    path = _encode_text(str(path))
+    flags = FLAG_HAS_PREVIOUS if previous_sha else 0
+    if keyframe:
+        flags |= FLAG_KEYFRAME
+    if isinstance(edits, BlockDelta):
+        flags |= FLAG_BLOCK_DELTA
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        flags,
+        bytes.fromhex(sha),
+        bytes.fromhex(previous_sha) if previous_sha else bytes(32),
+        len(path),
+        chain_length,
+        chain_size,
+    )
+    head = header + path
+    body = edits.encode() if isinstance(edits, BlockDelta) else encode_edits(edits)
+    return head + bytes(_pad(len(head))) + body
+
+
+def decode_header(buf: Buffer) -> dict:
+    """Decode only the header and path of a revision, without touching its edits.
+
+    Returns the keyword arguments of `Revision` but edits, along with the header `flags` and the
+    `offset` the edits start at.
+    """
+    buf = memoryview(buf)
+    if len(buf) < _HEADER_V1.size or not is_delta(buf):
+        raise DeltaFormatError("Not a pyt delta file")
+
+    version = buf[len(MAGIC)]
+    if version > VERSION:
+        raise DeltaFormatError(f"Delta file version {version} is newer than {VERSION}")
+
+    if version == 1:
+        header = _HEADER_V1
+        _, _, flags, sha, previous_sha, path_len = header.unpack_from(buf)
+        # version 1 predates keyframes, every root revision is a full snapshot
+        chain_length = chain_size = 0
+        if not flags & FLAG_HAS_PREVIOUS:
+            flags |= FLAG_KEYFRAME
+    else:
+        header = _HEADER
+        if len(buf) < header.size:
+            raise DeltaFormatError("Truncated delta file")
+        _, _, flags, sha, previous_sha, path_len, chain_length, chain_size = (
+            header.unpack_from(buf)
+        )
+
+    offset = header.size
+    path = str(buf[offset : offset + path_len], "utf-8", "surrogatepass")
+    offset += path_len
+    offset += _pad(offset)
+
+    return {
+        "sha": sha.hex(),
+        "previous_sha": previous_sha.hex() if flags & FLAG_HAS_PREVIOUS else None,
+        "path": Path(path),
+        "keyframe": bool(flags & FLAG_KEYFRAME),
+        "chain_length": chain_length,
+        "chain_size": chain_size,
+        "flags": flags,
+        "offset": offset,
+    }
+
+
+def decode_revision(buf: Buffer) -> dict:
+    """Decode a revision into the keyword arguments of `Revision`"""
+    buf = memoryview(buf)
+    data = decode_header(buf)
+    flags = data.pop("flags")
+    offset = data.pop("offset")
+    if flags & FLAG_BLOCK_DELTA:
+        try:
+            data["edits"] = BlockDelta.decode(buf[offset:])
+        except (ValueError, TypeError, struct.error) as e:
+            raise DeltaFormatError(f"Bad block delta: {e}") from e
+    else:
+        data["edits"], _ = decode_edits(buf, offset)
+    return data
+
+
+def migrate(root: Path) -> list[Path]:
+    """Rewrite every legacy JSON revision in root in the binary format, returning the migrated files"""
+    migrated = []
+    for file in sorted(root.iterdir()):
+        if not file.is_file():
+            continue
+
+        data = file.read_bytes()
+        if is_delta(data):
+            continue
+
+        try:
+            legacy = json.loads(data)
+            edits = EditsList.unpickle(legacy["edits"])
+        except (ValueError, KeyError, TypeError):
+            # not a revision, e.g. the manifest
+            continue
+
+        tmp = file.with_name(file.name + ".tmp")
+        tmp.write_bytes(
+            encode_revision(
+                legacy["sha"],
+                legacy["previous_sha"],
+                Path(legacy["path"]),
+                edits,
+                keyframe=legacy["previous_sha"] is None,
+            )
+        )
+        tmp.replace(file)
+        migrated.append(file)
+
+    return migrated
+
+
+@click.group()
+def deltafile():
+    pass
+
+
+@deltafile.command("migrate")
+@click.argument("root", type=click.Path(exists=True, file_okay=False, path_type=Path))
+def migrate_command(root):
+    """Convert the JSON revision files in ROOT to the binary delta format"""
+    migrated = migrate(root)
+    print(f"Migrated {len(migrated)} revision(s).")
+
+
+def main():
+    deltafile()
+
+
+if __name__ == "__main__":
+    main()
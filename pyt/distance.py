@@ -0,0 +1,151 @@
+"""Levenshtein distances without edit scripts.
+
+`distance` runs Myers' bit-parallel algorithm, as reformulated for edit distance by Hyyrö, with the
+whole column of the DP table packed into one Python int, so a pair costs a handful of big int
+operations per character of the longer string rather than a table of Edit objects.
+
+`batch_distance` runs the same recurrence on many pairs at once when NumPy is installed, one uint64
+lane per pair, for pairs whose shorter string fits in 64 characters. Longer pairs, and every pair
+without NumPy, go through `distance`.
+"""
+from typing import Iterable, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+# Pairs are scored this many at a time, bounding the (batch, len(b)) arrays of the recurrence.
+BATCH_SIZE = 4096
+WORD_BITS = 64
+
+
+def _peq(a: Sequence) -> dict:
+    """Map every symbol of a to the bitmask of the positions it is found at"""
+    peq = {}
+    for i, c in enumerate(a):
+        peq[c] = peq.get(c, 0) | 1 << i
+    return peq
+
+
+def distance(a: Sequence, b: Sequence) -> int:
+    """The levenshtein distance between two sequences of hashable symbols, e.g. strings or bytes.
+
+    Examples:
+        ```py
+        >>> distance("kitten", "sitting")
+        3
+        ```
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    m = len(a)
+    if not m:
+        return len(b)
+
+    peq = _peq(a)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for c in b:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv) & mask
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        # the top row of the table counts up, so a horizontal +1 enters at the bottom of every column
+        ph = (ph << 1 | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | ~(xv | ph) & mask
+        mv = ph & xv
+    return score
+
+
+def _encode(strings: list[Sequence], width: int):
+    """Pack strings into a (len(strings), width) array of symbol codes, padding with -1"""
+    codes = np.full((len(strings), width), -1, dtype=np.int64)
+    lens = np.array([len(s) for s in strings], dtype=np.int64)
+    if all(isinstance(s, str) for s in strings):
+        flat = np.frombuffer("".join(strings).encode("utf-32-le"), dtype=np.uint32)
+    elif all(isinstance(s, (bytes, bytearray)) for s in strings):
+        flat = np.frombuffer(b"".join(strings), dtype=np.uint8)
+    else:
+        flat = np.array([hash(c) & 0x7FFFFFFFFFFFFFFF for s in strings for c in s], dtype=np.int64)
+
+    # scatter the concatenation back into rows, symbol n of the row k goes to codes[k, n - starts[k]]
+    rows = np.repeat(np.arange(len(strings)), lens)
+    starts = np.repeat(np.cumsum(lens) - lens, lens)
+    codes[rows, np.arange(len(flat)) - starts] = flat
+    return codes
+
+
+def _batch_words(pairs: list[tuple[Sequence, Sequence]]) -> "np.ndarray":
+    """Score pairs whose first string is the shorter one and at most WORD_BITS long, one lane each"""
+    a_lens = np.array([len(a) for a, _ in pairs], dtype=np.int64)
+    b_lens = np.array([len(b) for _, b in pairs], dtype=np.int64)
+    a_codes = _encode([a for a, _ in pairs], WORD_BITS)
+    b_codes = _encode([b for _, b in pairs], int(b_lens.max()))
+
+    # eq[k, j] has bit i set when a_k[i] == b_k[j], the pattern bitmasks of every column at once
+    eq = np.zeros(b_codes.shape, dtype=np.uint64)
+    for i in range(int(a_lens.max())):
+        matches = (a_codes[:, i, None] == b_codes) & (a_codes[:, i, None] >= 0)
+        eq |= matches.astype(np.uint64) << np.uint64(i)
+
+    full = a_lens >= WORD_BITS
+    shift = np.minimum(a_lens, WORD_BITS - 1).astype(np.uint64)
+    mask = np.where(full, ~np.uint64(0), (np.uint64(1) << shift) - np.uint64(1))
+    high = np.uint64(1) << np.maximum(a_lens - 1, 0).astype(np.uint64)
+    one = np.uint64(1)
+
+    pv, mv = mask.copy(), np.zeros_like(mask)
+    score = a_lens.copy()
+    for j in range(b_codes.shape[1]):
+        active = j < b_lens
+        e = eq[:, j]
+        xv = e | mv
+        xh = (((e & pv) + pv) ^ pv) | e
+        ph = mv | ~(xh | pv) & mask
+        mh = pv & xh
+        score += active & (ph & high != 0)
+        score -= active & (ph & high == 0) & (mh & high != 0)
+        ph = ((ph << one) | one) & mask
+        mh = (mh << one) & mask
+        pv = np.where(active, mh | ~(xv | ph) & mask, pv)
+        mv = np.where(active, ph & xv, mv)
+
+    return np.where(a_lens == 0, b_lens, score)
+
+
+def batch_distance(pairs: Iterable[tuple[Sequence, Sequence]], batch_size: int = BATCH_SIZE) -> list[int]:
+    """The levenshtein distance of every pair, in order.
+
+    Examples:
+        ```py
+        >>> batch_distance([("kitten", "sitting"), ("", "abc"), ("flaw", "lawn")])
+        [3, 3, 2]
+        ```
+    """
+    pairs = [(a, b) if len(a) <= len(b) else (b, a) for a, b in pairs]
+    if np is None:
+        return [distance(a, b) for a, b in pairs]
+
+    distances = [0] * len(pairs)
+    short = []
+    for k, (a, b) in enumerate(pairs):
+        if len(a) <= WORD_BITS and len(b):
+            short.append(k)
+        else:
+            distances[k] = distance(a, b)
+
+    for start in range(0, len(short), batch_size):
+        batch = short[start : start + batch_size]
+        scores = _batch_words([pairs[k] for k in batch])
+        for k, score in zip(batch, scores.tolist()):
+            distances[k] = score
+
+    return distances
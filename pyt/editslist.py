@@ -1,11 +1,56 @@
+import ast
 from collections import namedtuple
+import io
+from itertools import accumulate
 import pickle
+import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Literal
+from typing import Iterable, Literal, Optional, Union
 from codecs import encode, decode
 
-Edit = namedtuple("Edit", ["op", "index", "old", "new"])
+from . import distance as _distance
+from .myers import diff_hunks
+
+Edit = namedtuple("Edit", ["op", "index", "old", "new"], defaults=("", ""))
+
+# Inputs with more (m+1)*(n+1) cells than this are diffed with the linear space engine.
+EXACT_MAX_CELLS = 250_000
+
+Text = Union[str, bytes, bytearray]
+Granularity = Literal["char", "line", "token", "block"]
+DEFAULT_BLOCK_SIZE = 64
+# Changed chunks larger than this are stored as a single replace instead of being refined to characters.
+REFINE_MAX_CHARS = 4 << 10
+# Refining a changed run costs O(N * D) for D inserted and deleted characters, so it gives up, and
+# stores a single replace, past this many or past half the run, where refined edits save little.
+REFINE_MAX_DISTANCE = 128
+# The encoded size of an edit besides its text, an op byte and three "<I" fields, see `pyt.deltafile`.
+EDIT_RECORD_SIZE = 13
+
+_TOKEN_RE = re.compile(r"\w+|\s+|[^\w\s]")
+_BYTES_TOKEN_RE = re.compile(rb"\w+|\s+|[^\w\s]")
+
+
+def _units(s: Text) -> list:
+    """Split text into a list of one character strings or one byte bytes"""
+    if isinstance(s, str):
+        return list(s)
+    return [s[i : i + 1] for i in range(len(s))]
+
+
+def split_chunks(s: Text, granularity: Granularity, block_size: int = DEFAULT_BLOCK_SIZE) -> list:
+    """Split a string into the chunks diffed by `EditsList.compute_chunked`, they always join back to s."""
+    if granularity == "line":
+        return s.splitlines(keepends=True)
+    elif granularity == "token":
+        return (_TOKEN_RE if isinstance(s, str) else _BYTES_TOKEN_RE).findall(s)
+    elif granularity == "block":
+        return [s[i : i + block_size] for i in range(0, len(s), block_size)]
+    elif granularity == "char":
+        return _units(s)
+    else:
+        raise ValueError(f"Unknown granularity {granularity!r}")
 
 
 class EditsList(list[Edit]):
@@ -18,24 +63,142 @@ class EditsList(list[Edit]):
     def distance(self):
         return len(self)
 
+    @staticmethod
+    def distance_of(s1: Text, s2: Text) -> int:
+        """The levenshtein distance between two strings, without building the edits, see `pyt.distance`"""
+        return _distance.distance(s1, s2)
+
+    @staticmethod
+    def batch_distance(pairs: Iterable[tuple[Text, Text]]) -> list[int]:
+        """The levenshtein distance of every pair of strings, NumPy vectorized when it is installed"""
+        return _distance.batch_distance(pairs)
+
     @classmethod
-    def from_strings(cls, s1: str, s2: str = None):
-        """Create an EditsList from two strings"""
+    def from_strings(
+        cls,
+        s1: str,
+        s2: str = None,
+        exact: Optional[bool] = None,
+        granularity: Granularity = "char",
+        max_distance: Optional[int] = None,
+        max_size: Optional[int] = None,
+    ) -> Optional["EditsList"]:
+        """Create an EditsList from two strings, or None if they are more than max_distance apart.
+
+        max_distance counts edits at char granularity and inserted plus deleted chunks otherwise.
+        Chunked edits are also given up on once they would hold more than max_size characters, see
+        `compute_chunked`.
+        """
         if s2 is None:
             s2 = s1
-            s1 = ""
+            s1 = s2[:0]
 
-        obj = cls()
-        obj.extend(cls.compute(s1, s2))
+        if granularity == "char":
+            edits = cls.compute(s1, s2, exact=exact, max_distance=max_distance)
+        else:
+            edits = cls.compute_chunked(
+                s1, s2, granularity, max_distance=max_distance, max_size=max_size
+            )
+        if edits is None:
+            return None
 
+        obj = cls()
+        obj.extend(edits)
         return obj
 
-    def apply(self, original: str, invert: bool = False):
-        """
-        >>> apply_leven_edits("kitten", [Edit(operation='substitute', old='k', new='s', index=0), Edit(operation='substitute', old='e', new='i', index=4), Edit(operation='insert', old='', new='g', index=7)])
+    @classmethod
+    def snapshot(cls, content: Text) -> "EditsList":
+        """Create an EditsList that rebuilds content from scratch, as a single replace of nothing"""
+        if not content:
+            return cls()
+        return cls([Edit(op="replace", index=0, old=content[:0], new=content)])
+
+    def is_monotonic(self) -> bool:
+        """Check that every edit lands at or after the end of the previous one, as computed edits do"""
+        pos = 0
+        for edit in self:
+            if edit.index < pos:
+                return False
+            pos = edit.index + (0 if edit.op == "delete" else len(edit.new))
+        return True
+
+    def apply(self, original: Text, invert: bool = False) -> Text:
+        """Apply the edits to original, or undo them if invert is set.
+
+        Monotonic edits, which is everything `compute` produces, are applied in a single O(n + k) sweep
+        that copies the unchanged runs between edits, anything else falls back to editing a list in place.
+        str, bytes and bytearray are accepted, and the result is of the same type as original.
+
+        >>> EditsList([Edit(op='substitute', old='k', new='s', index=0), Edit(op='substitute', old='e', new='i', index=4), Edit(op='insert', old='', new='g', index=7)]).apply("kitten")
         'sitting'
         """
-        transformed = list(original)
+        if self.is_monotonic():
+            if invert:
+                transformed = self._sweep_inverted(original)
+            else:
+                transformed = self._sweep(original)
+        else:
+            transformed = self._apply_in_place(original, invert)
+
+        if isinstance(original, str):
+            return "".join(transformed)
+        joined = b"".join(transformed)
+        return bytearray(joined) if isinstance(original, bytearray) else joined
+
+    def _sweep(self, original: Text) -> list:
+        """Emit the pieces of the transformed text in one pass over original"""
+        source = original if isinstance(original, str) else memoryview(original)
+        pieces = []
+        src = pos = 0
+        for edit in self:
+            if edit.index > pos:
+                unchanged = source[src : src + edit.index - pos]
+                pieces.append(unchanged)
+                src += len(unchanged)
+                pos += len(unchanged)
+
+            if edit.op == "insert":
+                pieces.append(edit.new)
+                pos += len(edit.new)
+            elif edit.op == "delete":
+                src += 1
+            elif edit.op == "substitute":
+                pieces.append(edit.new)
+                src += 1
+                pos += len(edit.new)
+            elif edit.op == "replace":
+                pieces.append(edit.new)
+                src += len(edit.old)
+                pos += len(edit.new)
+
+        pieces.append(source[src:])
+        return pieces
+
+    def _sweep_inverted(self, transformed: Text) -> list:
+        """Emit the pieces of the original text in one pass over the transformed one"""
+        source = transformed if isinstance(transformed, str) else memoryview(transformed)
+        pieces = []
+        pos = 0
+        for edit in self:
+            if edit.index > pos:
+                unchanged = source[pos : edit.index]
+                pieces.append(unchanged)
+                pos += len(unchanged)
+
+            if edit.op == "insert":
+                pos += len(edit.new)
+            elif edit.op == "delete":
+                pieces.append(edit.old)
+            elif edit.op in ("substitute", "replace"):
+                pieces.append(edit.old)
+                pos += len(edit.new)
+
+        pieces.append(source[pos:])
+        return pieces
+
+    def _apply_in_place(self, original: Text, invert: bool) -> list:
+        """Apply the edits one at a time to a list of characters, O(n) per edit"""
+        transformed = _units(original)
 
         if invert:
             el = reversed(self)
@@ -43,8 +206,10 @@ class EditsList(list[Edit]):
             el = self
 
         for edit in el:
-            if edit.op == "insert" and not invert or edit.op == "delete" and invert:
+            if edit.op == "insert" and not invert:
                 transformed.insert(edit.index, edit.new)
+            elif edit.op == "delete" and invert:
+                transformed.insert(edit.index, edit.old)
             elif edit.op == "delete" and not invert or edit.op == "insert" and invert:
                 transformed.pop(edit.index)
             elif edit.op == "substitute":
@@ -52,19 +217,39 @@ class EditsList(list[Edit]):
                     transformed[edit.index] = edit.new
                 else:
                     transformed[edit.index] = edit.old
+            elif edit.op == "replace":
+                if not invert:
+                    transformed[edit.index : edit.index + len(edit.old)] = _units(edit.new)
+                else:
+                    transformed[edit.index : edit.index + len(edit.new)] = _units(edit.old)
 
-        return "".join(transformed)
+        return transformed
 
     @staticmethod
-    def compute(s1: str, s2: str, ascls=True) -> iter:
-        """Calculate the edits needed to transform s1 into s2 using the levenshtein distance algorithm.
+    def compute(
+        s1: str,
+        s2: str,
+        ascls=True,
+        exact: Optional[bool] = None,
+        max_distance: Optional[int] = None,
+    ) -> iter:
+        """Calculate the edits needed to transform s1 into s2.
+
+        Small inputs use the exact levenshtein distance algorithm, larger ones use the linear space
+        Myers engine, see `EditsList.compute_myers`. With max_distance, the exact algorithm is
+        restricted to a band around the diagonal, see `EditsList.compute_banded`, and only inputs
+        whose band is too large go to the Myers engine.
 
         Args:
             s1 (str): The original string
             s2 (str): The new string
+            exact (bool, optional): Force (True) or forbid (False) the exact levenshtein path.
+                Defaults to picking by input size.
+            max_distance (int, optional): Give up once more than this many edits are needed.
 
         Returns:
-            list[Edit]: A list of edits needed to transform s1 into s2
+            list[Edit]: A list of edits needed to transform s1 into s2, or None if more than
+                max_distance are
 
         Examples:
             ```py
@@ -73,6 +258,14 @@ class EditsList(list[Edit]):
             ```
         """
         m, n = len(s1), len(s2)
+        if exact is None:
+            band = n + 1 if max_distance is None else 2 * max_distance + 1
+            exact = (m + 1) * min(n + 1, band) <= EXACT_MAX_CELLS
+        if not exact:
+            return EditsList.compute_myers(s1, s2, ascls=ascls, max_distance=max_distance)
+        if max_distance is not None:
+            return EditsList.compute_banded(s1, s2, max_distance, ascls=ascls)
+
         dp = [[(0, None, None, 0)] * (n + 1) for _ in range(m + 1)]
 
         for i in range(m + 1):
@@ -80,7 +273,7 @@ class EditsList(list[Edit]):
                 if i == 0:
                     dp[i][j] = (j, None, "insert", j - 1)
                 elif j == 0:
-                    dp[i][j] = (i, None, "delete", i - 1)
+                    dp[i][j] = (i, None, "delete", j)
                 elif s1[i - 1] == s2[j - 1]:
                     dp[i][j] = (dp[i - 1][j - 1][0], None, "no_change", i - 1)
                 else:
@@ -90,22 +283,24 @@ class EditsList(list[Edit]):
 
                     min_cost = min(insert_cost, delete_cost, substitute_cost)
 
+                    # indexes are into the string as it is being transformed, so edits replay in order
                     if min_cost == insert_cost:
                         dp[i][j] = (min_cost, None, "insert", j - 1)
                     elif min_cost == delete_cost:
-                        dp[i][j] = (min_cost, None, "delete", i - 1)
+                        dp[i][j] = (min_cost, None, "delete", j)
                     else:
-                        dp[i][j] = (min_cost, s1[i - 1], "substitute", i - 1)
+                        dp[i][j] = (min_cost, s1[i - 1 : i], "substitute", j - 1)
 
+        empty = s1[:0]
         edits = []
         i, j = m, n
         while i > 0 or j > 0:
             cost, replaced_char, operation, index = dp[i][j]
             if operation == "insert":
-                edits.append(Edit(op="insert", index=index, new=s2[j - 1], old=""))
+                edits.append(Edit(op="insert", index=index, new=s2[j - 1 : j], old=empty))
                 j -= 1
             elif operation == "delete":
-                edits.append(Edit(op="delete", index=index, new="", old=s1[i - 1]))
+                edits.append(Edit(op="delete", index=index, new=empty, old=s1[i - 1 : i]))
                 i -= 1
             elif operation == "substitute":
                 edits.append(
@@ -113,7 +308,7 @@ class EditsList(list[Edit]):
                         op="substitute",
                         index=index,
                         old=replaced_char,
-                        new=s2[j - 1],
+                        new=s2[j - 1 : j],
                     )
                 )
                 i -= 1
@@ -130,11 +325,249 @@ class EditsList(list[Edit]):
         else:
             return r
 
+    @staticmethod
+    def compute_banded(s1: str, s2: str, max_distance: int, ascls=True) -> Optional[iter]:
+        """Calculate the levenshtein edits transforming s1 into s2, if there are at most max_distance.
+
+        Only the cells within max_distance of the diagonal are filled in, as no script of that many
+        edits strays further (Ukkonen), so this takes O(max_distance * len(s1)) time and space. The
+        edits are the same as the unbanded exact algorithm's, and None is returned as soon as a whole
+        row of the band is over max_distance.
+
+        Examples:
+            ```py
+            >>> EditsList.compute_banded("kitten", "sitting", 3)
+            [Edit(op='substitute', index=0, old='k', new='s'), Edit(op='substitute', index=4, old='e', new='i'), Edit(op='insert', index=6, old='', new='g')]
+            >>> EditsList.compute_banded("kitten", "sitting", 2) is None
+            True
+            ```
+        """
+        m, n = len(s1), len(s2)
+        k = max_distance
+        if abs(m - n) > k:
+            return None
+
+        # row i holds columns i - k to i + k, column j at position j - i + k, so the diagonal
+        # neighbour is at the same position of the previous row and the upper one right of it
+        over = k + 1
+        width = 2 * k + 1
+        rows = []
+        prev = None
+        for i in range(m + 1):
+            row = [(over, None)] * width
+            best = over
+            for j in range(max(0, i - k), min(n, i + k) + 1):
+                p = j - i + k
+                if i == 0:
+                    cell = (j, "insert")
+                elif j == 0:
+                    cell = (i, "delete")
+                elif s1[i - 1] == s2[j - 1]:
+                    cell = (prev[p][0], "no_change")
+                else:
+                    insert_cost = (row[p - 1][0] if p > 0 else over) + 1
+                    delete_cost = (prev[p + 1][0] if p + 1 < width else over) + 1
+                    substitute_cost = prev[p][0] + 1
+
+                    min_cost = min(insert_cost, delete_cost, substitute_cost)
+                    if min_cost == insert_cost:
+                        cell = (min_cost, "insert")
+                    elif min_cost == delete_cost:
+                        cell = (min_cost, "delete")
+                    else:
+                        cell = (min_cost, "substitute")
+                row[p] = cell
+                best = min(best, cell[0])
+
+            # every script crosses every row, so a row entirely over the bound ends the search
+            if best > k:
+                return None
+            rows.append(row)
+            prev = row
+
+        if rows[m][n - m + k][0] > k:
+            return None
+
+        empty = s1[:0]
+        edits = []
+        i, j = m, n
+        while i > 0 or j > 0:
+            operation = rows[i][j - i + k][1]
+            if operation == "insert":
+                edits.append(Edit(op="insert", index=j - 1, old=empty, new=s2[j - 1 : j]))
+                j -= 1
+            elif operation == "delete":
+                edits.append(Edit(op="delete", index=j, old=s1[i - 1 : i], new=empty))
+                i -= 1
+            else:
+                if operation == "substitute":
+                    edits.append(
+                        Edit(
+                            op="substitute",
+                            index=j - 1,
+                            old=s1[i - 1 : i],
+                            new=s2[j - 1 : j],
+                        )
+                    )
+                i -= 1
+                j -= 1
+
+        r = reversed(edits)
+        if ascls:
+            return EditsList(r)
+        else:
+            return r
+
+    @staticmethod
+    def compute_myers(
+        s1: str, s2: str, ascls=True, max_distance: Optional[int] = None
+    ) -> Optional[iter]:
+        """Calculate the edits needed to transform s1 into s2 using Myers' O(ND) diff.
+
+        Memory is proportional to len(s1) + len(s2) plus the number of edits, rather than their product.
+        The script is not always the minimal levenshtein one, replaced runs are paired into substitutions
+        but an unequal replace is emitted as substitutions followed by deletes or inserts.
+
+        With max_distance, None is returned once more than that many characters would have to be
+        inserted or deleted, which may be before the levenshtein distance itself goes over it.
+
+        Examples:
+            ```py
+            >>> EditsList.compute_myers("kitten", "sitting")
+            [Edit(op='substitute', index=0, old='k', new='s'), Edit(op='substitute', index=4, old='e', new='i'), Edit(op='insert', index=6, old='', new='g')]
+            ```
+        """
+        hunks = diff_hunks(s1, s2, max_distance=max_distance)
+        if hunks is None:
+            return None
+
+        empty = s1[:0]
+        edits = []
+        for i1, i2, j1, j2 in hunks:
+            common = min(i2 - i1, j2 - j1)
+            for k in range(common):
+                edits.append(
+                    Edit(
+                        op="substitute",
+                        index=j1 + k,
+                        old=s1[i1 + k : i1 + k + 1],
+                        new=s2[j1 + k : j1 + k + 1],
+                    )
+                )
+            for k in range(i1 + common, i2):
+                edits.append(
+                    Edit(op="delete", index=j1 + common, old=s1[k : k + 1], new=empty)
+                )
+            for k in range(j1 + common, j2):
+                edits.append(Edit(op="insert", index=k, old=empty, new=s2[k : k + 1]))
+
+        if ascls:
+            return EditsList(edits)
+        else:
+            return iter(edits)
+
+    @staticmethod
+    def compute_chunked(
+        s1: str,
+        s2: str,
+        granularity: Granularity = "line",
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        refine: bool = True,
+        max_distance: Optional[int] = None,
+        max_size: Optional[int] = None,
+    ) -> Optional["EditsList"]:
+        """Calculate the edits needed to transform s1 into s2, diffing whole lines, tokens or blocks first.
+
+        Only the chunks that changed are refined down to characters, within a budget of
+        REFINE_MAX_DISTANCE edits per run of them, or per chunk where as many changed on both sides. Edits are "replace" hunks, where `old` and `new`
+        are whole runs of text and `index` is where the run starts in the string being transformed,
+        so a changed line costs one record rather than one per character. None is returned, without
+        finishing the diff, if more than max_distance chunks are inserted or deleted, or once the
+        edits would take more than about max_size bytes encoded, counting characters as bytes.
+
+        Examples:
+            ```py
+            >>> EditsList.compute_chunked("a\\nkitten\\nb\\n", "a\\nsitting\\nb\\n")
+            [Edit(op='replace', index=2, old='k', new='s'), Edit(op='replace', index=6, old='e', new='i'), Edit(op='replace', index=8, old='', new='g')]
+            ```
+        """
+        c1 = split_chunks(s1, granularity, block_size)
+        c2 = split_chunks(s2, granularity, block_size)
+        # character offset of every chunk boundary
+        o1 = [0, *accumulate(map(len, c1))]
+        o2 = [0, *accumulate(map(len, c2))]
+
+        hunks = diff_hunks(c1, c2, max_distance=max_distance)
+        if hunks is None:
+            return None
+
+        if refine:
+            # runs of as many changed chunks on both sides, such as lines edited in place, are
+            # refined chunk by chunk, so the cost of refining grows with the chunks, not the run
+            hunks = [
+                piece
+                for i1, i2, j1, j2 in hunks
+                for piece in (
+                    [(i, i + 1, j1 + i - i1, j1 + i - i1 + 1) for i in range(i1, i2)]
+                    if i2 - i1 == j2 - j1
+                    else [(i1, i2, j1, j2)]
+                )
+            ]
+
+        edits = EditsList()
+        size = 0
+        for i1, i2, j1, j2 in hunks:
+            a1, a2, b1, b2 = o1[i1], o1[i2], o2[j1], o2[j2]
+            old, new = s1[a1:a2], s2[b1:b2]
+
+            refined = None
+            if refine and len(old) + len(new) <= REFINE_MAX_CHARS:
+                limit = min(REFINE_MAX_DISTANCE, (len(old) + len(new)) // 2)
+                if max_size is not None:
+                    limit = min(limit, max_size - size)
+                refined = diff_hunks(old, new, max_distance=max(limit, 0))
+
+            if refined is None:
+                edits.append(Edit(op="replace", index=b1, old=old, new=new))
+                size += EDIT_RECORD_SIZE + len(old) + len(new)
+            else:
+                for k1, k2, l1, l2 in refined:
+                    edits.append(
+                        Edit(op="replace", index=b1 + l1, old=old[k1:k2], new=new[l1:l2])
+                    )
+                    size += EDIT_RECORD_SIZE + k2 - k1 + l2 - l1
+            if max_size is not None and size > max_size:
+                return None
+
+        return edits
+
+    def encode(self) -> bytes:
+        """Encode the editslist in the binary delta format, see `pyt.deltafile`"""
+        from .deltafile import encode_edits
+
+        return encode_edits(self)
+
+    @classmethod
+    def decode(cls, data) -> "EditsList":
+        """Decode an editslist from a bytes-like object in the binary delta format"""
+        from .deltafile import decode_edits
+
+        return decode_edits(data)[0]
+
     def pickle(self):
         """Pickle the editslist"""
         return str(pickle.dumps(self))
 
     @classmethod
     def unpickle(cls, data):
-        """Unpickle the editslist"""
-        return pickle.loads(eval(data))
+        """Unpickle the editslist, only used to read revisions saved before the binary delta format"""
+        return _EditsUnpickler(io.BytesIO(ast.literal_eval(data))).load()
+
+
+class _EditsUnpickler(pickle.Unpickler):
+    """Only allows the classes a pickled EditsList is made of to be loaded."""
+
+    def find_class(self, module, name):
+        if module == __name__ and name in ("Edit", "EditsList"):
+            return globals()[name]
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in an EditsList")
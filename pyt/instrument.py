@@ -0,0 +1,155 @@
+"""Counters and timers on the hot paths of scan and revert: hashing, delta compute and apply, object
+reads and writes.
+
+Off unless `pyt --profile` is given or $PYT_PROFILE is set. While off, `timer` hands back one shared
+no-op context manager and `count` returns after checking a flag, nothing is recorded or allocated.
+Worker processes inherit the setting, and send what they recorded back with `collect` to be `merge`d.
+
+With tracing on, every timed span is also kept as a Chrome trace event, `dump_trace` writes them as
+JSON that chrome://tracing and Perfetto open.
+"""
+from collections import Counter
+from contextlib import nullcontext
+import json
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import TextIO
+
+ENV = "PYT_PROFILE"
+
+enabled = bool(os.environ.get(ENV))
+tracing = os.environ.get(ENV) == "trace"
+
+counters: Counter = Counter()
+# total seconds and calls by timer name
+timers: dict[str, list] = {}
+events: list[dict] = []
+
+_lock = threading.Lock()
+_NULL = nullcontext()
+
+
+def enable(trace: bool = False):
+    """Start recording, in this process and the worker processes it starts"""
+    global enabled, tracing
+    enabled = True
+    tracing = tracing or trace
+    os.environ[ENV] = "trace" if tracing else "1"
+
+
+def reset():
+    counters.clear()
+    timers.clear()
+    events.clear()
+
+
+# a forked worker starts from nothing, or collect would send the parent's records back to it
+os.register_at_fork(after_in_child=reset)
+
+
+class _Timer:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        finished = time.perf_counter()
+        elapsed = finished - self.started
+        with _lock:
+            entry = timers.get(self.name)
+            if entry is None:
+                entry = timers[self.name] = [0.0, 0]
+            entry[0] += elapsed
+            entry[1] += 1
+            if tracing:
+                events.append(
+                    {
+                        "name": self.name,
+                        "ph": "X",
+                        "ts": self.started * 1e6,
+                        "dur": elapsed * 1e6,
+                        "pid": os.getpid(),
+                        "tid": threading.get_ident(),
+                    }
+                )
+        return False
+
+
+def timer(name: str):
+    """A context manager adding the time spent in it to the name timer"""
+    if not enabled:
+        return _NULL
+    return _Timer(name)
+
+
+def count(name: str, n: int = 1):
+    """Add n to the name counter"""
+    if enabled:
+        with _lock:
+            counters[name] += n
+
+
+def collect() -> dict:
+    """Take what this process recorded, emptying it, for `merge` in the process that started it"""
+    if not enabled:
+        return {}
+    with _lock:
+        recorded = {"counters": dict(counters), "timers": dict(timers), "events": list(events)}
+        reset()
+    return recorded
+
+
+def merge(recorded: dict):
+    """Add the counters, timers and events of another process"""
+    if not recorded:
+        return
+    with _lock:
+        counters.update(recorded["counters"])
+        for name, (elapsed, calls) in recorded["timers"].items():
+            entry = timers.setdefault(name, [0.0, 0])
+            entry[0] += elapsed
+            entry[1] += calls
+        events.extend(recorded["events"])
+
+
+def summary() -> dict:
+    """The timers, slowest first, the counters, and the revision caches' hit rates"""
+    from .revfile import cache_stats
+
+    return {
+        "timers": {
+            name: {"seconds": elapsed, "calls": calls, "mean": elapsed / calls}
+            for name, (elapsed, calls) in sorted(timers.items(), key=lambda item: -item[1][0])
+        },
+        "counters": dict(sorted(counters.items())),
+        "caches": cache_stats(),
+    }
+
+
+def report(file: TextIO = sys.stderr):
+    """Print the summary as a table, one line per timer and counter"""
+    stats = summary()
+    print(f"{'phase':<24} {'calls':>8} {'total ms':>10} {'mean ms':>10}", file=file)
+    for name, timing in stats["timers"].items():
+        print(
+            f"{name:<24} {timing['calls']:>8} {timing['seconds'] * 1000:>10.2f} {timing['mean'] * 1000:>10.3f}",
+            file=file,
+        )
+    for name, value in stats["counters"].items():
+        print(f"{name:<24} {value:>8}", file=file)
+    for name, cache in stats["caches"].items():
+        print(f"{name + ' cache':<24} {cache['hits']:>8} hits {cache['misses']:>8} misses", file=file)
+
+
+def dump_trace(path: Path):
+    """Write the recorded spans in the Chrome trace event format"""
+    with open(path, "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
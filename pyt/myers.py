@@ -0,0 +1,126 @@
+from typing import Optional, Sequence
+
+Hunk = tuple[int, int, int, int]
+
+
+def _middle_snake(
+    a: Sequence, alo: int, ahi: int, b: Sequence, blo: int, bhi: int, limit: Optional[int] = None
+):
+    """Find the middle snake of the shortest edit script between a[alo:ahi] and b[blo:bhi].
+
+    Returns the snake as (x, y, u, v) relative to (alo, blo), where a[alo+x:alo+u] == b[blo+y:blo+v],
+    along with the length of the shortest edit script, D. If limit is set and the search passes
+    D = limit without meeting, (None, D) is returned instead, after O((n + m) * limit) work.
+    """
+    n, m = ahi - alo, bhi - blo
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    if limit is not None and (limit + 1) // 2 < max_d:
+        max_d = (limit + 1) // 2
+    offset = max_d + 1
+    vf = [0] * (2 * offset + 1)
+    vb = [0] * (2 * offset + 1)
+
+    for d in range(max_d + 1):
+        # forward search from the top left corner
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[offset + k - 1] < vf[offset + k + 1]):
+                x = vf[offset + k + 1]
+            else:
+                x = vf[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            vf[offset + k] = x
+
+            if odd and delta - (d - 1) <= k <= delta + (d - 1):
+                if x + vb[offset + delta - k] >= n:
+                    return (x0, y0, x, y), 2 * d - 1
+
+        # reverse search from the bottom right corner, with x and y measured from the end
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vb[offset + k - 1] < vb[offset + k + 1]):
+                x = vb[offset + k + 1]
+            else:
+                x = vb[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            vb[offset + k] = x
+
+            if not odd and -d <= delta - k <= d:
+                if x + vf[offset + delta - k] >= n:
+                    return (n - x, m - y, n - x0, m - y0), 2 * d
+
+    if limit is not None:
+        return None, 2 * max_d + 1
+    raise AssertionError("unreachable: no middle snake found")
+
+
+def diff_hunks(a: Sequence, b: Sequence, max_distance: Optional[int] = None) -> Optional[list[Hunk]]:
+    """Compute the differing regions between a and b using Myers' O(ND) algorithm.
+
+    The linear space refinement is used, so memory stays proportional to len(a) + len(b) no matter
+    how different the two sequences are. Works on any indexable sequence of hashable items, such as
+    str, bytes or a list of lines.
+
+    Args:
+        max_distance (int, optional): Give up, returning None, once more than this many items would
+            have to be inserted or deleted. The search only explores that many diagonals either side
+            of the main one, like Ukkonen's banded algorithm, so it costs O((n + m) * max_distance).
+
+    Returns:
+        list[Hunk]: Sorted, non-adjacent (i1, i2, j1, j2) tuples where a[i1:i2] is replaced by b[j1:j2].
+
+    Examples:
+        ```py
+        >>> diff_hunks("kitten", "sitting")
+        [(0, 1, 0, 1), (4, 5, 4, 5), (6, 6, 6, 7)]
+        ```
+    """
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return None
+
+    hunks = []
+    stack = [(0, len(a), 0, len(b))]
+    # the first middle snake is of the whole script, so only it needs to be bounded
+    limit = max_distance
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+
+        # strip the common prefix and suffix, they are never part of an edit
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+
+        if alo == ahi or blo == bhi:
+            if alo != ahi or blo != bhi:
+                hunks.append((alo, ahi, blo, bhi))
+            continue
+
+        snake, d = _middle_snake(a, alo, ahi, b, blo, bhi, limit)
+        if limit is not None and d > limit:
+            return None
+        limit = None
+        x, y, u, v = snake
+        # push the right half first so the left half is processed, and emitted, first
+        stack.append((alo + u, ahi, blo + v, bhi))
+        stack.append((alo, alo + x, blo, blo + y))
+
+    # coalesce touching hunks, e.g. a delete directly followed by an insert becomes a replace
+    merged = []
+    for hunk in hunks:
+        if merged and merged[-1][1] == hunk[0] and merged[-1][3] == hunk[2]:
+            merged[-1] = (merged[-1][0], hunk[1], merged[-1][2], hunk[3])
+        else:
+            merged.append(hunk)
+
+    return merged
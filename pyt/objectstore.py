@@ -0,0 +1,543 @@
+"""Content addressed object store for the .pyt folder.
+
+Fresh objects are written loose, one file per object under `objects/<2 hex>/<62 hex>`, and
+`ObjectStore.repack` folds them into an append-only pack under `packs/`:
+
+    pack-<name>.pack    "<4sII": magic, version, object count, then the objects back to back
+    pack-<name>.idx     "<4sIIQ": magic, version, object count, generation, a fanout table of 256 "<I"
+                        cumulative counts by first sha byte, then count sorted "<32sQQ" entries
+                        of sha, offset into the pack and length
+
+Packs are searched from the highest generation down, so the most recently written copy of an object
+wins. Both pack files are memory-mapped, so a lookup is a binary search over the index entries sharing
+the sha's first byte without reading anything else. Loose objects shadow packed ones, which is how
+an object is rewritten, and files named by a bare sha directly in the root are read as loose
+objects of the flat layout revisions used to be saved in.
+
+Objects are compressed one by one, see `pyt.compression`, with the codec and dictionary set in
+`compression.json` and zlib by default. Each object records its own codec, so objects written
+under different settings sit side by side, and `repack(recompress=True)` rewrites them all with
+the current ones.
+
+Inside `ObjectStore.batch` objects aren't written at all until the batch ends, and then all of them
+go into one new pack, fsynced once, rather than one loose file each.
+"""
+from contextlib import contextmanager
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+from pathlib import Path
+from typing import Iterator, Optional
+
+from . import compression, instrument
+from .compression import CompressionError, Dictionary
+from .utilities import ShaIndex
+
+PACK_MAGIC = b"PYTP"
+IDX_MAGIC = b"PYTI"
+PACK_VERSION = 1
+
+_PACK_HEADER = struct.Struct("<4sII")
+_IDX_HEADER = struct.Struct("<4sIIQ")
+_FANOUT = struct.Struct("<256I")
+_IDX_ENTRY = struct.Struct("<32sQQ")
+
+COMPRESSION_CONFIG = "compression.json"
+DICTIONARIES_DIR = "dictionaries"
+# Dictionaries are trained from at most this many objects.
+DICTIONARY_SAMPLES = 2000
+
+_SHA_RE = re.compile(r"[0-9a-f]{64}")
+_PREFIX_RE = re.compile(r"[0-9a-f]{1,64}")
+
+
+def fsync_dir(path: Path):
+    """Make the renames and new entries in the folder path durable"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Pack:
+    """A read only, memory-mapped pack file and its index"""
+
+    def __init__(self, idx_path: Path):
+        self.idx_path = idx_path
+        self.pack_path = idx_path.with_suffix(".pack")
+
+        with idx_path.open("rb") as f:
+            self._idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with self.pack_path.open("rb") as f:
+            self._pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.count, self.generation = _IDX_HEADER.unpack_from(self._idx)
+        if magic != IDX_MAGIC or version > PACK_VERSION:
+            raise ValueError(f"{idx_path} is not a pack index this version can read")
+        self._fanout = _FANOUT.unpack_from(self._idx, _IDX_HEADER.size)
+        self._entries = _IDX_HEADER.size + _FANOUT.size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self.count):
+            yield self._sha_at(i).hex()
+
+    def _sha_at(self, i: int) -> bytes:
+        at = self._entries + i * _IDX_ENTRY.size
+        return self._idx[at : at + 32]
+
+    def find(self, sha: bytes) -> Optional[tuple[int, int]]:
+        """Binary search the index for a raw sha, returning its (offset, length) in the pack"""
+        lo = self._fanout[sha[0] - 1] if sha[0] else 0
+        hi = self._fanout[sha[0]]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found = self._sha_at(mid)
+            if found < sha:
+                lo = mid + 1
+            elif found > sha:
+                hi = mid
+            else:
+                _, offset, length = _IDX_ENTRY.unpack_from(
+                    self._idx, self._entries + mid * _IDX_ENTRY.size
+                )
+                return offset, length
+        return None
+
+    def matches(self, prefix: str) -> Iterator[str]:
+        """Yield the hex shas starting with prefix, sorted, found by a binary search of the index"""
+        # the smallest raw sha the prefix can start
+        low = bytes.fromhex(prefix.ljust(len(prefix) + len(prefix) % 2, "0"))
+        if len(prefix) >= 2:
+            lo = self._fanout[low[0] - 1] if low[0] else 0
+            hi = self._fanout[low[0]]
+        else:
+            lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._sha_at(mid) < low:
+                lo = mid + 1
+            else:
+                hi = mid
+        for i in range(lo, self.count):
+            sha = self._sha_at(i).hex()
+            if not sha.startswith(prefix):
+                break
+            yield sha
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self._pack[offset : offset + length]
+
+    def close(self):
+        self._idx.close()
+        self._pack.close()
+
+
+class ObjectStore:
+    """Loose objects and packs in a .pyt folder, keyed by hex sha256.
+
+    Use `ObjectStore.open` to share one instance, and its memory maps, per folder.
+    """
+
+    _stores: dict[Path, "ObjectStore"] = {}
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.objects = root / "objects"
+        self.packs_dir = root / "packs"
+        self.packs: list[Pack] = []
+        self._packs_mtime = None
+        self._refresh_packs()
+        self._dictionaries: dict[bytes, Dictionary] = {}
+        self._load_compression()
+        # the stored objects of the open batch, see `batch`
+        self._batch: Optional[dict[str, bytes]] = None
+        self._batch_replaced: list[Path] = []
+
+    def _load_compression(self):
+        config_path = self.root / COMPRESSION_CONFIG
+        config = json.loads(config_path.read_text()) if config_path.exists() else {}
+        self.codec = config.get("codec", compression.DEFAULT_CODEC)
+        self.level = config.get("level")
+        dictionary_id = config.get("dictionary")
+        self.dictionary = self._dictionary(bytes.fromhex(dictionary_id)) if dictionary_id else None
+
+    def configure_compression(
+        self,
+        codec: str,
+        level: Optional[int] = None,
+        dictionary: Optional[Dictionary] = None,
+    ):
+        """Compress the objects written from now on with codec, at level, primed with dictionary"""
+        if codec not in compression.available_codecs():
+            raise CompressionError(f"{codec} is not available")
+        self.root.mkdir(parents=True, exist_ok=True)
+        config_path = self.root / COMPRESSION_CONFIG
+        tmp = config_path.with_name(config_path.name + ".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "codec": codec,
+                    "level": level,
+                    "dictionary": dictionary.id.hex() if dictionary is not None else None,
+                }
+            )
+        )
+        os.replace(tmp, config_path)
+        self._load_compression()
+
+    def _dictionary(self, dictionary_id: bytes) -> Dictionary:
+        dictionary = self._dictionaries.get(dictionary_id)
+        if dictionary is None:
+            path = self.root / DICTIONARIES_DIR / dictionary_id.hex()
+            if not path.is_file():
+                raise CompressionError(f"Missing compression dictionary {dictionary_id.hex()}")
+            dictionary = self._dictionaries[dictionary_id] = Dictionary(path.read_bytes())
+        return dictionary
+
+    def train_dictionary(self, size: int = compression.DICTIONARY_SIZE) -> Dictionary:
+        """Train a dictionary for the store's codec from up to DICTIONARY_SAMPLES of its objects.
+
+        The dictionary is saved but not used until passed to `configure_compression`. Dictionaries
+        are never removed, as the objects compressed with them need them to be read.
+        """
+        samples = []
+        for sha in self:
+            samples.append(self.get(sha))
+            if len(samples) >= DICTIONARY_SAMPLES:
+                break
+        dictionary = Dictionary(compression.train_dictionary(samples, self.codec, size))
+
+        path = self.root / DICTIONARIES_DIR / dictionary.id.hex()
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(dictionary.data)
+        os.replace(tmp, path)
+        self._dictionaries[dictionary.id] = dictionary
+        return dictionary
+
+    @classmethod
+    def open(cls, root: Path) -> "ObjectStore":
+        """Get the shared store for root"""
+        key = Path(os.path.abspath(root))
+        store = cls._stores.get(key)
+        if store is None:
+            store = cls._stores[key] = cls(root)
+        return store
+
+    def _refresh_packs(self) -> bool:
+        """Pick up packs written since the last look, returning whether anything changed"""
+        try:
+            mtime = self.packs_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._packs_mtime:
+            return False
+
+        self._packs_mtime = mtime
+        known = {pack.idx_path: pack for pack in self.packs}
+        packs = []
+        if mtime is not None:
+            for idx_path in self.packs_dir.glob("pack-*.idx"):
+                packs.append(known.pop(idx_path, None) or Pack(idx_path))
+        for pack in known.values():
+            pack.close()
+        # newest first, so the most recent copy of an object wins
+        self.packs = sorted(packs, key=lambda pack: pack.generation, reverse=True)
+        return True
+
+    def _loose_path(self, sha: str) -> Path:
+        return self.objects / sha[:2] / sha[2:]
+
+    def _find_loose(self, sha: str) -> Optional[Path]:
+        for path in (self._loose_path(sha), self.root / sha):
+            if path.is_file():
+                return path
+        return None
+
+    def _find_packed(self, sha: str) -> Optional[tuple[Pack, int, int]]:
+        raw = bytes.fromhex(sha)
+        for pack in self.packs:
+            found = pack.find(raw)
+            if found is not None:
+                return pack, *found
+        return None
+
+    def __contains__(self, sha: str) -> bool:
+        if not _SHA_RE.fullmatch(sha):
+            return False
+        if self._batch is not None and sha in self._batch:
+            return True
+        if self._find_loose(sha) or self._find_packed(sha):
+            return True
+        return self._refresh_packs() and self._find_packed(sha) is not None
+
+    def get(self, sha: str) -> bytes:
+        """Read an object, raising KeyError if it isn't stored"""
+        stored = self.get_stored(sha)
+        with instrument.timer("object.decompress"):
+            return compression.decompress(stored, self._dictionary)
+
+    def get_stored(self, sha: str) -> bytes:
+        """Read an object as it is stored, compressed or not, raising KeyError if it isn't stored"""
+        if not _SHA_RE.fullmatch(sha):
+            raise KeyError(sha)
+
+        with instrument.timer("object.read"):
+            data = self._batch.get(sha) if self._batch is not None else None
+            loose = self._find_loose(sha) if data is None else None
+            if loose is not None:
+                data = loose.read_bytes()
+            elif data is None:
+                found = self._find_packed(sha)
+                if found is None and self._refresh_packs():
+                    found = self._find_packed(sha)
+                if found is None:
+                    raise KeyError(sha)
+
+                pack, offset, length = found
+                data = pack.read(offset, length)
+        instrument.count("object.read.bytes", len(data))
+        return data
+
+    def put(self, sha: str, data: bytes, replace: bool = False) -> bool:
+        """Write an object loose, or add it to the open batch, returning False if it was already
+        stored and replace isn't set"""
+        if not _SHA_RE.fullmatch(sha):
+            raise ValueError(f"{sha!r} is not a sha256 hex digest")
+        if not replace and sha in self:
+            return False
+
+        with instrument.timer("object.compress"):
+            data = compression.compress(data, self.codec, self.dictionary, self.level)
+        if self._batch is not None:
+            self._batch[sha] = data
+            loose = self._find_loose(sha) if replace else None
+            if loose is not None:
+                # it would shadow the packed copy
+                self._batch_replaced.append(loose)
+            return True
+
+        with instrument.timer("object.write"):
+            path = self._loose_path(sha)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        instrument.count("object.write.bytes", len(data))
+        return True
+
+    @contextmanager
+    def batch(self):
+        """Collect the objects put until the end of the block in memory, then write them all as
+        one pack, fsynced once, rather than a loose file each.
+
+        Objects put in the batch can be read back already. Once the block ends the pack is durable,
+        so anything pointing at its objects can be saved after it. If the block raises, nothing is
+        written. Nested batches are part of the outermost one.
+        """
+        if self._batch is not None:
+            yield self
+            return
+
+        self._batch = {}
+        self._batch_replaced = []
+        try:
+            yield self
+            objects, replaced = self._batch, self._batch_replaced
+        finally:
+            self._batch = None
+            self._batch_replaced = []
+
+        if objects:
+            self._refresh_packs()
+            with instrument.timer("object.write"):
+                self._write_pack(sorted(objects.items()), len(objects))
+            for path in replaced:
+                path.unlink(missing_ok=True)
+            self._refresh_packs()
+
+    def resolve(self, prefix: str) -> str:
+        """The one stored sha starting with prefix, raising KeyError if there is none and
+        `AmbiguousPrefixError` if there are several.
+
+        Loose objects are listed from the one folder their first two characters name, and packs are
+        binary searched, so this never walks the whole store.
+        """
+        if not _PREFIX_RE.fullmatch(prefix):
+            raise KeyError(prefix)
+        if len(prefix) == 64:
+            if prefix not in self:
+                raise KeyError(prefix)
+            return prefix
+        return ShaIndex(self.matches(prefix)).resolve(prefix)
+
+    def matches(self, prefix: str) -> Iterator[str]:
+        """Yield the stored shas starting with a hex prefix, possibly more than once"""
+        if len(prefix) >= 2:
+            folders = [self.objects / prefix[:2]]
+        else:
+            folders = sorted(self.objects.glob(f"{prefix}?")) if self.objects.is_dir() else []
+        for folder in folders:
+            if folder.is_dir():
+                for path in folder.iterdir():
+                    sha = folder.name + path.name
+                    if sha.startswith(prefix) and _SHA_RE.fullmatch(sha):
+                        yield sha
+        # the flat layout has no folders to narrow it down
+        for path in self.root.glob(f"{prefix}*"):
+            if path.is_file() and _SHA_RE.fullmatch(path.name):
+                yield path.name
+
+        self._refresh_packs()
+        for pack in self.packs:
+            yield from pack.matches(prefix)
+
+    def loose(self) -> Iterator[tuple[str, Path]]:
+        """Yield the sha and path of every loose object, including ones in the flat layout"""
+        if self.objects.is_dir():
+            for path in self.objects.glob("??/*"):
+                sha = path.parent.name + path.name
+                if _SHA_RE.fullmatch(sha):
+                    yield sha, path
+        for path in self.root.iterdir():
+            if path.is_file() and _SHA_RE.fullmatch(path.name):
+                yield path.name, path
+
+    def __iter__(self) -> Iterator[str]:
+        """Yield every stored sha once"""
+        self._refresh_packs()
+        seen = set()
+        for sha, _ in self.loose():
+            if sha not in seen:
+                seen.add(sha)
+                yield sha
+        for pack in self.packs:
+            for sha in pack:
+                if sha not in seen:
+                    seen.add(sha)
+                    yield sha
+
+    def repack(self, all_packs: bool = False, recompress: bool = False) -> Optional[Path]:
+        """Fold the loose objects, and every existing pack if all_packs is set, into a new pack.
+
+        Objects are copied as they are stored, unless recompress is set, which compresses them all
+        again with the current codec and dictionary.
+
+        Returns the path of the new pack index, or None if there was nothing to fold.
+        """
+        self._refresh_packs()
+        loose = {}
+        for sha, path in self.loose():
+            # a loose object in the objects folder wins over the flat layout
+            loose.setdefault(sha, path)
+        folded = list(self.packs) if all_packs else []
+        # a single pack only needs rewriting to recompress it
+        if not loose and len(folded) < (1 if recompress else 2):
+            return None
+
+        shas = set(loose)
+        for pack in folded:
+            shas.update(pack)
+        shas = sorted(shas)
+
+        if recompress:
+            objects = (
+                (sha, compression.compress(self.get(sha), self.codec, self.dictionary, self.level))
+                for sha in shas
+            )
+        else:
+            objects = ((sha, self.get_stored(sha)) for sha in shas)
+        idx_path = self._write_pack(objects, len(shas))
+
+        for path in loose.values():
+            path.unlink()
+        for pack in folded:
+            if pack.idx_path != idx_path:
+                pack.close()
+                pack.idx_path.unlink()
+                pack.pack_path.unlink()
+
+        self._refresh_packs()
+        return idx_path
+
+    def _write_pack(self, objects: Iterator[tuple[str, bytes]], count: int) -> Path:
+        """Write count stored objects, sorted by sha, as a pack of the next generation, returning the
+        path of its index.
+
+        The pack and its index are each fsynced once, then renamed into place, the index last as it
+        makes the pack visible, and the packs folder is fsynced so the renames are durable too.
+        """
+        self.packs_dir.mkdir(parents=True, exist_ok=True)
+        generation = max((pack.generation for pack in self.packs), default=0) + 1
+
+        # packs are named by their content, written under a temporary name until it is known
+        entries = []
+        checksum = hashlib.sha256()
+        tmp_pack = self.packs_dir / f"pack-{generation}.pack.tmp"
+        with tmp_pack.open("wb") as f:
+            header = _PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, count)
+            f.write(header)
+            checksum.update(header)
+            offset = _PACK_HEADER.size
+            for sha, data in objects:
+                f.write(data)
+                checksum.update(data)
+                entries.append((bytes.fromhex(sha), offset, len(data)))
+                offset += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        instrument.count("object.write.bytes", offset)
+
+        name = checksum.hexdigest()[:16]
+        pack_path = self.packs_dir / f"pack-{name}.pack"
+        idx_path = self.packs_dir / f"pack-{name}.idx"
+
+        fanout = [0] * 256
+        for raw, _, _ in entries:
+            fanout[raw[0]] += 1
+        for i in range(1, 256):
+            fanout[i] += fanout[i - 1]
+
+        tmp_idx = idx_path.with_name(idx_path.name + ".tmp")
+        with tmp_idx.open("wb") as f:
+            f.write(_IDX_HEADER.pack(IDX_MAGIC, PACK_VERSION, len(entries), generation))
+            f.write(_FANOUT.pack(*fanout))
+            for entry in entries:
+                f.write(_IDX_ENTRY.pack(*entry))
+            f.flush()
+            os.fsync(f.fileno())
+
+        # the pack must be in place before its index makes it visible
+        os.replace(tmp_pack, pack_path)
+        os.replace(tmp_idx, idx_path)
+        fsync_dir(self.packs_dir)
+        return idx_path
+
+    def stats(self) -> dict:
+        """Object counts, and their stored and uncompressed sizes, in total and by codec"""
+        stats = {"objects": 0, "size": 0, "stored_size": 0, "codecs": {}}
+        for sha in self:
+            stored = self.get_stored(sha)
+            codec, size, _ = compression.header_of(stored)
+            entry = stats["codecs"].setdefault(codec, {"objects": 0, "size": 0, "stored_size": 0})
+            for totals in (stats, entry):
+                totals["objects"] += 1
+                totals["size"] += size
+                totals["stored_size"] += len(stored)
+        stats["codec"] = self.codec
+        stats["dictionary"] = self.dictionary.id.hex() if self.dictionary is not None else None
+        return stats
+
+    def close(self):
+        for pack in self.packs:
+            pack.close()
+        self.packs = []
+        self._packs_mtime = None
+        ObjectStore._stores.pop(Path(os.path.abspath(self.root)), None)
@@ -0,0 +1,217 @@
+"""Pick how each changed file is stored from a cheap estimate of how similar its versions are.
+
+The estimate is the share of actual that can be found in original, from SAMPLES windows of WINDOW
+characters spread over actual and looked up with `str.find`, which costs a few passes over the
+original at C speed. If a `dist_model` inference server is listening, see `dist_model/serve.py`,
+contents short enough for the model are estimated by it instead.
+
+Similar versions get the exact delta, somewhat similar ones a coarse delta that skips the costly
+refinement, and the rest a snapshot, as a delta would cost more to compute than it saves. Every
+decision is recorded as a `Plan`, with the time the estimate and the delta took and their sizes, as
+it was finally stored.
+"""
+from dataclasses import asdict, dataclass, field
+import json
+import os
+from pathlib import Path
+import socket
+import time
+from typing import Callable, Literal, Optional, Union
+
+from .blockdelta import BlockDelta
+from .editslist import EditsList
+from .revfile import DEFAULT_GRANULARITY, Content, compute_delta
+
+Strategy = Literal["exact", "coarse", "snapshot"]
+Estimator = Callable[[Content, Content], float]
+
+SAMPLES = 32
+WINDOW = 32
+# Binary files are coarsely diffed with blocks this large, indexing far fewer of them.
+COARSE_BLOCK_SIZE = 1024
+# The inference server to estimate with, see `load_estimator`.
+SOCKET_ENV = "PYT_DISTANCE_SOCKET"
+
+
+def containment(original: Content, actual: Content) -> float:
+    """Estimate the share of actual that is also in original, from 0 for none to 1 for all of it"""
+    if isinstance(original, str) != isinstance(actual, str):
+        return 0.0
+    if not actual:
+        return 1.0
+    if not original:
+        return 0.0
+    if len(actual) <= WINDOW:
+        return 1.0 if actual in original else 0.0
+
+    step = (len(actual) - WINDOW) / (SAMPLES - 1)
+    found = 0
+    for k in range(SAMPLES):
+        at = round(k * step)
+        if original.find(actual[at : at + WINDOW]) != -1:
+            found += 1
+    return found / SAMPLES
+
+
+class DistanceServerEstimator:
+    """Estimate with the learned distance model, through its inference server's Unix socket.
+
+    The model only reads the first max_length characters, longer contents are estimated with fallback.
+    So are those the server answers with an error, and every content once the connection is lost.
+    """
+
+    def __init__(self, socket_path: Path, max_length: int = 100, fallback: Estimator = containment):
+        self.max_length = max_length
+        self.fallback = fallback
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(str(socket_path))
+        self._file = self._socket.makefile("rw", encoding="utf-8")
+        self.connected = True
+
+    def __call__(self, original: Content, actual: Content) -> float:
+        longest = max(len(original), len(actual))
+        if not isinstance(actual, str) or not isinstance(original, str) or longest > self.max_length:
+            return self.fallback(original, actual)
+        if not longest:
+            return 1.0
+        if not self.connected:
+            return self.fallback(original, actual)
+
+        try:
+            self._file.write(json.dumps({"a": original, "b": actual}) + "\n")
+            self._file.flush()
+            answer = json.loads(self._file.readline())
+        except (OSError, ValueError):
+            # a dropped connection reads as an empty line, either way the stream can't be trusted
+            self.close()
+            return self.fallback(original, actual)
+
+        distance = answer.get("distance") if isinstance(answer, dict) else None
+        if not isinstance(distance, (int, float)):
+            return self.fallback(original, actual)
+        return min(max(1 - distance / longest, 0.0), 1.0)
+
+    def close(self):
+        self.connected = False
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._socket.close()
+
+
+def load_estimator() -> Estimator:
+    """The distance model if an inference server is listening at $PYT_DISTANCE_SOCKET, else `containment`"""
+    socket_path = os.environ.get(SOCKET_ENV)
+    if socket_path:
+        try:
+            return DistanceServerEstimator(Path(socket_path))
+        except OSError:
+            pass
+    return containment
+
+
+def _size(content: Content) -> int:
+    return len(content.encode()) if isinstance(content, str) else len(content)
+
+
+@dataclass
+class Plan:
+    """How a file's delta was computed, and what that cost"""
+
+    path: str
+    strategy: Strategy
+    similarity: float
+    estimate_time: float
+    delta_time: float
+    delta_size: int
+    content_size: int
+
+
+@dataclass
+class Planner:
+    """Decides between an exact delta, a coarse one and a snapshot for every changed file.
+
+    Versions whose similarity is at least exact_above get the exact delta, at least coarse_above a
+    coarse one, and anything less a snapshot. Plans are kept in `plans`.
+    """
+
+    estimator: Estimator = field(default_factory=load_estimator)
+    exact_above: float = 0.5
+    coarse_above: float = 0.1
+    plans: list[Plan] = field(default_factory=list)
+
+    def choose(self, similarity: float) -> Strategy:
+        if similarity >= self.exact_above:
+            return "exact"
+        if similarity >= self.coarse_above:
+            return "coarse"
+        return "snapshot"
+
+    def delta(
+        self,
+        original: Content,
+        actual: Content,
+        path: Union[str, Path],
+        granularity=DEFAULT_GRANULARITY,
+    ) -> Optional[Union[EditsList, BlockDelta]]:
+        """Compute the delta from original to actual the way the estimate calls for, None for a snapshot"""
+        started = time.perf_counter()
+        similarity = self.estimator(original, actual)
+        estimated = time.perf_counter()
+
+        strategy = self.choose(similarity)
+        delta = None
+        if isinstance(original, str) != isinstance(actual, str):
+            strategy = "snapshot"
+        elif strategy == "exact":
+            delta = compute_delta(original, actual, granularity=granularity, bounded=True)
+        elif strategy == "coarse" and isinstance(actual, str):
+            delta = EditsList.compute_chunked(original, actual, granularity, refine=False)
+        elif strategy == "coarse":
+            delta = BlockDelta.compute(original, actual, block_size=COARSE_BLOCK_SIZE)
+        finished = time.perf_counter()
+
+        self.plans.append(
+            Plan(
+                path=str(path),
+                strategy=strategy if delta is not None else "snapshot",
+                similarity=similarity,
+                estimate_time=estimated - started,
+                delta_time=finished - estimated,
+                delta_size=len(delta.encode()) if delta is not None else _size(actual),
+                content_size=_size(actual),
+            )
+        )
+        return delta
+
+    def record_snapshot(self, size: int):
+        """Record that the last file planned was stored as a snapshot of size bytes after all, as
+        `Revision.from_content` does when the delta is larger or the keyframe policy wants one"""
+        plan = self.plans[-1]
+        plan.strategy = "snapshot"
+        plan.delta_size = size
+
+    @property
+    def stats(self) -> dict:
+        """Count, time and size totals of the plans by strategy"""
+        stats = {}
+        for plan in self.plans:
+            entry = stats.setdefault(
+                plan.strategy,
+                {"files": 0, "estimate_time": 0.0, "delta_time": 0.0, "delta_size": 0, "content_size": 0},
+            )
+            entry["files"] += 1
+            entry["estimate_time"] += plan.estimate_time
+            entry["delta_time"] += plan.delta_time
+            entry["delta_size"] += plan.delta_size
+            entry["content_size"] += plan.content_size
+        return stats
+
+
+def save_plans(root: Path, plans: list[Plan]):
+    """Append plans to the project's plans.jsonl, one JSON object per line"""
+    if not plans:
+        return
+    with open(root / "plans.jsonl", "a") as file:
+        file.writelines(json.dumps(asdict(plan)) + "\n" for plan in plans)
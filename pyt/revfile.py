@@ -1,16 +1,156 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 import hashlib
 import json
+import os
 from pathlib import Path
 import shutil
 import logging
-from typing import Optional
+import time
+from typing import TYPE_CHECKING, Optional, Union
 from pathlib import Path
-from .editslist import EditsList
-from .utilities import most_matching_sha
+from . import instrument
+from .blockdelta import BlockDelta
+from .cache import LRUCache
+from .deltafile import decode_header, decode_revision, encode_revision, is_delta
+from .editslist import EDIT_RECORD_SIZE, EditsList, Granularity, split_chunks
+from .objectstore import ObjectStore
+
+if TYPE_CHECKING:
+    from .planner import Planner
 
 log = logging.getLogger(__name__)
 
+# Revisions diff line by line and only refine the changed lines, see `EditsList.compute_chunked`.
+DEFAULT_GRANULARITY: Granularity = "line"
+# Files this large, or with a NUL byte in their first BINARY_SNIFF_SIZE bytes, are revised as raw
+# bytes with block deltas, see `pyt.blockdelta`, rather than diffed as text.
+BLOCK_DELTA_THRESHOLD = 4 << 20
+BINARY_SNIFF_SIZE = 8000
+
+Content = Union[str, bytes]
+
+
+@dataclass
+class KeyframePolicy:
+    """Decides when a revision is stored as a full snapshot, bounding how many deltas revert replays"""
+
+    interval: int = 32
+    max_chain_size: int = 1 << 20
+
+    def wants_keyframe(self, chain_length: int, chain_size: int) -> bool:
+        """Check whether a revision chain_length deltas and chain_size encoded bytes past the last keyframe should be one"""
+        return chain_length >= self.interval or chain_size > self.max_chain_size
+
+
+DEFAULT_KEYFRAME_POLICY = KeyframePolicy()
+
+# Reconstructed file contents by revision sha, these never go stale as the sha is that of the content.
+content_cache = LRUCache(max_size=64 << 20)
+# Parsed revisions by the path they were loaded from, objects are only rewritten through save.
+revision_cache = LRUCache(max_size=4096, sizeof=lambda entry: 1)
+
+
+# Ancestors are decoded on this many threads while revert reads the rest of the chain, once a read
+# takes longer than PREFETCH_MIN_READ_TIME seconds. Reads from the page cache are faster than handing
+# the decode to another thread, which then contends with the reads for the GIL.
+PREFETCH_THREADS = 4
+PREFETCH_MIN_READ_TIME = 0.0005
+# Reverts awaited with `Revision.arevert` run on this many threads.
+REVERT_THREADS = 16
+
+_pools: dict[str, ThreadPoolExecutor] = {}
+# a forked worker inherits the pools but not their threads, it starts its own
+os.register_at_fork(after_in_child=_pools.clear)
+
+
+def _pool(name: str, threads: int) -> ThreadPoolExecutor:
+    pool = _pools.get(name)
+    if pool is None:
+        pool = _pools.setdefault(
+            name, ThreadPoolExecutor(threads, thread_name_prefix=f"pyt-{name}")
+        )
+    return pool
+
+
+def _prefetch_pool() -> ThreadPoolExecutor:
+    # decodes never wait on anything, so reverts running on the revert pool can't starve it
+    return _pool("prefetch", PREFETCH_THREADS)
+
+
+def _revert_pool() -> ThreadPoolExecutor:
+    return _pool("revert", REVERT_THREADS)
+
+
+def cache_stats() -> dict:
+    """Hit, miss and size counters of the content and revision caches"""
+    return {"content": content_cache.stats, "revision": revision_cache.stats}
+
+
+def is_binary(file: Path) -> bool:
+    """Check whether a file should be revised as raw bytes, because it is large or looks binary"""
+    if file.stat().st_size > BLOCK_DELTA_THRESHOLD:
+        return True
+    with file.open("rb") as f:
+        return b"\0" in f.read(BINARY_SNIFF_SIZE)
+
+
+def read_content(file: Path) -> Content:
+    """Read a file as text, newlines translated, or as raw bytes if it is binary or too large to diff as text"""
+    if not is_binary(file):
+        try:
+            with file.open("r") as f:
+                return f.read()
+        except UnicodeDecodeError:
+            pass
+    return file.read_bytes()
+
+
+def content_sha(content: Content) -> str:
+    """The sha of a revision's content, text is hashed utf-8 encoded"""
+    if isinstance(content, str):
+        content = content.encode()
+    return hashlib.sha256(content).hexdigest()
+
+
+def snapshot(content: Content) -> Union[EditsList, BlockDelta]:
+    """Create the delta rebuilding content from nothing, for keyframes"""
+    if isinstance(content, str):
+        return EditsList.snapshot(content)
+    return BlockDelta.snapshot(content)
+
+
+def compute_delta(
+    original: Content,
+    actual: Content,
+    granularity: Granularity = DEFAULT_GRANULARITY,
+    bounded: bool = False,
+) -> Optional[Union[EditsList, BlockDelta]]:
+    """Compute the delta from original to actual, a block delta for bytes.
+
+    Returns None if one is text and the other isn't. If bounded is set, None is also returned as soon
+    as more chunks of original are deleted than actual has, or the edits would encode larger than a
+    snapshot of actual, which is then the better choice.
+    """
+    if isinstance(original, str) != isinstance(actual, str):
+        return None
+    with instrument.timer("delta.compute"):
+        if isinstance(actual, str):
+            # at most every chunk of actual is inserted, so the rest of the bound is deletions, while
+            # a rewrite of every chunk stays within it but is caught by the size of its edits
+            max_distance = 2 * len(split_chunks(actual, granularity)) if bounded else None
+            # about what the snapshot of actual takes, a single edit holding all of it
+            max_size = EDIT_RECORD_SIZE + len(actual) if bounded else None
+            return EditsList.from_strings(
+                original,
+                actual,
+                granularity=granularity,
+                max_distance=max_distance,
+                max_size=max_size,
+            )
+        return BlockDelta.compute(original, actual)
+
 
 @dataclass
 class Revision:
@@ -18,108 +158,314 @@ class Revision:
 
     sha: int
     previous_sha: Optional[int]
-    edits: EditsList
+    edits: Union[EditsList, BlockDelta]
     path: Path
+    keyframe: bool = False
+    chain_length: int = 0
+    chain_size: int = 0
 
     def __post_init__(self):
         self._root = None
 
-    @property
-    def asdict(self):
-        return {
-            "sha": self.sha,
-            "edits": self.edits.pickle(),
-            "previous_sha": self.previous_sha,
-            "path": str(self.path),
-        }
-
     @classmethod
     def load(cls, file: Path):
-        """Load the revision from a file"""
-        with file.open("r") as f:
-            data = json.loads(f.read())
+        """Load the revision from a file, in the binary delta format or the legacy JSON one"""
+        cached = revision_cache.get(file)
+        if cached is not None:
+            return cached
+        return cls._decode(file, cls._read(file))
+
+    @staticmethod
+    def _read(file: Path) -> bytes:
+        try:
+            return ObjectStore.open(file.parent).get(file.name)
+        except KeyError:
+            if not file.is_file():
+                raise FileNotFoundError(f"Cant find revision {file}")
+            with file.open("rb") as f:
+                return f.read()
+
+    @classmethod
+    def _decode(cls, file: Path, payload: bytes):
+        with instrument.timer("revision.decode"):
+            if is_delta(payload):
+                data = decode_revision(payload)
+            else:
+                data = json.loads(payload)
+                data["path"] = Path(data["path"])
+                data["edits"] = EditsList.unpickle(data["edits"])
+
+        obj = cls(**data)
+        obj._root = file.parent
+        revision_cache.put(file, obj)
+        return obj
 
-        data["path"] = Path(data["path"])
-        data["edits"] = EditsList.unpickle(data["edits"])
+    @classmethod
+    def resolve(cls, root: Path, prefix: str):
+        """Load the revision of root whose sha starts with prefix, see `ObjectStore.resolve`"""
+        return cls.load(root / ObjectStore.open(root).resolve(prefix))
+
+    def encode(self) -> bytes:
+        """Encode the revision in the binary delta format, see `pyt.deltafile`"""
+        return encode_revision(
+            self.sha,
+            self.previous_sha,
+            self.path,
+            self.edits,
+            keyframe=self.keyframe,
+            chain_length=self.chain_length,
+            chain_size=self.chain_size,
+        )
 
-        return cls(**data)
+    def save(self, root: Path = Path("."), replace: bool = False):
+        """Save the revisions to a file.
 
-    def save(self, root: Path = Path(".")):
-        """Save the revisions to a file"""
+        A file can go back to earlier content, whose revision is then already stored. It is kept,
+        unless replace is set, as rewriting it would change the chain of every revision after it.
+        """
         self._root = root
-        payload = json.dumps(self.asdict, separators=(",", ":"))
-
-        with (root / self.sha).open("w") as f:
-            f.write(payload)
+        if ObjectStore.open(root).put(self.sha, self.encode(), replace=replace):
+            revision_cache.put(root / self.sha, self)
 
-    def new(self):
+    def new(
+        self,
+        granularity: Granularity = DEFAULT_GRANULARITY,
+        policy: KeyframePolicy = DEFAULT_KEYFRAME_POLICY,
+    ):
         """Create a new revision"""
 
-        if not (self._root / self.sha).exists():
+        if self.sha not in ObjectStore.open(self._root):
             raise FileNotFoundError(
                 f"Cant find revision {self.sha:.8} to apply edits to."
             )
 
-        return Revision.from_filename(self.path, self)
+        return Revision.from_filename(
+            self.path, self, granularity=granularity, policy=policy
+        )
 
     def revert(self, reversion: Optional["Revision"] = None):
-        """Revert to the previous revision"""
+        """Revert to the previous revision, replaying the deltas since the nearest keyframe or cached content"""
+        target = reversion or self
+        cached = content_cache.get(target.sha)
+        if cached is not None:
+            return cached
+
         original = ""
-        first_revision = reversion or self
-        revisions = [first_revision]
-        while first_revision.previous_sha:
-            if first_revision._root is None:
+        revisions: list[Union[Revision, Future]] = [target]
+        previous_sha, keyframe, root = target.previous_sha, target.keyframe, target._root
+        seen = {target.sha}
+        while previous_sha and not keyframe and root is not None:
+            if previous_sha in seen:
+                raise ValueError(
+                    f"The chain of revision {target.sha:.8} loops back to {previous_sha:.8}"
+                )
+            seen.add(previous_sha)
+            cached = content_cache.get(previous_sha)
+            if cached is not None:
+                original = cached
                 break
-            first_revision = Revision.load(
-                first_revision._root / first_revision.previous_sha
-            )
-            revisions.append(first_revision)
+
+            file = root / previous_sha
+            revision = revision_cache.get(file)
+            if revision is None:
+                started = time.perf_counter()
+                payload = Revision._read(file)
+                if is_delta(payload) and time.perf_counter() - started > PREFETCH_MIN_READ_TIME:
+                    # the header names the next ancestor, so it is read while this one's edits
+                    # are decoded on the prefetch pool
+                    header = decode_header(payload)
+                    revisions.append(_prefetch_pool().submit(Revision._decode, file, payload))
+                    previous_sha, keyframe = header["previous_sha"], header["keyframe"]
+                    continue
+                revision = Revision._decode(file, payload)
+            revisions.append(revision)
+            previous_sha, keyframe = revision.previous_sha, revision.keyframe
 
         log.debug(
             f"Reverting {self.sha:.6} to {self.previous_sha or '_root_':.6}, about to apply {len(revisions)} edits"
         )
+        instrument.count("revert.replayed", len(revisions))
         while revisions:
             rev = revisions.pop()
-            original = rev.edits.apply(original)
+            if isinstance(rev, Future):
+                rev = rev.result()
+            with instrument.timer("delta.apply"):
+                original = rev.edits.apply(original)
 
+        content_cache.put(target.sha, original)
         return original
 
+    async def arevert(self, reversion: Optional["Revision"] = None):
+        """`revert` without blocking the event loop, on a thread of its own.
+
+        Reverting many files at once with `asyncio.gather` reads their chains concurrently, so one
+        file's I/O overlaps with another's decoding and delta application.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_revert_pool(), self.revert, reversion)
+
     @classmethod
     def from_filename(
         cls,
         file: Path,
         previous_revision: Optional["Revision"] = None,
         root: Optional[Path] = None,
+        granularity: Granularity = DEFAULT_GRANULARITY,
+        policy: KeyframePolicy = DEFAULT_KEYFRAME_POLICY,
+        planner: Optional["Planner"] = None,
     ):
-        """Create a revision from a filename"""
+        """Create a revision from a filename, binary and large files are revised as bytes"""
         if not file.exists():
             raise FileNotFoundError(f"File {file} does not exist")
 
-        with file.open("r") as f:
-            actual = f.read()
+        actual = read_content(file)
 
-        sha = hashlib.sha256(actual.encode()).hexdigest()
+        return cls.from_content(
+            actual,
+            file,
+            previous_revision,
+            root,
+            granularity=granularity,
+            policy=policy,
+            planner=planner,
+        )
+
+    @classmethod
+    def from_content(
+        cls,
+        actual: Content,
+        file: Path,
+        previous_revision: Optional["Revision"] = None,
+        root: Optional[Path] = None,
+        granularity: Granularity = DEFAULT_GRANULARITY,
+        policy: KeyframePolicy = DEFAULT_KEYFRAME_POLICY,
+        planner: Optional["Planner"] = None,
+        original: Optional[Content] = None,
+    ):
+        """Create a revision of file from its already read content.
+
+        With a planner, see `pyt.planner`, the delta is computed the way its similarity estimate
+        calls for rather than always exactly. Pass original, the previous revision's content, if
+        it is at hand, so it isn't reverted again.
+        """
+        sha = content_sha(actual)
 
         # see if the file has been modified
         if previous_revision and sha == previous_revision.sha:
             return previous_revision
 
+        # the next revision diffs against this content, keep it rather than replaying the chain again
+        content_cache.put(sha, actual)
+
         if previous_revision:
-            original = previous_revision.revert()
-            obj = cls(
-                sha,
-                previous_revision.sha,
-                EditsList.from_strings(original, actual),
-                file,
-            )
+            if original is None:
+                original = previous_revision.revert()
+            if planner is not None:
+                edits = planner.delta(original, actual, file, granularity=granularity)
+            else:
+                edits = compute_delta(original, actual, granularity=granularity, bounded=True)
+            chain_length = previous_revision.chain_length + 1
+            if edits is not None:
+                size = len(edits.encode())
+                chain_size = previous_revision.chain_size + size
+                if size > len(snapshot(actual).encode()):
+                    edits = None
+
+            # a file turning binary or back into text, or rewritten enough that the delta would be
+            # larger than the file, starts over from a snapshot
+            if edits is None or policy.wants_keyframe(chain_length, chain_size):
+                keyframe = snapshot(actual)
+                if planner is not None:
+                    planner.record_snapshot(len(keyframe.encode()))
+                obj = cls(
+                    sha,
+                    previous_revision.sha,
+                    keyframe,
+                    file,
+                    keyframe=True,
+                )
+            else:
+                obj = cls(
+                    sha,
+                    previous_revision.sha,
+                    edits,
+                    file,
+                    chain_length=chain_length,
+                    chain_size=chain_size,
+                )
             obj._root = root or previous_revision._root
             return obj
         else:
-            obj = cls(sha, None, EditsList.from_strings("", actual), file)
+            obj = cls(sha, None, snapshot(actual), file, keyframe=True)
             obj._root = root or Path(".")
             return obj
 
 
+def repack_keyframes(
+    root: Path, policy: KeyframePolicy = DEFAULT_KEYFRAME_POLICY
+) -> list[Revision]:
+    """Rewrite the revisions saved in root so their chains follow policy, returning the rewritten ones.
+
+    Every chain is replayed once from its root revision, revisions the policy picks become snapshots,
+    and keyframes it no longer wants are turned back into deltas against their parent.
+    """
+    store = ObjectStore.open(root)
+    revisions = {}
+    for sha in store:
+        if is_delta(store.get(sha)):
+            revisions[sha] = Revision.load(root / sha)
+
+    children = {}
+    for revision in revisions.values():
+        children.setdefault(revision.previous_sha, []).append(revision)
+
+    # only chains starting from a snapshot can be replayed
+    stack = [
+        (revision, "", 0, 0)
+        for revision in revisions.values()
+        if revision.previous_sha not in revisions
+        and (revision.previous_sha is None or revision.keyframe)
+    ]
+    rewritten = []
+    while stack:
+        revision, parent_content, parent_length, parent_size = stack.pop()
+        if revision.keyframe:
+            content = revision.edits.apply("")
+        else:
+            content = revision.edits.apply(parent_content)
+
+        if revision.previous_sha not in revisions:
+            delta, keyframe, length, size = revision.edits, True, 0, 0
+        else:
+            if revision.keyframe:
+                delta = compute_delta(parent_content, content)
+            else:
+                delta = revision.edits
+            length = parent_length + 1
+            if delta is not None:
+                size = parent_size + len(delta.encode())
+            keyframe = delta is None or policy.wants_keyframe(length, size)
+            if keyframe:
+                delta, length, size = snapshot(content), 0, 0
+
+        if (keyframe, length, size) != (
+            revision.keyframe,
+            revision.chain_length,
+            revision.chain_size,
+        ):
+            revision.edits = delta
+            revision.keyframe = keyframe
+            revision.chain_length = length
+            revision.chain_size = size
+            revision.save(root, replace=True)
+            rewritten.append(revision)
+
+        for child in children.get(revision.sha, []):
+            stack.append((child, content, length, size))
+
+    return rewritten
+
+
 def main():
     # ogging.basicConfig(level=logging.INFO)
 
@@ -0,0 +1,266 @@
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+from . import instrument
+from .objectstore import ObjectStore
+from .planner import Plan, Planner, save_plans
+from .revfile import Revision, is_binary, read_content
+from .transaction import Transaction
+from .tree import diff_trees, load_manifest, tree_store, write_tree
+
+log = logging.getLogger(__name__)
+
+# Files are hashed this many characters at a time, so memory stays flat whatever their size.
+HASH_CHUNK_SIZE = 1 << 20
+# Files modified this close to the start of a scan may change again within the same mtime tick,
+# their stat cache entries are not trusted, as with git's "racily clean" index entries.
+RACY_MARGIN_NS = 1_000_000_000
+
+
+def list_files(path: Path) -> list[Path]:
+    """List the files of a project relative to it, in a stable order and without the .pyt folder"""
+    return [Path(f) for f, _ in walk_files(path)]
+
+
+def walk_files(path: Path) -> list[tuple[str, os.stat_result]]:
+    """List the posix paths of a project's files relative to it along with their stat, sorted and without the .pyt folder.
+
+    Directory entries tell files from folders without a stat call, so every file is stat'ed only once.
+    """
+    files = []
+    stack = [""]
+    while stack:
+        folder = stack.pop()
+        with os.scandir(os.path.join(path, folder)) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if folder or entry.name != ".pyt":
+                        stack.append(f"{folder}{entry.name}/")
+                elif entry.is_file():
+                    files.append((folder + entry.name, entry.stat()))
+
+    files.sort(key=lambda file: file[0])
+    return files
+
+
+def _stat_key(stat: os.stat_result) -> list[int]:
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def load_stat_cache(root: Path) -> dict[str, list]:
+    """Load the (size, mtime_ns, inode, sha) of every file as of the last scan"""
+    cache_path = root / "statcache.json"
+    if not cache_path.exists():
+        return {}
+    with open(cache_path, "r") as file:
+        return json.load(file)
+
+
+def save_stat_cache(
+    root: Path, entries: dict[str, list], started_ns: int, previous: Optional[dict] = None
+):
+    """Save the stat cache, leaving out the entries modified too close to started_ns to be trusted.
+
+    Nothing is written if the trusted entries are the same as previous, the cache as it was loaded.
+    """
+    trusted = {
+        p: entry
+        for p, entry in entries.items()
+        if entry[1] < started_ns - RACY_MARGIN_NS
+    }
+    if trusted == previous:
+        return
+    with open(root / "statcache.json", "w") as file:
+        file.write(json.dumps(trusted))
+
+
+def _hash_bytes(file: Path) -> str:
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def hash_file(file: Path) -> str:
+    """Hash a file as its revision's sha.
+
+    The file is streamed through in HASH_CHUNK_SIZE pieces rather than read whole. Text revision shas
+    are of the decoded text, newlines translated, so text files are read in text mode, and binary
+    or large ones, revised as bytes, are hashed raw.
+    """
+    with instrument.timer("hash"):
+        if is_binary(file):
+            return _hash_bytes(file)
+
+        sha = hashlib.sha256()
+        try:
+            with open(file, "r") as f:
+                while chunk := f.read(HASH_CHUNK_SIZE):
+                    sha.update(chunk.encode())
+        except UnicodeDecodeError:
+            return _hash_bytes(file)
+        return sha.hexdigest()
+
+
+_planner: Optional[Planner] = None
+
+
+def build_revision(
+    project: Path, file: Path, previous_sha: Optional[str], plan: bool = False
+) -> tuple[str, bytes, list[Plan]]:
+    """Create the revision of a project file against previous_sha, returning its sha and encoded payload.
+
+    Runs in worker processes, so only the payload travels back rather than the whole EditsList. With
+    plan set, the delta goes through the process' `Planner`, and its plan is returned too.
+    """
+    global _planner
+    root = project / ".pyt"
+    content = read_content(project / file)
+
+    planner = None
+    if plan:
+        if _planner is None:
+            _planner = Planner()
+        planner = _planner
+        planner.plans.clear()
+
+    previous = None
+    if previous_sha is not None:
+        previous = Revision.load(root / previous_sha)
+    revision = Revision.from_content(content, file, previous, root=root, planner=planner)
+    return revision.sha, revision.encode(), list(planner.plans) if planner else []
+
+
+def _build_revision_in_worker(*args) -> tuple[str, bytes, list[Plan], dict]:
+    """`build_revision` in a worker process, also sending back what `pyt.instrument` recorded"""
+    return (*build_revision(*args), instrument.collect())
+
+
+def ordered_map(
+    executor: Optional[Executor], fn: Callable, *iterables: Iterable, window: int
+) -> Iterator:
+    """Like `Executor.map`, but with at most window tasks in flight so results never pile up in memory.
+
+    Results are yielded in submission order. Without an executor the calls are made inline.
+    """
+    if executor is None:
+        yield from map(fn, *iterables)
+        return
+
+    pending = deque()
+    for args in zip(*iterables):
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def scan_project(path: Path, jobs: Optional[int] = None, plan: bool = False) -> dict[str, str]:
+    """Record a revision of every file of the project that changed since the last scan.
+
+    Files are hashed on a pool of jobs threads, hashlib releases the GIL while it works, and the
+    deltas of the changed ones are computed on a pool of jobs processes. Changed files are found by
+    diffing the project's tree against the last scan's, see `pyt.tree`. Revisions are staged in file
+    order and committed as one `pyt.transaction.Transaction`, which points the manifest at the new
+    tree last, so the result doesn't depend on which worker finishes first and a crashed scan
+    leaves the last one in place.
+    With plan set, deltas go through a `pyt.planner.Planner` and its plans are appended to plans.jsonl.
+
+    Returns:
+        dict[str, str]: The files of the new tree, mapping every file's posix path to its revision sha.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    started_ns = time.time_ns()
+    root = path / ".pyt"
+    store = ObjectStore.open(root)
+    with instrument.timer("scan.walk"):
+        files = walk_files(path)
+
+    # only the files that differ from the last scan's tree get a new revision
+    trees = tree_store(root)
+    old_tree = load_manifest(root)
+
+    # files whose size, mtime and inode didn't change since the last scan aren't hashed again
+    stat_cache = load_stat_cache(root)
+    new_stat_cache = {}
+    known = {}
+    to_hash = []
+    for p, stat in files:
+        key = _stat_key(stat)
+        cached = stat_cache.get(p)
+        if cached is not None and cached[:3] == key:
+            known[p] = cached[3]
+        else:
+            to_hash.append(p)
+        new_stat_cache[p] = key
+
+    new_files = {}
+    changed = []
+    with instrument.timer("scan.hash"), (
+        ThreadPoolExecutor(jobs) if jobs > 1 and to_hash else nullcontext()
+    ) as threads:
+        hashed = ordered_map(threads, hash_file, [path / p for p in to_hash], window=jobs * 4)
+        hashed = dict(zip(to_hash, hashed))
+    log.debug(f"Hashed {len(to_hash)} of {len(files)} files")
+    instrument.count("scan.files", len(files))
+    instrument.count("scan.hashed", len(to_hash))
+
+    for p, _ in files:
+        sha = known[p] if p in known else hashed[p]
+        new_stat_cache[p].append(sha)
+        new_files[p] = sha
+
+    with Transaction(root, files=new_files) as transaction:
+        # folders whose tree sha didn't change are skipped without reading any of their trees
+        with instrument.timer("scan.diff"):
+            new_tree = write_tree(trees, new_files, old_tree)
+            for p, previous_sha, sha in diff_trees(trees, old_tree, new_tree):
+                if sha is None or sha in store:
+                    continue
+
+                # each revision is the delta from the file's previous version, found through the old tree
+                if previous_sha is not None and previous_sha not in store:
+                    previous_sha = None
+                changed.append((Path(p), previous_sha))
+
+        log.debug(f"{len(changed)} of {len(files)} files changed")
+        instrument.count("scan.changed", len(changed))
+        processes = ProcessPoolExecutor(jobs) if jobs > 1 and len(changed) > 1 else None
+        with instrument.timer("scan.revisions"), processes or nullcontext():
+            results = ordered_map(
+                processes,
+                _build_revision_in_worker if processes is not None else build_revision,
+                [path] * len(changed),
+                [f for f, _ in changed],
+                [previous_sha for _, previous_sha in changed],
+                [plan] * len(changed),
+                window=jobs * 2,
+            )
+            plans = []
+            for (f, _), (sha, payload, file_plans, *recorded) in zip(changed, results):
+                if recorded:
+                    instrument.merge(recorded[0])
+                plans.extend(file_plans)
+                transaction.stage_encoded(f.as_posix(), sha, payload)
+                if sha != new_stat_cache[f.as_posix()][3]:
+                    # it changed again since it was hashed, hash it on the next scan
+                    new_stat_cache.pop(f.as_posix())
+
+        # the revisions and trees are written as one pack each, then the manifest is swapped
+        with instrument.timer("scan.manifest"):
+            transaction.commit()
+
+    save_stat_cache(root, new_stat_cache, started_ns, previous=stat_cache)
+    save_plans(root, plans)
+
+    return transaction.files
@@ -0,0 +1,119 @@
+"""Commit the revisions of many files at once, atomically.
+
+A `Transaction` stages revisions in memory. Committing it writes all of them, and the trees of the
+new manifest, as one pack per object store, each fsynced once, and only then points the manifest at
+the new root tree with an atomic rename. A crash before the rename leaves the last commit in place
+with, at worst, a pack nothing refers to; after it, everything the manifest refers to is on disk.
+
+    with Transaction(project / ".pyt") as transaction:
+        for revision in revisions:
+            transaction.stage(revision)
+        transaction.remove("old.txt")
+    transaction.tree  # the new root tree sha
+
+Leaving the block with an exception commits nothing.
+"""
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Optional
+
+from . import instrument
+from .objectstore import ObjectStore
+from .revfile import Revision, revision_cache
+from .tree import MANIFEST, iter_files, load_manifest, save_manifest, tree_store, write_tree
+
+
+class TransactionError(RuntimeError):
+    """Raised when a transaction is used after it was committed or aborted"""
+
+
+class Transaction:
+    """Stage revisions and commit them in one go, see the module docstring.
+
+    Args:
+        root (Path): The project's .pyt folder.
+        files (dict[str, str], optional): The files of the current manifest, mapping posix paths to
+            revision shas, if they are already at hand. They are read from the manifest otherwise.
+    """
+
+    def __init__(self, root: Path, files: Optional[dict[str, str]] = None):
+        self.root = root
+        self.store = ObjectStore.open(root)
+        self.trees = tree_store(root)
+        self.base = load_manifest(root)
+        if files is None:
+            files = dict(iter_files(self.trees, self.base)) if self.base is not None else {}
+        # the files the manifest will list once committed, staging and removing edit it
+        self.files = dict(files)
+        self.tree: Optional[str] = None
+        self._revisions: list[Revision] = []
+        self._staged = 0
+        self._batches: Optional[ExitStack] = None
+        self._done = False
+
+    def begin(self) -> "Transaction":
+        """Hold every object put in the store or the tree store in memory until the commit"""
+        if self._done:
+            raise TransactionError("The transaction is already over")
+        if self._batches is None:
+            self._batches = ExitStack()
+            self._batches.enter_context(self.store.batch())
+            self._batches.enter_context(self.trees.batch())
+        return self
+
+    def stage(self, revision: Revision, path: Optional[str] = None):
+        """Add a revision, listing it as the file at path, its own path by default"""
+        self.begin()
+        # an already stored revision of the same content is kept, see `Revision.save`
+        if self.store.put(revision.sha, revision.encode()):
+            self._revisions.append(revision)
+        self.files[path if path is not None else revision.path.as_posix()] = revision.sha
+        self._staged += 1
+
+    def stage_encoded(self, path: str, sha: str, payload: bytes):
+        """Add an already encoded revision, such as one built in a worker process"""
+        self.begin()
+        self.store.put(sha, payload)
+        self.files[path] = sha
+        self._staged += 1
+
+    def remove(self, path: str) -> bool:
+        """Drop the file at path from the manifest, returning whether it was listed"""
+        return self.files.pop(path, None) is not None
+
+    def commit(self) -> str:
+        """Write the staged revisions and the new trees, then swap the manifest, returning the new
+        root tree sha. The manifest is left alone if the tree didn't change."""
+        self.begin()
+        with instrument.timer("transaction.commit"):
+            with self._batches:
+                self.tree = write_tree(self.trees, self.files, self.base)
+            self._batches = None
+            if self.tree != self.base or not (self.root / MANIFEST).exists():
+                save_manifest(self.root, self.tree)
+        self._done = True
+
+        for revision in self._revisions:
+            revision._root = self.root
+            revision_cache.put(self.root / revision.sha, revision)
+        instrument.count("transaction.revisions", self._staged)
+        return self.tree
+
+    def abort(self):
+        """Drop everything staged, nothing is written"""
+        if self._batches is not None:
+            # the batches only write when their block ends cleanly
+            self._batches.__exit__(TransactionError, TransactionError("aborted"), None)
+            self._batches = None
+        self._done = True
+
+    def __enter__(self) -> "Transaction":
+        return self.begin()
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._done:
+            return
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
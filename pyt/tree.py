@@ -0,0 +1,184 @@
+"""The project manifest as a Merkle tree of folders.
+
+A tree object lists one folder's entries sorted by name, each the revision sha of a file or the tree
+sha of a subfolder, and is stored under the sha256 of its encoding. Trees live in their own object
+store, `.pyt/trees`, so they never share a key with a revision whose content happens to be the same
+bytes. `.pyt/manifest` holds the sha of the project's root tree.
+
+A folder whose files didn't change encodes to the same bytes and so the same sha, so saving a tree
+only writes the folders that changed, and `diff_trees` skips every subtree whose sha is the same on
+both sides, costing time in proportion to the change rather than to the size of the project.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+from .objectstore import ObjectStore, fsync_dir
+
+TREES_DIR = "trees"
+MANIFEST = "manifest"
+# The flat `{path: sha}` manifest scans used to write, migrated to a tree when first read.
+LEGACY_MANIFEST = "manifest.json"
+
+BLOB = "blob"
+TREE = "tree"
+
+# entry name to (kind, sha)
+Tree = dict[str, tuple[str, str]]
+
+
+def tree_store(root: Path) -> ObjectStore:
+    """The store of the tree objects of the .pyt folder root"""
+    return ObjectStore.open(root / TREES_DIR)
+
+
+def encode_tree(tree: Tree) -> bytes:
+    return json.dumps(
+        [[name, kind, sha] for name, (kind, sha) in sorted(tree.items())], separators=(",", ":")
+    ).encode()
+
+
+def decode_tree(data: bytes) -> Tree:
+    return {name: (kind, sha) for name, kind, sha in json.loads(data)}
+
+
+def read_tree(store: ObjectStore, sha: str) -> Tree:
+    return decode_tree(store.get(sha))
+
+
+def write_tree(store: ObjectStore, files: dict[str, str], old: Optional[str] = None) -> str:
+    """Save the trees of files, mapping posix paths to revision shas, returning the root tree's sha.
+
+    Every tree is hashed in memory first, then only trees that differ from their counterpart in
+    the old tree, if given, are written, so an unchanged folder costs no I/O at all.
+    """
+    nested: dict = {}
+    for path, sha in files.items():
+        *folders, name = path.split("/")
+        node = nested
+        for folder in folders:
+            node = node.setdefault(folder, {})
+        node[name] = sha
+
+    def hash_node(node: dict) -> tuple[str, bytes, dict]:
+        subtrees = {name: hash_node(child) for name, child in node.items() if isinstance(child, dict)}
+        tree = {
+            name: (TREE, subtrees[name][0]) if name in subtrees else (BLOB, child)
+            for name, child in node.items()
+        }
+        data = encode_tree(tree)
+        return hashlib.sha256(data).hexdigest(), data, subtrees
+
+    def write(hashed: tuple[str, bytes, dict], old: Optional[str]):
+        sha, data, subtrees = hashed
+        if sha == old:
+            return
+        old_tree = read_tree(store, old) if old is not None and old in store else {}
+        for name, subtree in subtrees.items():
+            kind, old_sha = old_tree.get(name, (None, None))
+            write(subtree, old_sha if kind == TREE else None)
+        store.put(sha, data)
+
+    root = hash_node(nested)
+    write(root, old)
+    return root[0]
+
+
+def iter_files(store: ObjectStore, sha: str, prefix: str = "") -> Iterator[tuple[str, str]]:
+    """Yield the posix path and revision sha of every file under the tree sha, sorted by path"""
+    for name, (kind, entry_sha) in sorted(read_tree(store, sha).items()):
+        if kind == TREE:
+            yield from iter_files(store, entry_sha, f"{prefix}{name}/")
+        else:
+            yield prefix + name, entry_sha
+
+
+def lookup(store: ObjectStore, sha: str, path: str) -> Optional[str]:
+    """The revision sha of the file at path under the tree sha, None if there is no such file"""
+    *folders, name = path.split("/")
+    for folder in folders:
+        entry = read_tree(store, sha).get(folder)
+        if entry is None or entry[0] != TREE:
+            return None
+        sha = entry[1]
+    entry = read_tree(store, sha).get(name)
+    if entry is None or entry[0] != BLOB:
+        return None
+    return entry[1]
+
+
+def diff_trees(
+    store: ObjectStore, old: Optional[str], new: Optional[str], prefix: str = ""
+) -> Iterator[tuple[str, Optional[str], Optional[str]]]:
+    """Yield the posix path, old and new revision sha of every file that differs between two trees.
+
+    Files only in new have no old sha and files only in old no new one. Either tree can be None, for
+    an empty project. Subtrees with the same sha on both sides are never read.
+    """
+    if old == new:
+        return
+    old_tree = read_tree(store, old) if old is not None else {}
+    new_tree = read_tree(store, new) if new is not None else {}
+
+    for name in sorted(old_tree.keys() | new_tree.keys()):
+        old_kind, old_sha = old_tree.get(name, (None, None))
+        new_kind, new_sha = new_tree.get(name, (None, None))
+        if old_kind == new_kind and old_sha == new_sha:
+            continue
+
+        path = prefix + name
+        if old_kind == new_kind == TREE:
+            yield from diff_trees(store, old_sha, new_sha, f"{path}/")
+            continue
+
+        # a file replaced by a folder or the other way round, or either one added or removed
+        if old_kind == BLOB:
+            yield path, old_sha, new_sha if new_kind == BLOB else None
+        elif old_kind == TREE:
+            yield from diff_trees(store, old_sha, None, f"{path}/")
+        if new_kind == TREE:
+            yield from diff_trees(store, None, new_sha, f"{path}/")
+        elif new_kind == BLOB and old_kind != BLOB:
+            yield path, None, new_sha
+
+
+def load_manifest(root: Path) -> Optional[str]:
+    """The root tree sha of the last scan of the .pyt folder root, None if it was never scanned.
+
+    A legacy flat manifest.json is migrated to trees, and removed once the new manifest is saved.
+    """
+    manifest_path = root / MANIFEST
+    if manifest_path.exists():
+        return manifest_path.read_text().strip() or None
+
+    legacy_path = root / LEGACY_MANIFEST
+    if legacy_path.exists():
+        with open(legacy_path, "r") as file:
+            return write_tree(tree_store(root), json.load(file))
+    return None
+
+
+def save_manifest(root: Path, sha: str):
+    """Point the manifest at the root tree sha, replacing it atomically and durably"""
+    manifest_path = root / MANIFEST
+    tmp = manifest_path.with_name(manifest_path.name + ".tmp")
+    with tmp.open("w") as file:
+        file.write(sha + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, manifest_path)
+    fsync_dir(root)
+
+    legacy_path = root / LEGACY_MANIFEST
+    if legacy_path.exists():
+        legacy_path.unlink()
+
+
+def load_files(root: Path) -> dict[str, str]:
+    """The posix path and revision sha of every file as of the last scan of the .pyt folder root"""
+    sha = load_manifest(root)
+    if sha is None:
+        return {}
+    return dict(iter_files(tree_store(root), sha))
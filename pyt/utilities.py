@@ -1,26 +1,101 @@
-def most_matching_sha(shas: list[str], sha: str):
+from bisect import bisect_left, insort
+from typing import Iterable, Optional, Union
+
+
+class AmbiguousPrefixError(LookupError):
+    """A sha prefix matches more than one sha"""
+
+    def __init__(self, prefix: str, matches: list[str]):
+        self.prefix = prefix
+        self.matches = matches
+        super().__init__(
+            f"{prefix} is ambiguous, it matches {', '.join(m[:12] for m in matches[:5])}"
+            + (f" and {len(matches) - 5} more" if len(matches) > 5 else "")
+        )
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+
+class ShaIndex:
+    """Shas kept sorted, so a prefix is resolved with a binary search rather than a scan.
+
+    >>> index = ShaIndex(["abc123", "abc456", "abd789"])
+    >>> index.resolve("abc4"), index.matches("abc")
+    ('abc456', ['abc123', 'abc456'])
+    """
+
+    def __init__(self, shas: Iterable[Optional[str]] = ()):
+        self._shas = sorted({s for s in shas if s})
+
+    def __len__(self) -> int:
+        return len(self._shas)
+
+    def __iter__(self):
+        return iter(self._shas)
+
+    def __contains__(self, sha: str) -> bool:
+        i = bisect_left(self._shas, sha)
+        return i < len(self._shas) and self._shas[i] == sha
+
+    def add(self, sha: str):
+        if sha not in self:
+            insort(self._shas, sha)
+
+    def matches(self, prefix: str) -> list[str]:
+        """Every sha starting with prefix, sorted"""
+        i = bisect_left(self._shas, prefix)
+        found = []
+        while i < len(self._shas) and self._shas[i].startswith(prefix):
+            found.append(self._shas[i])
+            i += 1
+        return found
+
+    def resolve(self, prefix: str) -> str:
+        """The one sha starting with prefix, raising KeyError if there is none and
+        AmbiguousPrefixError if there are several"""
+        found = self.matches(prefix)
+        if not found:
+            raise KeyError(prefix)
+        if len(found) > 1:
+            raise AmbiguousPrefixError(prefix, found)
+        return found[0]
+
+    def closest(self, sha: str) -> Optional[tuple[str, int]]:
+        """The sha sharing the most leading characters with sha, and how many, None if the index is empty.
+
+        In sorted order it is one of the two shas around where sha would be inserted.
+        """
+        i = bisect_left(self._shas, sha)
+        candidates = self._shas[max(i - 1, 0) : i + 1]
+        if not candidates:
+            return None
+        return max(((s, common_prefix_length(s, sha)) for s in candidates), key=lambda c: c[1])
+
+
+def most_matching_sha(shas: Union[ShaIndex, Iterable[Optional[str]]], sha: str) -> Optional[str]:
     """Matches the most similar sha by number of matching leading characters.
-    If less than 3 characters match for any sha, None is returned.
+    If less than 3 characters match for any sha, or there are none, None is returned.
+
+    Pass a `ShaIndex` built once to look up many shas in O(log n) each, other iterables are scanned.
 
     Such as:
     >>> most_matching_sha(["abc123", "abc456", "abc789"], "abc456")
-    "abc456"
+    'abc456'
     """
-    matching = {}
-    for s in shas:
-        if s is None:
-            continue
-        matching[s] = 0
-        for i in range(len(s)):
-            if s[i] == sha[i]:
-                matching[s] += 1
-            else:
-                break
-
-    max_matching = max(matching.values())
-    if max_matching < 3:
+    if isinstance(shas, ShaIndex):
+        closest = shas.closest(sha)
+    else:
+        closest = max(
+            ((s, common_prefix_length(s, sha)) for s in shas if s),
+            key=lambda c: c[1],
+            default=None,
+        )
+    if closest is None or closest[1] < 3:
         return None
-
-    for s, v in matching.items():
-        if v == max_matching:
-            return s
+    return closest[0]
@@ -0,0 +1,287 @@
+"""Record revisions as files change, from Linux inotify events, rather than rescanning the project.
+
+`Watcher` syncs the project with one `scan_project`, then watches every folder of it. Events are
+collected until DEBOUNCE seconds pass without one, or MAX_DELAY seconds after the first, so an
+editor's burst of writes to a file ends up as one revision. Only the touched files are read then,
+and each file's latest content is kept in memory so its next delta is computed without replaying
+its history. The revisions of a batch are committed together, see `pyt.transaction`.
+
+If the kernel drops events, the queue overflowed, the whole project is scanned again.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from .editslist import Granularity
+from .objectstore import ObjectStore
+from .revfile import (
+    DEFAULT_GRANULARITY,
+    DEFAULT_KEYFRAME_POLICY,
+    Content,
+    KeyframePolicy,
+    Revision,
+    read_content,
+)
+from .scan import scan_project
+from .transaction import Transaction
+from .tree import load_manifest
+
+log = logging.getLogger(__name__)
+
+DEBOUNCE = 0.2
+MAX_DELAY = 2.0
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_ONLYDIR
+)
+
+_EVENT = struct.Struct("iIII")
+_READ_SIZE = 64 << 10
+
+
+class Event(NamedTuple):
+    wd: int
+    mask: int
+    cookie: int
+    name: str
+
+
+class Inotify:
+    """A minimal inotify instance, through libc with ctypes"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: Path, mask: int = WATCH_MASK) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code), str(path))
+        return wd
+
+    def read(self, timeout: Optional[float] = None) -> list[Event]:
+        """Wait up to timeout seconds for events, returning every one that is queued"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, _READ_SIZE)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(buf):
+                wd, mask, cookie, length = _EVENT.unpack_from(buf, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(buf[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                events.append(Event(wd, mask, cookie, name))
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Watcher:
+    """Keeps the revisions of a project up to date as its files change, see the module docstring"""
+
+    def __init__(
+        self,
+        project: Path,
+        debounce: float = DEBOUNCE,
+        max_delay: float = MAX_DELAY,
+        granularity: Granularity = DEFAULT_GRANULARITY,
+        policy: KeyframePolicy = DEFAULT_KEYFRAME_POLICY,
+    ):
+        self.project = project
+        self.root = project / ".pyt"
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.granularity = granularity
+        self.policy = policy
+
+        self.store = ObjectStore.open(self.root)
+        self.inotify = Inotify()
+        # watch descriptor to the folder's posix path relative to the project, "" for the project
+        self.folders: dict[int, str] = {}
+        # the file's latest revision and its content, once it changed while watched
+        self.latest: dict[str, tuple[Revision, Content]] = {}
+        self.files: dict[str, str] = {}
+        self.tree: Optional[str] = None
+        self.pending: set[str] = set()
+
+    def sync(self):
+        """Scan the whole project, and pick up the manifest it wrote"""
+        self.files = scan_project(self.project)
+        self.tree = load_manifest(self.root)
+        self.latest.clear()
+
+    def start(self):
+        """Watch every folder of the project, then bring its revisions up to date"""
+        self.watch_folder("")
+        self.sync()
+
+    def watch_folder(self, folder: str) -> list[str]:
+        """Watch folder and every folder under it, returning the files found in them"""
+        found = []
+        stack = [folder]
+        while stack:
+            folder = stack.pop()
+            try:
+                wd = self.inotify.add_watch(self.project / folder)
+            except FileNotFoundError:
+                continue
+            self.folders[wd] = folder
+            with os.scandir(self.project / folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if folder or entry.name != ".pyt":
+                            stack.append(f"{folder}{entry.name}/")
+                    elif entry.is_file():
+                        found.append(folder + entry.name)
+        return found
+
+    def handle(self, event: Event):
+        """Mark the files an event touched as pending"""
+        if event.mask & IN_Q_OVERFLOW:
+            log.warning("Missed events, rescanning the project")
+            self.flush()
+            self.sync()
+            return
+        if event.mask & IN_IGNORED:
+            self.folders.pop(event.wd, None)
+            return
+
+        folder = self.folders.get(event.wd)
+        if folder is None or not event.name:
+            return
+        if not folder and event.name == ".pyt":
+            return
+
+        path = folder + event.name
+        if event.mask & IN_ISDIR:
+            if event.mask & (IN_CREATE | IN_MOVED_TO):
+                self.pending.update(self.watch_folder(f"{path}/"))
+            else:
+                # its watch goes away by itself, its files are gone with it
+                self.pending.update(p for p in self.files if p.startswith(f"{path}/"))
+        else:
+            self.pending.add(path)
+
+    def _previous(self, path: str) -> tuple[Optional[Revision], Optional[Content]]:
+        latest = self.latest.get(path)
+        if latest is not None:
+            return latest
+        sha = self.files.get(path)
+        if sha is None or sha not in self.store:
+            return None, None
+        return Revision.load(self.root / sha), None
+
+    def flush(self) -> list[str]:
+        """Record a revision of every pending file that changed, returning their paths.
+
+        They are committed as one `pyt.transaction.Transaction`.
+        """
+        pending, self.pending = sorted(self.pending), set()
+        recorded = []
+        with Transaction(self.root, files=self.files) as transaction:
+            for path in pending:
+                file = self.project / path
+                try:
+                    actual = read_content(file)
+                except (FileNotFoundError, IsADirectoryError):
+                    if transaction.remove(path):
+                        recorded.append(path)
+                    self.latest.pop(path, None)
+                    continue
+
+                previous, original = self._previous(path)
+                revision = Revision.from_content(
+                    actual,
+                    Path(path),
+                    previous,
+                    root=self.root,
+                    granularity=self.granularity,
+                    policy=self.policy,
+                    original=original,
+                )
+                self.latest[path] = (revision, actual)
+                if revision is not previous:
+                    transaction.stage(revision, path)
+                    recorded.append(path)
+
+        self.files = transaction.files
+        self.tree = transaction.tree
+        return recorded
+
+    def run(self, stop: Optional[threading.Event] = None, poll: float = 0.5):
+        """Handle events and flush debounced batches until stop is set, or forever"""
+        first = last = None
+        while stop is None or not stop.is_set():
+            now = time.monotonic()
+            if self.pending:
+                deadline = min(last + self.debounce, first + self.max_delay)
+                if now >= deadline:
+                    recorded = self.flush()
+                    if recorded:
+                        log.info(f"Recorded {len(recorded)} file(s): {', '.join(recorded)}")
+                    first = last = None
+                    continue
+                timeout = deadline - now
+            else:
+                timeout = None
+            if stop is not None:
+                timeout = poll if timeout is None else min(timeout, poll)
+
+            events = self.inotify.read(timeout)
+            if events:
+                last = time.monotonic()
+                for event in events:
+                    self.handle(event)
+                if self.pending and first is None:
+                    first = last
+
+    def close(self):
+        self.inotify.close()
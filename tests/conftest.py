@@ -0,0 +1,11 @@
+import pytest
+
+from pyt import revfile
+
+
+@pytest.fixture(autouse=True)
+def clear_revision_caches():
+    """Every test starts with cold caches, so reverts really replay their chains"""
+    revfile.content_cache.clear()
+    revfile.revision_cache.clear()
+    yield
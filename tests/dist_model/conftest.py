@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# dist_model's modules import each other as top level modules, as when run from its folder
+sys.path.insert(0, str(Path(__file__).parents[2] / "dist_model"))
@@ -0,0 +1,61 @@
+from itertools import combinations
+import random
+
+import click
+import numpy as np
+import pytest
+
+from levendist_dataset_gen import (
+    generate,
+    iter_examples,
+    iter_pairs,
+    load_manifest,
+    nth_pair,
+    save_manifest,
+)
+from pyt.distance import batch_distance
+
+WORDS = ["kitten", "sitting", "saturday", "sunday", "flaw", "lawn", "gumbo", "gambol", "book"]
+
+
+def test_nth_pair():
+    pairs = list(combinations(range(len(WORDS)), 2))
+    assert [nth_pair(len(WORDS), k) for k in range(len(pairs))] == pairs
+
+
+def test_iter_pairs_from_any_start():
+    pairs = list(combinations(WORDS, 2))
+    rng = random.Random(6)
+    for _ in range(50):
+        start = rng.randrange(len(pairs) + 1)
+        stop = rng.randrange(start, len(pairs) + 1)
+        assert list(iter_pairs(WORDS, start, stop)) == pairs[start:stop]
+    assert list(iter_pairs(WORDS, 5, 5)) == []
+
+
+def test_generate_resumes(tmp_path, capsys):
+    manifest = generate(WORDS, tmp_path, total=30, shard_size=8, jobs=1)
+    assert sorted(manifest["shards"], key=int) == ["0", "1", "2", "3"]
+    assert [(e["start"], e["stop"]) for e in manifest["shards"].values()] == sorted(
+        [(0, 8), (8, 16), (16, 24), (24, 30)]
+    )
+    examples = list(iter_examples(tmp_path))
+    pairs = list(combinations(WORDS, 2))[:30]
+    assert [e["distance"] for e in examples] == batch_distance(pairs)
+
+    # as if the run was interrupted before shard 2 was recorded
+    lost = manifest["shards"].pop("2")
+    save_manifest(tmp_path, manifest)
+    (tmp_path / lost["file"]).unlink()
+    capsys.readouterr()
+
+    resumed = generate(WORDS, tmp_path, total=30, shard_size=8, jobs=1)
+    assert "3 shards done, 1 to go" in capsys.readouterr().out
+    assert resumed["shards"]["2"] == lost
+    assert load_manifest(tmp_path) == resumed
+    assert [e["distance"] for e in iter_examples(tmp_path)] == [e["distance"] for e in examples]
+    for new, old in zip(iter_examples(tmp_path), examples):
+        assert np.array_equal(new["string1"], old["string1"])
+
+    with pytest.raises(click.ClickException, match="other parameters"):
+        generate(WORDS, tmp_path, total=30, shard_size=10, jobs=1)
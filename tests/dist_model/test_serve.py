@@ -0,0 +1,98 @@
+import io
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from serve import MicroBatcher, serve_lines
+from utils import OFFSET
+
+
+class FakeModel:
+    """Predicts the number of differing characters, keeping a copy of every batch it was given"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, inputs):
+        first, second = (np.array(x) for x in inputs)
+        with self.lock:
+            self.batches.append((first, second))
+        if self.fail:
+            raise RuntimeError("model exploded")
+        return (first != second).sum(axis=(1, 2)).reshape(-1, 1)
+
+
+def test_batches_up_to_max_batch_and_pads_to_buckets():
+    model = FakeModel()
+    batcher = MicroBatcher(model, max_batch=4, max_latency=0.5, log=None)
+    futures = [batcher.submit("a" * i, "b" * i) for i in range(11)]
+
+    assert [future.result(timeout=5) for future in futures] == list(range(11))
+    assert [len(first) for first, _ in model.batches] == [4, 4, 4]
+    assert batcher.stats["batches"] == 3 and batcher.stats["pairs"] == 11
+    # the last batch of 3 is padded with a row of zeros
+    first, second = model.batches[-1]
+    assert first.shape == (4, 100, 1)
+    assert not first[3].any() and not second[3].any()
+    assert first[2, :10, 0].tolist() == [ord("a") - OFFSET] * 10
+
+
+def test_bucket():
+    batcher = MicroBatcher(FakeModel(), max_batch=64, log=None)
+    assert [batcher.bucket(n) for n in (1, 2, 3, 5, 33, 64)] == [1, 2, 4, 8, 64, 64]
+
+
+def test_serve_lines_answers_in_order():
+    batcher = MicroBatcher(FakeModel(), max_batch=8, log=None)
+    requests = [{"id": i, "a": "kitten", "b": "sitting"[: i + 1]} for i in range(5)]
+    lines = [json.dumps(r) for r in requests]
+    lines.insert(2, "not json")
+    lines.insert(4, json.dumps({"id": "missing", "a": "x"}))
+    lines.append(json.dumps({"id": "s", "stats": True}))
+
+    out = io.StringIO()
+    serve_lines(batcher, io.StringIO("\n".join(lines) + "\n\n"), out)
+    answers = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert [answer["id"] for answer in answers] == [0, 1, None, 2, None, 3, 4, "s"]
+    assert [answer["distance"] for answer in answers if "distance" in answer] == [6, 5, 4, 3, 3]
+    assert answers[2]["error"].startswith("Bad request")
+    assert answers[4]["error"].startswith("Bad request")
+    # the stats are taken once every request before them is answered
+    assert answers[-1]["pairs"] == 5
+
+
+def test_predict_errors_reach_every_request():
+    batcher = MicroBatcher(FakeModel(fail=True), max_batch=8, log=None)
+    future = batcher.submit("a", "b")
+    with pytest.raises(RuntimeError, match="model exploded"):
+        future.result(timeout=5)
+
+    out = io.StringIO()
+    serve_lines(batcher, io.StringIO(json.dumps({"id": 1, "a": "a", "b": "b"}) + "\n"), out)
+    assert json.loads(out.getvalue()) == {"id": 1, "error": "model exploded"}
+
+
+def test_bad_strings_only_fail_their_own_request():
+    model = FakeModel()
+    batcher = MicroBatcher(model, max_batch=8, max_latency=0.5, log=None)
+    pairs = [("kitten", "sitting"), ("😀", "x"), ("flaw", "lawn")]
+    futures = [batcher.submit(a, b) for a, b in pairs]
+
+    assert futures[0].result(timeout=5) == 3
+    with pytest.raises(ValueError, match="can't be encoded"):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == 4
+    assert [len(first) for first, _ in model.batches] == [2]
+
+    lines = [json.dumps({"id": i, "a": a, "b": "x"}) for i, a in enumerate(["a", "😀", "b"])]
+    out = io.StringIO()
+    serve_lines(batcher, io.StringIO("\n".join(lines) + "\n"), out)
+    answers = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [answer["id"] for answer in answers] == [0, 1, 2]
+    assert "distance" in answers[0] and "distance" in answers[2]
+    assert "can't be encoded" in answers[1]["error"]
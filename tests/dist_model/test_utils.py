@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from utils import DTYPE, OFFSET, encode_strings
+
+
+def codes(s: str) -> list[int]:
+    return [ord(c) - OFFSET for c in s]
+
+
+def test_encode_strings():
+    encoded = encode_strings(["kitten", "", "zz"], max_length=8)
+    assert encoded.codes.shape == (3, 8) and encoded.codes.dtype == DTYPE
+    assert encoded.codes[0].tolist() == codes("kitten") + [0, 0]
+    assert not encoded.codes[1].any()
+    assert encoded.lengths.tolist() == [6, 0, 2]
+    assert encoded.overflow == 0
+
+
+def test_encode_strings_truncates():
+    encoded = encode_strings(["abcdef", "xyz", "0123456789"], max_length=4)
+    assert encoded.codes.tolist() == [codes("abcd"), codes("xyz") + [0], codes("0123")]
+    assert encoded.lengths.tolist() == [4, 3, 4]
+    assert encoded.truncated.tolist() == [0, 2]
+    assert encoded.overflow == 2
+
+    with pytest.raises(ValueError, match="longer than 4"):
+        encode_strings(["abcdef"], max_length=4, truncate=False)
+
+
+def test_encode_strings_reuses_out():
+    out = np.zeros((4, 6), dtype=DTYPE)
+    encode_strings(["long string", "second", "third", "fourth"], max_length=6, out=out)
+    encoded = encode_strings(["ab", "c"], max_length=6, out=out)
+
+    assert np.shares_memory(encoded.codes, out)
+    assert encoded.codes.shape == (2, 6)
+    assert encoded.codes[0].tolist() == [0, 1, 0, 0, 0, 0]
+    assert encoded.codes[1].tolist() == [2, 0, 0, 0, 0, 0]
+    # the stale rows of the batch are zeroed, the ones past it are left to the caller
+    assert out[2].any()
+
+
+def test_encode_strings_rejects_characters_out_of_range():
+    with pytest.raises(ValueError, match="can't be encoded"):
+        encode_strings(["ok", "emoji \U0001F600"], max_length=10)
+
+    # a character truncation drops doesn't have to fit
+    encoded = encode_strings(["fine \U0001F600"], max_length=5)
+    assert encoded.codes[0].tolist() == codes("fine ")
@@ -0,0 +1,27 @@
+import json
+import random
+
+from click.testing import CliRunner
+
+from pyt import bench
+from pyt.__main__ import project
+
+
+def test_mutate_is_reproducible():
+    text = bench.synthetic_text(random.Random(0), 1000)
+    assert len(text) == 1000
+    first = bench.mutate(random.Random(1), text, 10)
+    assert first != text
+    assert first == bench.mutate(random.Random(1), text, 10)
+
+
+def test_bench_command(tmp_path):
+    out = tmp_path / "results.json"
+    result = CliRunner().invoke(project, ["bench", "--quick", "--repeat", "1", "-o", str(out)])
+    assert result.exit_code == 0, result.output
+
+    results = json.loads(out.read_text())
+    assert results["config"]["repeat"] == 1
+    names = {entry["name"] for entry in results["results"]}
+    assert names == {"compute", "apply", "revert", "scan_initial", "scan_unchanged", "scan_tenth_changed"}
+    assert bench.QUICK.repeat == 3
@@ -0,0 +1,113 @@
+import io
+import random
+
+import pytest
+
+from pyt import revfile
+from pyt.blockdelta import BlockDelta, Copy, Insert
+from pyt.deltafile import decode_revision, encode_revision
+from pyt.revfile import Revision, read_content
+from pyt.scan import hash_file
+
+SHA1 = "ab" * 32
+SHA2 = "cd" * 32
+
+
+def test_compute_copies_moved_blocks():
+    rng = random.Random(1)
+    a, b = rng.randbytes(4096), rng.randbytes(4096)
+    delta = BlockDelta.compute(a + b, b + b"\x00inserted\x00" + a)
+    assert delta == [Copy(4096, 4096), Insert(b"\x00inserted\x00"), Copy(0, 4096)]
+    assert delta.apply(a + b) == b + b"\x00inserted\x00" + a
+
+
+def test_compute_roundtrip_random():
+    rng = random.Random(2)
+    for _ in range(50):
+        old = bytearray(rng.randbytes(rng.randint(0, 2000)))
+        new = bytearray(old)
+        for _ in range(rng.randint(0, 5)):
+            at = rng.randint(0, len(new))
+            new[at : at + rng.randint(0, 100)] = rng.randbytes(rng.randint(0, 100))
+        delta = BlockDelta.compute(old, new, block_size=16)
+        assert delta.apply(old) == new
+        assert BlockDelta.decode(delta.encode()) == delta
+
+
+def test_small_changes_stay_small():
+    rng = random.Random(3)
+    old = rng.randbytes(1 << 16)
+    new = old[:1000] + b"x" + old[1001:]
+    delta = BlockDelta.compute(old, new)
+    assert delta.apply(old) == new
+    assert len(delta.encode()) < 256
+
+
+def test_write_to_streams():
+    old = b"0123456789" * 20
+    delta = BlockDelta.compute(old, old[100:] + b"tail" + old[:100], block_size=8)
+    out = io.BytesIO()
+    assert delta.write_to(old, out) == 204
+    assert out.getvalue() == delta.apply(old)
+
+
+def test_apply_refuses_invert():
+    with pytest.raises(ValueError, match="forward only"):
+        BlockDelta.snapshot(b"abc").apply(b"", invert=True)
+
+
+def test_roundtrip_block_revision():
+    delta = BlockDelta.compute(b"\x00" * 200, b"\x00" * 100 + b"\x01" + b"\x00" * 100)
+    decoded = decode_revision(encode_revision(SHA2, SHA1, "a.bin", delta))
+    assert isinstance(decoded["edits"], BlockDelta)
+    assert decoded["edits"] == delta
+
+
+def test_binary_revisions(tmp_path):
+    rng = random.Random(4)
+    file = tmp_path / "data.bin"
+    contents = [rng.randbytes(10000) + b"\x00"]
+    for _ in range(3):
+        at = rng.randint(0, 9000)
+        contents.append(contents[-1][:at] + rng.randbytes(50) + contents[-1][at + 20 :])
+
+    file.write_bytes(contents[0])
+    revisions = [Revision.from_filename(file, root=tmp_path)]
+    revisions[0].save(tmp_path)
+    for content in contents[1:]:
+        file.write_bytes(content)
+        revisions.append(revisions[-1].new())
+        revisions[-1].save(tmp_path)
+    assert all(isinstance(r.edits, BlockDelta) for r in revisions)
+    assert [r.keyframe for r in revisions] == [True, False, False, False]
+    assert revisions[-1].chain_size < 1000
+
+    revfile.content_cache.clear()
+    revfile.revision_cache.clear()
+    loaded = [Revision.load(tmp_path / r.sha) for r in revisions]
+    assert [r.revert() for r in loaded] == contents
+    assert [hash_file(file)] == [revisions[-1].sha]
+
+
+def test_switching_between_text_and_binary(tmp_path):
+    file = tmp_path / "file"
+    file.write_text("text\n")
+    revision = Revision.from_filename(file, root=tmp_path)
+    revision.save(tmp_path)
+
+    file.write_bytes(b"now\x00binary")
+    binary = revision.new()
+    binary.save(tmp_path)
+    assert binary.keyframe and isinstance(binary.edits, BlockDelta)
+
+    file.write_text("text again\n")
+    text = binary.new()
+    assert text.keyframe and text.revert() == "text again\n"
+
+
+def test_large_files_are_read_as_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(revfile, "BLOCK_DELTA_THRESHOLD", 10)
+    file = tmp_path / "large.txt"
+    file.write_text("more than ten characters\n")
+    assert read_content(file) == b"more than ten characters\n"
+    assert hash_file(file) == Revision.from_filename(file, root=tmp_path).sha
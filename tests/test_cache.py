@@ -0,0 +1,80 @@
+from pyt.cache import LRUCache
+from pyt.revfile import Revision, cache_stats, content_cache
+
+
+def test_get_put():
+    cache = LRUCache(max_size=100, sizeof=len)
+    cache.put("a", "abc")
+    assert cache.get("a") == "abc"
+    assert cache.get("b") is None
+    assert cache.stats == {
+        "entries": 1,
+        "size": 3,
+        "max_size": 100,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 0,
+    }
+
+
+def test_evicts_least_recently_used_by_size():
+    cache = LRUCache(max_size=10, sizeof=len)
+    cache.put("a", "1234")
+    cache.put("b", "1234")
+    cache.get("a")
+    cache.put("c", "1234")
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.size == 8
+    assert cache.evictions == 1
+
+
+def test_too_large_values_are_not_cached():
+    cache = LRUCache(max_size=3, sizeof=len)
+    cache.put("a", "abc")
+    cache.put("b", "abcd")
+    assert "b" not in cache
+    assert "a" in cache
+
+
+def test_put_replaces_existing():
+    cache = LRUCache(max_size=10, sizeof=len)
+    cache.put("a", "1234")
+    cache.put("a", "12")
+    assert cache.size == 2
+    assert len(cache) == 1
+
+
+def test_new_reuses_parent_content(tmp_path):
+    file = tmp_path / "test.txt"
+    file.write_text("Hello")
+    revision = Revision.from_filename(file, root=tmp_path)
+    revision.save(tmp_path)
+
+    for i in range(5):
+        file.write_text("Hello" + "!" * (i + 1))
+        revision = revision.new()
+        revision.save(tmp_path)
+
+    stats = cache_stats()
+    assert stats["content"]["misses"] == 0
+    assert stats["content"]["hits"] == 5
+    assert stats["revision"]["misses"] == 0
+
+
+def test_revert_caches_content(tmp_path):
+    file = tmp_path / "test.txt"
+    file.write_text("Hello")
+    revision = Revision.from_filename(file, root=tmp_path)
+    revision.save(tmp_path)
+    file.write_text("Hello, World!")
+    revision2 = revision.new()
+    revision2.save(tmp_path)
+    content_cache.clear()
+
+    loaded = Revision.load(tmp_path / revision2.sha)
+    assert loaded.revert() == "Hello, World!"
+    assert content_cache.get(revision2.sha) == "Hello, World!"
+    assert loaded.revert() == "Hello, World!"
+    assert content_cache.hits == 2
@@ -0,0 +1,82 @@
+import hashlib
+
+import pytest
+
+from pyt import compression
+from pyt.compression import CompressionError, Dictionary
+from pyt.objectstore import ObjectStore
+
+CODECS = compression.available_codecs()
+TEXT = b"".join(b"def function_%d(x):\n    return x + %d\n" % (i, i) for i in range(200))
+
+
+def sha_of(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_roundtrip(codec):
+    stored = compression.compress(TEXT, codec)
+    assert compression.codec_of(stored) == codec
+    assert compression.header_of(stored)[1] == len(TEXT)
+    assert compression.decompress(stored) == TEXT
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_incompressible_and_framelike_data(codec):
+    assert compression.compress(b"tiny", codec) == b"tiny"
+    looks_framed = compression.MAGIC + b"\x01"
+    stored = compression.compress(looks_framed, codec)
+    assert stored != looks_framed
+    assert compression.decompress(stored) == looks_framed
+
+
+@pytest.mark.parametrize("codec", [c for c in CODECS if c != "none"])
+def test_dictionary(codec):
+    samples = [b"header line shared by all\n" + TEXT[i * 40 : i * 40 + 60] for i in range(100)]
+    dictionary = Dictionary(compression.train_dictionary(samples, codec))
+    sample = samples[7]
+    with_dictionary = compression.compress(sample, codec, dictionary)
+    assert len(with_dictionary) < len(compression.compress(sample, codec))
+    assert compression.decompress(with_dictionary, {dictionary.id: dictionary}.__getitem__) == sample
+    with pytest.raises(CompressionError):
+        compression.decompress(with_dictionary)
+
+
+def test_corrupt_object():
+    stored = bytearray(compression.compress(TEXT, "zlib"))
+    stored[-10:] = bytes(10)
+    with pytest.raises(CompressionError):
+        compression.decompress(bytes(stored))
+
+
+def test_store_mixes_codecs(tmp_path):
+    store = ObjectStore(tmp_path)
+    objects = {}
+    for codec in CODECS:
+        store.configure_compression(codec)
+        data = TEXT + codec.encode()
+        objects[sha_of(data)] = data
+        store.put(sha_of(data), data)
+
+    store.configure_compression("zlib", dictionary=store.train_dictionary())
+    data = TEXT + b"dictionary"
+    objects[sha_of(data)] = data
+    store.put(sha_of(data), data)
+
+    reopened = ObjectStore(tmp_path)
+    assert reopened.codec == "zlib" and reopened.dictionary is not None
+    for sha, data in objects.items():
+        assert reopened.get(sha) == data
+
+    stats = reopened.stats()
+    assert stats["objects"] == len(objects)
+    assert stats["size"] == sum(map(len, objects.values()))
+    assert stats["codecs"]["zlib"]["objects"] == 2
+    assert stats["codecs"]["zlib"]["stored_size"] < stats["codecs"]["zlib"]["size"]
+
+    reopened.configure_compression("none")
+    reopened.repack(recompress=True)
+    assert set(reopened.stats()["codecs"]) == {"none"}
+    for sha, data in objects.items():
+        assert reopened.get(sha) == data
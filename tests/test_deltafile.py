@@ -0,0 +1,340 @@
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from pyt.deltafile import (
+    _HEADER_V1,
+    MAGIC,
+    DeltaFormatError,
+    RUN,
+    decode_edits,
+    decode_revision,
+    encode_edits,
+    encode_revision,
+    is_delta,
+    migrate,
+)
+from pyt.editslist import Edit, EditsList
+from pyt.objectstore import ObjectStore
+from pyt import revfile
+from pyt.revfile import KeyframePolicy, Revision, repack_keyframes
+
+SHA1 = "ab" * 32
+SHA2 = "cd" * 32
+
+
+def test_roundtrip_edits():
+    edits_list = EditsList.from_strings("kitten", "sitting")
+    decoded, end = decode_edits(encode_edits(edits_list))
+    assert decoded == edits_list
+    assert end == len(encode_edits(edits_list))
+
+
+def test_roundtrip_empty_edits():
+    assert EditsList.decode(EditsList([]).encode()) == EditsList([])
+
+
+def test_roundtrip_unicode_and_replace():
+    edits_list = EditsList(
+        [
+            Edit(op="replace", index=0, old="héllo\n", new="wörld ☃\n"),
+            Edit(op="substitute", index=3, old="n", new=""),
+        ]
+    )
+    assert EditsList.decode(edits_list.encode()) == edits_list
+
+
+def test_runs_are_coalesced():
+    edits_list = EditsList.from_strings("", "kitten")
+    encoded = encode_edits(edits_list)
+    # a single insert record, with the run bit set on its op code
+    assert encoded[24] == RUN
+    assert len(encoded) < len(edits_list.pickle())
+    assert EditsList.decode(encoded) == edits_list
+
+
+def test_coalesced_runs_roundtrip_random():
+    rng = random.Random(5)
+    for _ in range(100):
+        s1 = "".join(rng.choice("ab") for _ in range(rng.randint(0, 30)))
+        s2 = "".join(rng.choice("ab") for _ in range(rng.randint(0, 30)))
+        edits_list = EditsList.compute(s1, s2)
+        assert EditsList.decode(edits_list.encode()) == edits_list
+
+
+def test_roundtrip_revision():
+    edits_list = EditsList.from_strings("kitten", "sitting")
+    encoded = encode_revision(SHA2, SHA1, Path("a/b.txt"), edits_list)
+    assert is_delta(encoded)
+    assert decode_revision(memoryview(encoded)) == {
+        "sha": SHA2,
+        "previous_sha": SHA1,
+        "edits": edits_list,
+        "path": Path("a/b.txt"),
+        "keyframe": False,
+        "chain_length": 0,
+        "chain_size": 0,
+    }
+
+
+def test_roundtrip_root_revision():
+    encoded = encode_revision(SHA1, None, Path("b.txt"), EditsList())
+    assert decode_revision(encoded)["previous_sha"] is None
+
+
+def test_roundtrip_keyframe():
+    encoded = encode_revision(
+        SHA2, SHA1, Path("b.txt"), EditsList.snapshot("abc"), keyframe=True
+    )
+    decoded = decode_revision(encoded)
+    assert decoded["keyframe"]
+    assert decoded["edits"].apply("") == "abc"
+
+
+def test_decode_version_1():
+    edits_list = EditsList.from_strings("kitten", "sitting")
+    path = b"b.txt"
+    head = _HEADER_V1.pack(MAGIC, 1, 0, bytes.fromhex(SHA1), bytes(32), len(path)) + path
+    encoded = head + bytes(-len(head) % 8) + encode_edits(edits_list)
+    decoded = decode_revision(encoded)
+    assert decoded["edits"] == edits_list
+    assert decoded["keyframe"]
+    assert decoded["chain_length"] == 0
+
+
+def test_decode_rejects_garbage():
+    with pytest.raises(DeltaFormatError):
+        decode_revision(b'{"sha": "abc"}')
+
+
+def test_decode_rejects_truncated():
+    encoded = encode_revision(SHA1, None, Path("b.txt"), EditsList.from_strings("abc"))
+    with pytest.raises(DeltaFormatError):
+        decode_revision(encoded[:-16])
+
+
+def test_migrate_legacy_json(tmp_path):
+    edits_list = EditsList.from_strings("kitten")
+    legacy = {
+        "sha": SHA1,
+        "edits": edits_list.pickle(),
+        "previous_sha": None,
+        "path": "test.txt",
+    }
+    (tmp_path / SHA1).write_text(json.dumps(legacy))
+    (tmp_path / "manifest.json").write_text("{}")
+
+    assert migrate(tmp_path) == [tmp_path / SHA1]
+    assert is_delta((tmp_path / SHA1).read_bytes())
+    assert Revision.load(tmp_path / SHA1).edits == edits_list
+    assert (tmp_path / "manifest.json").read_text() == "{}"
+
+
+def test_unpickle_refuses_other_classes():
+    payload = str(b"\x80\x04\x95\x0f\x00\x00\x00\x00\x00\x00\x00\x8c\x02os\x8c\x06system\x93.")
+    with pytest.raises(Exception):
+        EditsList.unpickle(payload)
+
+
+def test_revision_save_load(tmp_path):
+    file = tmp_path / "test.txt"
+    file.write_text("Hello, World!")
+    revision = Revision.from_filename(file, root=tmp_path)
+    revision.save(tmp_path)
+
+    file.write_text("Hello, World! This is a test")
+    revision2 = revision.new()
+    revision2.save(tmp_path)
+
+    loaded = Revision.load(tmp_path / revision2.sha)
+    assert loaded == revision2
+    assert loaded.revert() == "Hello, World! This is a test"
+
+
+def test_roundtrip_bytes_edits():
+    edits_list = EditsList.from_strings(b"\x00kitten\xff", b"sitting\x00")
+    decoded = EditsList.decode(edits_list.encode())
+    assert decoded == edits_list
+    assert decoded.apply(b"\x00kitten\xff") == b"sitting\x00"
+
+
+def test_revert_stops_at_keyframe(tmp_path):
+    policy = KeyframePolicy(interval=3)
+    file = tmp_path / "test.txt"
+    file.write_text("0")
+    revisions = [Revision.from_filename(file, root=tmp_path)]
+    revisions[0].save(tmp_path)
+    for i in range(1, 8):
+        file.write_text(" ".join(str(k) for k in range(i + 1)))
+        revisions.append(revisions[-1].new(policy=policy))
+        revisions[-1].save(tmp_path)
+
+    assert [r.keyframe for r in revisions] == [True, False, False] * 2 + [True, False]
+    assert [r.chain_length for r in revisions] == [0, 1, 2] * 2 + [0, 1]
+
+    # the chain is cut at the keyframe, older revisions are no longer needed
+    sha = revisions[0].sha
+    (tmp_path / "objects" / sha[:2] / sha[2:]).unlink()
+    loaded = Revision.load(tmp_path / revisions[-1].sha)
+    assert loaded.revert() == "0 1 2 3 4 5 6 7"
+
+
+def test_revert_refuses_cyclic_chains(tmp_path):
+    store = ObjectStore.open(tmp_path)
+    a, b = "a" * 64, "b" * 64
+    for sha, previous in ((a, b), (b, a)):
+        edits = EditsList.from_strings("x", sha[0])
+        revision = Revision(sha, previous, edits, Path("test.txt"), chain_length=1)
+        store.put(sha, revision.encode())
+
+    with pytest.raises(ValueError, match="loops back"):
+        Revision.load(tmp_path / a).revert()
+
+
+def test_returning_to_earlier_content_keeps_history(tmp_path):
+    file = tmp_path / "test.txt"
+    contents = ["Hello", "Hello, World", "Hello, World!", "Hello, World", "Hello"]
+    file.write_text(contents[0])
+    revisions = [Revision.from_filename(file, root=tmp_path)]
+    revisions[0].save(tmp_path)
+    for content in contents[1:]:
+        file.write_text(content)
+        revisions.append(revisions[-1].new())
+        revisions[-1].save(tmp_path)
+    assert revisions[3].sha == revisions[1].sha
+
+    # the stored revision of the earlier content is kept as it was
+    assert Revision.load(tmp_path / revisions[1].sha).previous_sha == revisions[0].sha
+    script = (
+        "import sys; from pathlib import Path; from pyt.revfile import Revision; "
+        "print(repr(Revision.load(Path(sys.argv[1]) / sys.argv[2]).revert()))"
+    )
+    for revision, content in zip(revisions, contents):
+        result = subprocess.run(
+            [sys.executable, "-c", script, str(tmp_path), revision.sha],
+            capture_output=True,
+            text=True,
+            timeout=30,
+            check=True,
+        )
+        assert result.stdout.strip() == repr(content)
+
+
+def test_repack_keyframes(tmp_path):
+    file = tmp_path / "test.txt"
+    contents = ["".join(f"line {k}\n" for k in range(i + 1)) for i in range(10)]
+    file.write_text(contents[0])
+    revisions = [Revision.from_filename(file, root=tmp_path)]
+    revisions[0].save(tmp_path)
+    for content in contents[1:]:
+        file.write_text(content)
+        revisions.append(revisions[-1].new())
+        revisions[-1].save(tmp_path)
+    assert [r.keyframe for r in revisions] == [True] + [False] * 9
+
+    rewritten = repack_keyframes(tmp_path, KeyframePolicy(interval=4))
+    # the first chain_length < 4 revisions are untouched
+    assert len(rewritten) == 6
+    loaded = [Revision.load(tmp_path / r.sha) for r in revisions]
+    assert [r.keyframe for r in loaded] == [True, False, False, False] * 2 + [True, False]
+    assert [r.revert() for r in loaded] == contents
+
+    # going back to long chains turns the snapshots back into deltas
+    repack_keyframes(tmp_path, KeyframePolicy(interval=100))
+    loaded = [Revision.load(tmp_path / r.sha) for r in revisions]
+    assert [r.keyframe for r in loaded] == [True] + [False] * 9
+    assert [r.revert() for r in loaded] == contents
+    assert repack_keyframes(tmp_path, KeyframePolicy(interval=100)) == []
+
+
+def test_rewritten_file_falls_back_to_snapshot(tmp_path):
+    file = tmp_path / "test.txt"
+    file.write_text("".join(f"line {i}\n" for i in range(100)))
+    revision = Revision.from_filename(file, root=tmp_path)
+    revision.save(tmp_path)
+
+    file.write_text("one line left\n")
+    rewritten = revision.new()
+    assert rewritten.keyframe
+    assert rewritten.chain_length == 0
+    assert rewritten.revert() == "one line left\n"
+    rewritten.save(tmp_path)
+
+    file.write_text("one line left\nand another\n")
+    assert not rewritten.new().keyframe
+
+
+def test_rewrite_at_same_length_gives_up_early():
+    rng = random.Random(5)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    original, actual = (
+        "".join(" ".join(rng.choice(words) for _ in range(8)) + "\n" for _ in range(400))
+        for _ in range(2)
+    )
+
+    started = time.perf_counter()
+    assert revfile.compute_delta(original, actual, bounded=True) is None
+    assert time.perf_counter() - started < 1
+
+    edited = "".join(line[:-1] + "!\n" for line in original.splitlines(keepends=True))
+    delta = revfile.compute_delta(original, edited, bounded=True)
+    assert delta.apply(original) == edited
+    assert len(delta.encode()) < len(edited) // 3
+
+
+def _chain(tmp_path, name, length):
+    file = tmp_path / name
+    contents = ["".join(f"{name} {k}\n" for k in range(i + 1)) for i in range(length)]
+    file.write_text(contents[0])
+    revisions = [Revision.from_filename(file, root=tmp_path)]
+    revisions[0].save(tmp_path)
+    for content in contents[1:]:
+        file.write_text(content)
+        revisions.append(revisions[-1].new())
+        revisions[-1].save(tmp_path)
+    return revisions, contents
+
+
+def slow_reads(monkeypatch):
+    """Forget everything cached, and make every read as slow as on a network filesystem"""
+    revfile.content_cache.clear()
+    revfile.revision_cache.clear()
+    read = Revision._read
+    monkeypatch.setattr(Revision, "_read", staticmethod(lambda file: time.sleep(0.002) or read(file)))
+
+
+def test_revert_prefetches_slow_chains(tmp_path, monkeypatch):
+    revisions, contents = _chain(tmp_path, "a.txt", 12)
+    threads = []
+    decode = Revision._decode.__func__
+
+    def record_decode(cls, file, payload):
+        threads.append(threading.current_thread().name)
+        return decode(cls, file, payload)
+
+    monkeypatch.setattr(Revision, "_decode", classmethod(record_decode))
+    slow_reads(monkeypatch)
+    last = Revision.load(tmp_path / revisions[-1].sha)
+    assert last.revert() == contents[-1]
+    # the last revision is loaded above, its 11 ancestors on the prefetch pool
+    assert len(threads) == 12
+    assert all(name.startswith("pyt-prefetch") for name in threads[1:])
+    assert Revision.load(tmp_path / revisions[5].sha).revert() == contents[5]
+
+
+def test_arevert_many(tmp_path, monkeypatch):
+    chains = [_chain(tmp_path, f"{i}.txt", 6) for i in range(8)]
+    slow_reads(monkeypatch)
+    lasts = [Revision.load(tmp_path / revisions[-1].sha) for revisions, _ in chains]
+
+    async def revert_all():
+        return await asyncio.gather(*(last.arevert() for last in lasts))
+
+    assert asyncio.run(revert_all()) == [contents[-1] for _, contents in chains]
@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from pyt import distance as distance_module
+from pyt.distance import batch_distance, distance
+from pyt.editslist import EditsList
+
+
+def random_pairs(seed, n, max_len, alphabet="abc"):
+    rng = random.Random(seed)
+    return [
+        tuple(
+            "".join(rng.choice(alphabet) for _ in range(rng.randint(0, max_len)))
+            for _ in range(2)
+        )
+        for _ in range(n)
+    ]
+
+
+def test_distance_matches_compute():
+    for a, b in random_pairs(1, 500, 40):
+        assert distance(a, b) == EditsList.compute(a, b, exact=True).distance
+
+
+def test_distance_of_long_strings():
+    # wider than a machine word, the bit vector is one big int
+    for a, b in random_pairs(2, 20, 300):
+        assert EditsList.distance_of(a, b) == EditsList.compute(a, b, exact=True).distance
+
+
+def test_distance_of_bytes_and_lists():
+    assert distance(b"kitten", b"sitting") == 3
+    assert distance(["a", "b", "c"], ["a", "c"]) == 1
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_batch_distance(monkeypatch, numpy):
+    if numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(distance_module, "np", None)
+
+    # straddles the 64 character word of the vectorized kernel
+    pairs = random_pairs(3, 300, 100)
+    expected = [EditsList.compute(a, b, exact=True).distance for a, b in pairs]
+    assert batch_distance(pairs, batch_size=64) == expected
+    assert batch_distance([(a.encode(), b.encode()) for a, b in pairs]) == expected
+    assert EditsList.batch_distance(pairs) == expected
+    assert batch_distance([]) == []
@@ -1,9 +1,12 @@
 import pytest
 import doctest
+import random
+import time
 import pyt.deltafile
 
 
 from pyt.editslist import Edit, EditsList
+from pyt.myers import diff_hunks
 
 
 def test_apply_edits():
@@ -219,9 +222,7 @@ def test_from_strings_delete_multiple_times():
     assert edits_list == EditsList(
         [
             Edit(op="delete", old="t", index=2),
-            Edit(
-                op="delete", old="t", index=3
-            ),  # BUG: should this be 2? Depends if the edit list expects "realtime" edits.
+            Edit(op="delete", old="t", index=2),  # indexes are "realtime", as apply expects
         ]
     )
 
@@ -263,3 +264,158 @@ def test_from_strings_insert_and_delete():
             Edit(op="insert", new="a", index=4),
         ]
     )
+
+
+def test_from_strings_delete_multiple_times_replays():
+    edits_list = EditsList.from_strings("kitten", "kien")
+    assert edits_list.apply("kitten") == "kien"
+
+
+@pytest.mark.parametrize("exact", [True, False])
+def test_compute_replays_random_strings(exact):
+    rng = random.Random(124)
+    for _ in range(200):
+        s1 = "".join(rng.choice("abc") for _ in range(rng.randint(0, 20)))
+        s2 = "".join(rng.choice("abc") for _ in range(rng.randint(0, 20)))
+        edits_list = EditsList.compute(s1, s2, exact=exact)
+        assert edits_list.apply(s1) == s2
+        assert edits_list.apply(s2, invert=True) == s1
+
+
+def test_compute_myers_kitten():
+    assert EditsList.compute("kitten", "sitting", exact=False) == EditsList.from_strings(
+        "kitten", "sitting", exact=True
+    )
+
+
+def test_compute_large_strings_use_linear_space_engine():
+    rng = random.Random(7)
+    s1 = "".join(rng.choice("abcdefgh \n") for _ in range(20_000))
+    s2 = list(s1)
+    for _ in range(25):
+        s2.insert(rng.randrange(len(s2)), "Z")
+    s2 = "".join(s2)
+
+    edits_list = EditsList.compute(s1, s2)
+    assert edits_list.distance == 25
+    assert edits_list.apply(s1) == s2
+
+
+@pytest.mark.parametrize("granularity", ["line", "token", "block"])
+def test_compute_chunked_replays(granularity):
+    rng = random.Random(3)
+    lines = [f"line {i} {'x' * rng.randint(0, 10)}\n" for i in range(200)]
+    s1 = "".join(lines)
+    lines[17] = "line 17 changed\n"
+    del lines[50:53]
+    lines.insert(120, "a brand new line\n")
+    s2 = "".join(lines)
+
+    edits_list = EditsList.from_strings(s1, s2, granularity=granularity)
+    assert all(edit.op == "replace" for edit in edits_list)
+    assert edits_list.apply(s1) == s2
+    assert edits_list.apply(s2, invert=True) == s1
+
+
+def test_compute_chunked_refines_changed_lines():
+    edits_list = EditsList.compute_chunked("a\nkitten\nb\n", "a\nsitting\nb\n")
+    assert edits_list == EditsList(
+        [
+            Edit(op="replace", index=2, old="k", new="s"),
+            Edit(op="replace", index=6, old="e", new="i"),
+            Edit(op="replace", index=8, old="", new="g"),
+        ]
+    )
+
+
+def test_compute_chunked_without_refine():
+    edits_list = EditsList.compute_chunked("a\nkitten\nb\n", "a\nsitting\nb\n", refine=False)
+    assert edits_list == EditsList(
+        [Edit(op="replace", index=2, old="kitten\n", new="sitting\n")]
+    )
+
+
+def _random_lines(rng, n):
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    return [" ".join(rng.choice(words) for _ in range(8)) + "\n" for _ in range(n)]
+
+
+def test_compute_chunked_rewrite_is_bounded():
+    rng = random.Random(4)
+    s1 = "".join(_random_lines(rng, 200))
+    s2 = "".join(_random_lines(rng, 200))
+    assert len(s1) > 8000
+
+    # every line is rewritten, refining them to characters would take minutes
+    started = time.perf_counter()
+    edits_list = EditsList.compute_chunked(s1, s2)
+    assert time.perf_counter() - started < 2
+    assert edits_list.apply(s1) == s2
+    assert EditsList.compute_chunked(s1, s2, max_size=len(s2)) is None
+
+    # lines edited in place are still refined, one by one
+    s3 = "".join(line[:-1] + "!\n" for line in s1.splitlines(keepends=True))
+    edits_list = EditsList.compute_chunked(s1, s3, max_size=len(s3))
+    assert [edit.new for edit in edits_list] == ["!"] * 200
+    assert edits_list.apply(s1) == s3
+
+
+def test_apply_bytes():
+    edits_list = EditsList.from_strings(b"kitten", b"sitting")
+    assert edits_list.apply(b"kitten") == b"sitting"
+    assert edits_list.apply(b"sitting", invert=True) == b"kitten"
+
+
+def test_apply_bytearray_returns_bytearray():
+    edits_list = EditsList.from_strings(b"kitten", b"sitting", exact=False)
+    transformed = edits_list.apply(bytearray(b"kitten"))
+    assert isinstance(transformed, bytearray)
+    assert transformed == bytearray(b"sitting")
+
+
+def test_apply_not_monotonic_falls_back():
+    edits_list = EditsList(
+        [
+            Edit(op="insert", new="g", index=6),
+            Edit(op="insert", new="s", index=0),
+        ]
+    )
+    assert not edits_list.is_monotonic()
+    assert edits_list.apply("kitten") == "skitteng"
+    assert edits_list.apply("skitteng", invert=True) == "kitten"
+
+
+@pytest.mark.parametrize("granularity", ["char", "line", "token", "block"])
+def test_apply_sweep_matches_in_place(granularity):
+    rng = random.Random(11)
+    for _ in range(50):
+        s1 = "".join(rng.choice("ab\n ") for _ in range(rng.randint(0, 40)))
+        s2 = "".join(rng.choice("ab\n ") for _ in range(rng.randint(0, 40)))
+        edits_list = EditsList.from_strings(s1, s2, granularity=granularity)
+        assert edits_list.is_monotonic()
+        assert "".join(edits_list._apply_in_place(s1, False)) == s2
+        assert "".join(edits_list._apply_in_place(s2, True)) == s1
+        assert edits_list.apply(s1) == s2
+        assert edits_list.apply(s2, invert=True) == s1
+
+
+def test_compute_banded_matches_exact():
+    rng = random.Random(12)
+    for _ in range(300):
+        s1 = "".join(rng.choice("abc") for _ in range(rng.randint(0, 25)))
+        s2 = "".join(rng.choice("abc") for _ in range(rng.randint(0, 25)))
+        exact = EditsList.compute(s1, s2, exact=True)
+        for k in range(exact.distance + 2):
+            banded = EditsList.compute(s1, s2, max_distance=k)
+            if k < exact.distance:
+                assert banded is None
+            else:
+                assert banded == exact
+
+
+def test_max_distance_gives_up_early():
+    s1, s2 = "a" * 100_000, "b" * 100_000
+    assert EditsList.compute(s1, s2, max_distance=10) is None
+    assert EditsList.from_strings(s1, s2, granularity="block", max_distance=10) is None
+    assert EditsList.from_strings(s1, s1 + "c", max_distance=1) == EditsList.from_strings(s1, s1 + "c")
+    assert diff_hunks(s1, s2, max_distance=10) is None
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from pyt import instrument
+from pyt.revfile import Revision
+from pyt.scan import scan_project
+
+
+@pytest.fixture
+def recording(monkeypatch):
+    monkeypatch.setattr(instrument, "enabled", True)
+    monkeypatch.setattr(instrument, "tracing", True)
+    instrument.reset()
+    yield
+    instrument.reset()
+
+
+def test_disabled_records_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrument, "enabled", False)
+    instrument.reset()
+    file = tmp_path / "file.txt"
+    file.write_text("hello\n")
+    Revision.from_filename(file, root=tmp_path).save(tmp_path)
+
+    assert instrument.timer("anything") is instrument.timer("else")
+    assert not instrument.timers and not instrument.counters
+    assert instrument.collect() == {}
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_scan_is_timed(tmp_path, recording, jobs):
+    (tmp_path / ".pyt").mkdir()
+    for i in range(5):
+        (tmp_path / f"{i}.txt").write_text(f"{i}\n" * 100)
+    scan_project(tmp_path, jobs=jobs)
+    (tmp_path / "0.txt").write_text("changed\n" * 100)
+    scan_project(tmp_path, jobs=jobs)
+
+    stats = instrument.summary()
+    # worker processes only send back what they recorded themselves
+    assert stats["timers"]["scan.walk"]["calls"] == 2
+    assert stats["counters"]["scan.files"] == 10
+    # the files were all just written, too recently for the stat cache to be trusted
+    assert stats["timers"]["hash"]["calls"] == stats["counters"]["scan.hashed"] == 10
+    assert stats["timers"]["delta.compute"]["calls"] == 1
+    # a pack of revisions and a pack of trees per scan
+    assert stats["timers"]["object.write"]["calls"] == 4
+    assert stats["timers"]["transaction.commit"]["calls"] == 2
+    assert stats["counters"]["transaction.revisions"] == 6
+    assert stats["counters"]["scan.changed"] == 6
+    assert len(instrument.events) == sum(t["calls"] for t in stats["timers"].values())
+
+    trace = tmp_path / "trace.json"
+    instrument.dump_trace(trace)
+    assert json.loads(trace.read_text())["traceEvents"][0]["ph"] == "X"
+
+
+def test_collect_and_merge(recording):
+    with instrument.timer("work"):
+        instrument.count("things", 3)
+    recorded = instrument.collect()
+    assert not instrument.timers
+
+    instrument.merge(recorded)
+    instrument.merge(recorded)
+    assert instrument.timers["work"][1] == 2
+    assert instrument.counters["things"] == 6
@@ -0,0 +1,173 @@
+import hashlib
+
+import pytest
+from click.testing import CliRunner
+
+from pyt.__main__ import project
+from pyt.objectstore import ObjectStore
+from pyt.revfile import Revision
+from pyt.tree import load_files
+from pyt.utilities import AmbiguousPrefixError, ShaIndex, most_matching_sha
+
+
+def sha_of(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ObjectStore.open(tmp_path)
+    yield store
+    store.close()
+
+
+def test_put_get_loose(store, tmp_path):
+    sha = sha_of(b"hello")
+    assert store.put(sha, b"hello")
+    assert not store.put(sha, b"hello")
+    assert sha in store
+    assert store.get(sha) == b"hello"
+    assert (tmp_path / "objects" / sha[:2] / sha[2:]).is_file()
+
+
+def test_get_missing(store):
+    with pytest.raises(KeyError):
+        store.get(sha_of(b"missing"))
+    assert "manifest.json" not in store
+
+
+def test_repack(store, tmp_path):
+    objects = {sha_of(b"%d" % i): b"%d" % i for i in range(300)}
+    for sha, data in objects.items():
+        store.put(sha, data)
+
+    idx_path = store.repack()
+    assert idx_path is not None
+    assert not list((tmp_path / "objects").glob("??/*"))
+    assert {p.suffix for p in (tmp_path / "packs").iterdir()} == {".idx", ".pack"}
+    assert sorted(store) == sorted(objects)
+    for sha, data in objects.items():
+        assert store.get(sha) == data
+    assert sha_of(b"missing") not in store
+    assert store.repack() is None
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_resolve_prefix(store, tmp_path, packed):
+    objects = {sha_of(b"%d" % i): b"%d" % i for i in range(300)}
+    for sha, data in objects.items():
+        store.put(sha, data)
+    if packed:
+        store.repack()
+    flat = sha_of(b"flat")
+    (tmp_path / flat).write_bytes(b"flat")
+    objects[flat] = b"flat"
+
+    index = ShaIndex(objects)
+    for sha in objects:
+        assert store.resolve(sha) == sha
+        unique = next(n for n in range(1, 65) if len(index.matches(sha[:n])) == 1)
+        assert store.resolve(sha[:unique]) == sha
+        if unique > 1:
+            with pytest.raises(AmbiguousPrefixError) as error:
+                store.resolve(sha[: unique - 1])
+            assert sha in error.value.matches
+            assert error.value.matches == index.matches(sha[: unique - 1])
+
+    assert sorted(set(store.matches("a"))) == index.matches("a")
+    for prefix in ["", "xyz", sha_of(b"missing"), sha_of(b"missing")[:20]]:
+        with pytest.raises(KeyError):
+            store.resolve(prefix)
+
+
+def test_most_matching_sha():
+    assert most_matching_sha([], "abc") is None
+    assert most_matching_sha([None], "abc") is None
+    assert most_matching_sha(["abc123", "abc456", "abd789"], "abc4") == "abc456"
+    assert most_matching_sha(["abc123", "abd789"], "abd7ff") == "abd789"
+    assert most_matching_sha(["abc123"], "xyz") is None
+    assert ShaIndex(["b", "a"]).closest("c") == ("b", 0)
+
+    # an index is built once and reused for every lookup
+    index = ShaIndex(["abc123", "abc456", "abd789", None])
+    assert most_matching_sha(index, "abc4") == "abc456"
+    assert most_matching_sha(index, "abd7ff") == "abd789"
+    assert most_matching_sha(index, "xyz") is None
+    assert most_matching_sha(ShaIndex(), "abc") is None
+
+
+def test_loose_shadows_packed(store):
+    sha = sha_of(b"v1")
+    store.put(sha, b"v1")
+    store.repack()
+    store.put(sha, b"v2", replace=True)
+    assert store.get(sha) == b"v2"
+
+    store.repack()
+    assert store.get(sha) == b"v2"
+
+
+def test_repack_all_packs(store, tmp_path):
+    first, second = sha_of(b"1"), sha_of(b"2")
+    store.put(first, b"1")
+    store.repack()
+    store.put(second, b"2")
+    store.repack()
+    assert len(store.packs) == 2
+
+    store.repack(all_packs=True)
+    assert len(store.packs) == 1
+    assert store.get(first) == b"1"
+    assert store.get(second) == b"2"
+
+
+def test_packs_written_by_another_store_are_found(tmp_path):
+    sha = sha_of(b"hello")
+    writer = ObjectStore(tmp_path)
+    reader = ObjectStore(tmp_path)
+    assert sha not in reader
+    writer.put(sha, b"hello")
+    writer.repack()
+    assert reader.get(sha) == b"hello"
+    writer.close()
+    reader.close()
+
+
+def test_flat_layout_is_read(store, tmp_path):
+    sha = sha_of(b"legacy")
+    (tmp_path / sha).write_bytes(b"legacy")
+    assert store.get(sha) == b"legacy"
+    assert list(store) == [sha]
+
+    store.repack()
+    assert not (tmp_path / sha).exists()
+    assert store.get(sha) == b"legacy"
+
+
+def test_scan_and_repack(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    assert runner.invoke(project, ["new", "proj"]).exit_code == 0
+    (tmp_path / "proj" / "a.txt").write_text("hello\n")
+    (tmp_path / "proj" / "sub").mkdir()
+    (tmp_path / "proj" / "sub" / "b.txt").write_text("world\n")
+
+    result = runner.invoke(project, ["scan", "proj"])
+    assert result.exit_code == 0, result.output
+    manifest = load_files(tmp_path / "proj" / ".pyt")
+    assert sorted(manifest) == ["a.txt", "sub/b.txt"]
+
+    (tmp_path / "proj" / "a.txt").write_text("hello, world\n")
+    assert runner.invoke(project, ["scan", "proj"]).exit_code == 0
+    assert runner.invoke(project, ["repack", "proj"]).exit_code == 0
+
+    root = tmp_path / "proj" / ".pyt"
+    manifest = load_files(root)
+    revision = Revision.load(root / manifest["a.txt"])
+    assert revision.previous_sha is not None
+    assert revision.revert() == "hello, world\n"
+    result = runner.invoke(project, ["show", manifest["a.txt"][:8], "proj"])
+    assert result.exit_code == 0, result.output
+    assert result.output == "hello, world\n"
+    assert runner.invoke(project, ["show", "0" * 64, "proj"]).exit_code != 0
+    assert Revision.load(root / revision.previous_sha).revert() == "hello\n"
@@ -0,0 +1,134 @@
+import json
+import random
+import socket
+import threading
+
+from pyt.blockdelta import BlockDelta
+from pyt.planner import DistanceServerEstimator, Planner, containment
+from pyt.revfile import KeyframePolicy, Revision
+from pyt.scan import scan_project
+
+
+def random_text(rng, lines):
+    return "".join(f"{rng.random()} {rng.random()}\n" for _ in range(lines))
+
+
+def test_containment():
+    rng = random.Random(1)
+    text = random_text(rng, 200)
+    assert containment(text, text) == 1.0
+    assert containment(text, text[:1000] + "changed" + text[1000:]) >= 0.9
+    assert containment(text, random_text(rng, 200)) == 0.0
+    assert containment("", "abc") == 0.0
+    assert containment("abc", "") == 1.0
+    assert containment(b"xxabcxx", b"abc") == 1.0
+
+
+def test_planner_strategies():
+    rng = random.Random(2)
+    old = random_text(rng, 200)
+    planner = Planner(estimator=containment)
+
+    similar = old.replace(old[500:520], "edited")
+    delta = planner.delta(old, similar, "a.txt")
+    assert delta.apply(old) == similar
+
+    half = old[: len(old) // 3] + random_text(rng, 150)
+    delta = planner.delta(old, half, "a.txt")
+    assert delta.apply(old) == half
+
+    assert planner.delta(old, random_text(rng, 200), "a.txt") is None
+    assert planner.delta(old, b"\x00binary", "a.txt") is None
+
+    assert [plan.strategy for plan in planner.plans] == ["exact", "coarse", "snapshot", "snapshot"]
+    assert planner.stats["snapshot"]["files"] == 2
+    assert all(plan.content_size > 0 for plan in planner.plans)
+
+
+def test_planner_coarse_binary():
+    rng = random.Random(3)
+    old = rng.randbytes(1 << 14)
+    new = old[:4096] + rng.randbytes(1 << 13)
+    planner = Planner(estimator=lambda a, b: 0.3)
+    delta = planner.delta(old, new, "a.bin")
+    assert isinstance(delta, BlockDelta)
+    assert delta.apply(old) == new
+
+
+def test_revision_with_planner(tmp_path):
+    file = tmp_path / "a.txt"
+    file.write_text("hello\n" * 50)
+    revision = Revision.from_filename(file, root=tmp_path)
+    revision.save(tmp_path)
+
+    planner = Planner(estimator=lambda a, b: 0.0)
+    file.write_text("hello\n" * 51)
+    rewritten = Revision.from_filename(file, revision, planner=planner)
+    assert rewritten.keyframe
+    assert rewritten.revert() == "hello\n" * 51
+    assert planner.plans[0].strategy == "snapshot"
+
+
+def test_plan_records_keyframes_the_policy_wants(tmp_path):
+    file = tmp_path / "a.txt"
+    file.write_text("hello\n" * 50)
+    revision = Revision.from_filename(file, root=tmp_path)
+    revision.save(tmp_path)
+
+    planner = Planner(estimator=lambda a, b: 1.0)
+    file.write_text("hello\n" * 51)
+    rewritten = Revision.from_filename(
+        file, revision, planner=planner, policy=KeyframePolicy(interval=1)
+    )
+    assert rewritten.keyframe
+    # the planner's exact delta was dropped for the snapshot the policy asked for
+    assert planner.plans[0].strategy == "snapshot"
+    assert planner.plans[0].delta_size == len(rewritten.edits.encode())
+
+
+def test_scan_records_plans(tmp_path):
+    project_dir = tmp_path / "proj"
+    (project_dir / ".pyt").mkdir(parents=True)
+    (project_dir / "a.txt").write_text("".join(f"line {i}\n" for i in range(100)))
+    scan_project(project_dir, jobs=1, plan=True)
+    assert not (project_dir / ".pyt" / "plans.jsonl").exists()
+
+    (project_dir / "a.txt").write_text("".join(f"line {i}\n" for i in range(101)))
+    manifest = scan_project(project_dir, jobs=1, plan=True)
+    plans = [json.loads(line) for line in (project_dir / ".pyt" / "plans.jsonl").open()]
+    assert [(plan["path"], plan["strategy"]) for plan in plans] == [("a.txt", "exact")]
+    revision = Revision.load(project_dir / ".pyt" / manifest["a.txt"])
+    assert revision.revert() == (project_dir / "a.txt").read_text()
+
+
+def test_distance_server_errors_fall_back(tmp_path):
+    path = tmp_path / "distance.sock"
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(path))
+    server.listen(1)
+    replies = [{"id": None, "distance": 1}, {"id": None, "error": "'😀' can't be encoded"}, None]
+
+    def serve():
+        connection, _ = server.accept()
+        with connection, connection.makefile("rw", encoding="utf-8") as file:
+            for reply in replies:
+                file.readline()
+                if reply is None:
+                    # hang up without answering
+                    return
+                file.write(json.dumps(reply) + "\n")
+                file.flush()
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    estimator = DistanceServerEstimator(path, fallback=lambda original, actual: 0.25)
+    try:
+        assert estimator("abcd", "abce") == 0.75
+        assert estimator("abcd", "😀bcd") == 0.25
+        assert estimator("abcd", "abcf") == 0.25
+        assert not estimator.connected
+        assert estimator("abcd", "abcd") == 0.25
+    finally:
+        thread.join()
+        estimator.close()
+        server.close()
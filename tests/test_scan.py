@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from pyt import scan
+from pyt.revfile import Revision
+from pyt.scan import scan_project
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_scan_project_jobs(tmp_path, jobs):
+    project_dir = tmp_path / "proj"
+    (project_dir / ".pyt").mkdir(parents=True)
+    for i in range(12):
+        (project_dir / f"{i:02}.txt").write_text(f"file {i}\n" * (i + 1))
+    (project_dir / "same.txt").write_text("file 0\n")
+    (project_dir / "binary.bin").write_bytes(b"\xff\xfe\x00")
+
+    manifest = scan_project(project_dir, jobs=jobs)
+    assert list(manifest) == [f"{i:02}.txt" for i in range(12)] + ["binary.bin", "same.txt"]
+    assert manifest["same.txt"] == manifest["00.txt"]
+    binary = Revision.load(project_dir / ".pyt" / manifest["binary.bin"])
+    assert binary.revert() == b"\xff\xfe\x00"
+
+    for i in range(0, 12, 3):
+        (project_dir / f"{i:02}.txt").write_text(f"changed {i}\n")
+    new_manifest = scan_project(project_dir, jobs=jobs)
+    root = project_dir / ".pyt"
+    for i in range(12):
+        p = f"{i:02}.txt"
+        revision = Revision.load(root / new_manifest[p])
+        assert revision.revert() == (project_dir / p).read_text()
+        if i % 3 == 0:
+            assert revision.previous_sha == manifest[p]
+        else:
+            assert new_manifest[p] == manifest[p]
+
+
+def test_scan_skips_hashing_unchanged_files(tmp_path, monkeypatch):
+    project_dir = tmp_path / "proj"
+    (project_dir / ".pyt").mkdir(parents=True)
+    (project_dir / "a.txt").write_text("a\n")
+    (project_dir / "b.txt").write_text("b\n")
+    # pretend the files were written long before the scan, so their entries are trusted
+    for name in ("a.txt", "b.txt"):
+        os.utime(project_dir / name, ns=(0, 10**9 * (10 + len(name))))
+    manifest = scan_project(project_dir, jobs=1)
+
+    hashed = []
+    hash_file = scan.hash_file
+    monkeypatch.setattr(
+        "pyt.scan.hash_file", lambda file: hashed.append(file.name) or hash_file(file)
+    )
+    assert scan_project(project_dir, jobs=1) == manifest
+    assert hashed == []
+
+    (project_dir / "b.txt").write_text("bb\n")
+    new_manifest = scan_project(project_dir, jobs=1)
+    assert hashed == ["b.txt"]
+    assert new_manifest["a.txt"] == manifest["a.txt"]
+    assert new_manifest["b.txt"] != manifest["b.txt"]
+
+    # b.txt was just modified, so its stat can't be trusted yet
+    assert scan_project(project_dir, jobs=1) == new_manifest
+    assert hashed == ["b.txt", "b.txt"]
+
+
+def test_hash_file_matches_revision_sha(tmp_path, monkeypatch):
+    monkeypatch.setattr("pyt.scan.HASH_CHUNK_SIZE", 7)
+    file = tmp_path / "a.txt"
+    file.write_bytes("héllo\r\nwörld\r\n".encode() * 10)
+    assert scan.hash_file(file) == Revision.from_filename(file).sha
@@ -0,0 +1,72 @@
+import pytest
+
+from pyt.objectstore import ObjectStore
+from pyt.revfile import Revision
+from pyt.scan import scan_project
+from pyt.transaction import Transaction, TransactionError
+from pyt.tree import MANIFEST, load_files, load_manifest, tree_store
+
+
+def revisions(project, n, text="line {}\n"):
+    result = []
+    for i in range(n):
+        file = project / f"sub{i % 3}" / f"{i}.txt"
+        file.parent.mkdir(exist_ok=True)
+        file.write_text(text.format(i))
+        result.append(Revision.from_content(file.read_text(), file.relative_to(project)))
+    return result
+
+
+def test_commit_writes_one_pack(tmp_path):
+    root = tmp_path / ".pyt"
+    root.mkdir()
+    staged = revisions(tmp_path, 30)
+
+    with Transaction(root) as transaction:
+        for revision in staged:
+            transaction.stage(revision)
+        # staged objects can be read back before the commit
+        assert transaction.store.get(staged[0].sha) == staged[0].encode()
+        assert not (root / MANIFEST).exists()
+
+    store = ObjectStore.open(root)
+    assert list(store.loose()) == []
+    assert len(list(store.packs_dir.glob("*.pack"))) == 1
+    assert len(list(tree_store(root).packs_dir.glob("*.pack"))) == 1
+    assert load_manifest(root) == transaction.tree
+    files = load_files(root)
+    assert files == {r.path.as_posix(): r.sha for r in staged}
+    assert Revision.load(root / files["sub1/4.txt"]).revert() == "line 4\n"
+
+    # a later commit only lists what changed on top of the manifest
+    with Transaction(root) as transaction:
+        assert transaction.remove("sub0/0.txt")
+        assert not transaction.remove("missing.txt")
+    assert set(load_files(root)) == set(files) - {"sub0/0.txt"}
+
+    with pytest.raises(TransactionError):
+        transaction.stage(staged[0])
+
+
+def test_aborted_commit_writes_nothing(tmp_path):
+    root = tmp_path / ".pyt"
+    root.mkdir()
+    (tmp_path / "a.txt").write_text("a\n")
+    scan_project(tmp_path, jobs=1)
+    before = load_manifest(root)
+    store = ObjectStore.open(root)
+    objects = set(store)
+    packs = set(store.packs_dir.iterdir())
+
+    with pytest.raises(RuntimeError):
+        with Transaction(root) as transaction:
+            for revision in revisions(tmp_path, 5):
+                transaction.stage(revision)
+            raise RuntimeError("crashed mid commit")
+
+    assert load_manifest(root) == before
+    assert set(store) == objects
+    assert set(store.packs_dir.iterdir()) == packs
+    # the store is usable again, outside of any batch
+    assert store.put("0" * 64, b"data")
+    assert any(sha == "0" * 64 for sha, _ in store.loose())
@@ -0,0 +1,93 @@
+import json
+
+from pyt.objectstore import ObjectStore
+from pyt.scan import scan_project
+from pyt.tree import (
+    LEGACY_MANIFEST,
+    MANIFEST,
+    diff_trees,
+    iter_files,
+    load_files,
+    lookup,
+    read_tree,
+    tree_store,
+    write_tree,
+)
+
+SHA = "{:064x}".format
+
+
+def test_write_and_read_tree(tmp_path):
+    store = ObjectStore(tmp_path)
+    files = {"a.txt": SHA(1), "sub/b.txt": SHA(2), "sub/deeper/c.txt": SHA(3)}
+    root = write_tree(store, files)
+
+    assert dict(iter_files(store, root)) == files
+    assert lookup(store, root, "sub/deeper/c.txt") == SHA(3)
+    assert lookup(store, root, "sub") is None
+    assert lookup(store, root, "missing/c.txt") is None
+    assert read_tree(store, root)["sub"][0] == "tree"
+    assert write_tree(store, dict(reversed(files.items()))) == root
+
+
+def test_diff_trees_only_reads_changed_subtrees(tmp_path):
+    store = ObjectStore(tmp_path)
+    files = {f"big/{i}.txt": SHA(i) for i in range(100)}
+    files.update({"a.txt": SHA(1000), "moved": SHA(1001)})
+    old = write_tree(store, files)
+
+    changed = dict(files)
+    changed["a.txt"] = SHA(2000)
+    del changed["moved"]
+    changed["moved/inside.txt"] = SHA(2001)
+    changed["new.txt"] = SHA(2002)
+    new = write_tree(store, changed)
+
+    read = []
+    get = store.get
+    store.get = lambda sha: read.append(sha) or get(sha)
+    assert list(diff_trees(store, old, new)) == [
+        ("a.txt", SHA(1000), SHA(2000)),
+        ("moved", SHA(1001), None),
+        ("moved/inside.txt", None, SHA(2001)),
+        ("new.txt", None, SHA(2002)),
+    ]
+    # the unchanged big folder is never read
+    assert read_tree(store, old)["big"][1] not in read
+    assert list(diff_trees(store, old, old)) == []
+    assert len(list(diff_trees(store, None, old))) == len(files)
+
+
+def test_scan_writes_only_changed_trees(tmp_path):
+    project_dir = tmp_path / "proj"
+    root = project_dir / ".pyt"
+    root.mkdir(parents=True)
+    for folder in "xyz":
+        (project_dir / folder).mkdir()
+        (project_dir / folder / "file.txt").write_text(f"{folder}\n")
+    scan_project(project_dir, jobs=1)
+    trees = tree_store(root)
+    before = set(trees)
+
+    (project_dir / "x" / "file.txt").write_text("changed\n")
+    manifest = scan_project(project_dir, jobs=1)
+    # the x folder and the root
+    assert len(set(trees) - before) == 2
+    assert load_files(root) == manifest
+
+
+def test_legacy_manifest_is_migrated(tmp_path):
+    project_dir = tmp_path / "proj"
+    root = project_dir / ".pyt"
+    root.mkdir(parents=True)
+    (project_dir / "a.txt").write_text("a\n")
+    manifest = scan_project(project_dir, jobs=1)
+
+    (root / MANIFEST).unlink()
+    (root / LEGACY_MANIFEST).write_text(json.dumps(manifest))
+    assert load_files(root) == manifest
+
+    (project_dir / "a.txt").write_text("a\nb\n")
+    new_manifest = scan_project(project_dir, jobs=1)
+    assert not (root / LEGACY_MANIFEST).exists()
+    assert load_files(root) == new_manifest
@@ -0,0 +1,91 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from pyt.revfile import Revision
+from pyt.scan import scan_project
+from pyt.tree import load_files
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+
+from pyt.watch import Watcher  # noqa: E402
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / ".pyt").mkdir()
+    (tmp_path / "a.txt").write_text("one\n")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "b.txt").write_text("two\n")
+    return tmp_path
+
+
+@pytest.fixture
+def watcher(project):
+    watcher = Watcher(project, debounce=0.05, max_delay=0.5)
+    watcher.start()
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(stop,), kwargs={"poll": 0.05})
+    thread.start()
+    yield watcher
+    stop.set()
+    thread.join()
+    watcher.close()
+
+
+def test_watch_records_changed_files(project, watcher):
+    root = project / ".pyt"
+    assert set(load_files(root)) == {"a.txt", "sub/b.txt"}
+    before = load_files(root)
+
+    for i in range(5):
+        (project / "a.txt").write_text(f"one\n{i}\n")
+    (project / "sub" / "new").mkdir()
+    (project / "sub" / "new" / "c.txt").write_text("three\n")
+    (project / "sub" / "b.txt").unlink()
+
+    assert wait_for(lambda: set(load_files(root)) == {"a.txt", "sub/new/c.txt"})
+    assert wait_for(lambda: Revision.load(root / load_files(root)["a.txt"]).revert() == "one\n4\n")
+    files = load_files(root)
+    revision = Revision.load(root / files["a.txt"])
+    # the burst of writes was debounced into a single revision
+    assert revision.previous_sha == before["a.txt"]
+    assert Revision.load(root / files["sub/new/c.txt"]).revert() == "three\n"
+
+
+def test_flush_diffs_against_latest_content(project, monkeypatch):
+    watcher = Watcher(project)
+    try:
+        watcher.start()
+        for i in range(3):
+            (project / "a.txt").write_text(f"one\n{i}\n")
+            watcher.pending.add("a.txt")
+            assert watcher.flush() == ["a.txt"]
+
+        # nothing changed, nothing is recorded
+        watcher.pending.add("a.txt")
+        assert watcher.flush() == []
+
+        monkeypatch.setattr(Revision, "revert", lambda *_: pytest.fail("replayed the chain"))
+        (project / "a.txt").write_text("one\n3\n")
+        watcher.pending.add("a.txt")
+        assert watcher.flush() == ["a.txt"]
+    finally:
+        watcher.close()
+
+    monkeypatch.undo()
+    files = load_files(project / ".pyt")
+    assert Revision.load(project / ".pyt" / files["a.txt"]).revert() == "one\n3\n"
+    # a scan afterwards agrees with what the watcher recorded
+    assert scan_project(project, jobs=1) == files